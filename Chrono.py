@@ -34,19 +34,15 @@
 
 import argparse
 import os
-import pickle
 import inspect
+import multiprocessing
+import contextlib
+import sys
 
-from chronoML import DecisionTree as DTree
-from chronoML import RF_classifier as RandomForest
-from chronoML import NB_nltk_classifier as NBclass, ChronoKeras
-from chronoML import SVM_classifier as SVMclass
-from Chrono import BuildEntities
-from Chrono import referenceToken
-from Chrono import utils
-from transformers import BertModel, BertTokenizer
-from tensorflow.keras.models import load_model
-from joblib import load
+from Chrono import pipeline
+from Chrono import manifest
+from Chrono import inference_broker
+from Chrono import token_memo
 
 debug=False
 
@@ -73,7 +69,7 @@ if __name__ == "__main__":
     parser.add_argument('-c', metavar='MLTrainClass', type=str, help='A string representing the file name that contains the known classes for the training data matrix.', required=False, default=False)
     parser.add_argument('-M', metavar='MLmodel', type=str, help='The path and file name of a pre-build ML model for loading.', required=False, default=None)
     parser.add_argument('-b', metavar='BERTmodel', type=str,
-                        help='The path and file name of a pre-built BERT model for loading.', required=False,
+                        help='The path and file name of a pre-built BERT model for loading. If not given, BERT is not loaded and all period and interval phrases are normalized as durations.', required=False,
                         default=None)
     parser.add_argument('-B', metavar='BERTClassificationModel', type=str,
                         help='The path and file name of a pre-trained SVM or CNN classification model from ChronoBERT.', required=False,
@@ -83,9 +79,41 @@ if __name__ == "__main__":
     parser.add_argument('--includeContext', action="store_true", default=False)
     parser.add_argument('--includeAttention', action="store_true", default=False)
     parser.add_argument('--cnn', action="store_true", default=False)
+    parser.add_argument('--bert-idle-timeout', metavar='seconds', type=float, help='Unload the BERT models after they have not been used for this many seconds. They are re-loaded when next needed. Default is to keep them loaded.', required=False, default=None)
+    parser.add_argument('--pos-tagging', type=str, choices=["full", "gated"], help='How tokens are part of speech tagged. "full" (default) tags the whole document. "gated" only tags the sentences that have a temporal or numeric candidate, and only when their tags are needed, which is faster for documents with little temporal content but can change which tokens are marked as numbers.', required=False, default="full")
+    parser.add_argument('--token-memo-size', metavar='N', type=int, help='Remember whether up to this many distinct tokens are numeric or temporal, across all documents parsed, so each is only tested once. Default is 100000; 0 disables the memo.', required=False, default=100000)
+    parser.add_argument('--token-memo-vocab', metavar='vocabFile', type=str, help='Warm the token memo from this vocabulary file if it exists, and save the tokens seen to it when the run finishes.', required=False, default=None)
+    parser.add_argument('--dictionary-snapshot', metavar='snapshotFile', type=str, help='Load the dictionary files from this snapshot if it is up to date with them, otherwise read the dictionary files and save a new snapshot to it.  Speeds up the start of short-lived worker processes.', required=False, default=None)
+    parser.add_argument('--bert-padding', type=str, choices=["max", "dynamic"], help='How sentences are padded for BERT. "max" (default) pads every sentence to 256 tokens, as the ChronoBERT classifiers were run. "dynamic" pads only to the longest sentence in each length-bucketed batch and masks the padding out, which is much faster for short sentences.', required=False, default="max")
+    parser.add_argument('--bert-cache-mb', metavar='MB', type=float, help='Cache the BERT outputs of up to this many megabytes of sentences in memory so repeated sentences are only encoded once. Default is 0 (no cache).', required=False, default=0)
+    parser.add_argument('--bert-cache-dir', metavar='cacheDir', type=str, help='Persist the BERT sentence cache to this directory so later runs over the same corpus skip the encoder.', required=False, default=None)
+    parser.add_argument('--bert-quantize', action="store_true", help='Dynamically quantize the linear layers of the BERT model to int8 when it is loaded. This is faster on CPUs but can change some DATE/DURATION predictions; use --bert-quantize-check to measure how many.', default=False)
+    parser.add_argument('--bert-quantize-cache', metavar='quantizedModelFile', type=str, help='Save the quantized BERT model to this file and load it from there on later runs. It is rebuilt if the BERT model changes.', required=False, default=None)
+    parser.add_argument('--bert-onnx', metavar='onnxFile', type=str, help='Run the BERT model exported to this ONNX graph by ChronoBertExport.py on ONNX Runtime instead of torch. The tokenizer is still loaded from -b.', required=False, default=None)
+    parser.add_argument('--onnx-threads', metavar='N', type=int, help='The number of threads ONNX Runtime uses within each operator. Default is 0 (let ONNX Runtime decide).', required=False, default=0)
+    parser.add_argument('--onnx-inter-threads', metavar='N', type=int, help='The number of threads ONNX Runtime uses to run independent operators in parallel. Default is 0 (let ONNX Runtime decide).', required=False, default=0)
+    parser.add_argument('--onnx-optimization', type=str, choices=["disable", "basic", "extended", "all"], help='The ONNX Runtime graph optimization level. Default is all.', required=False, default="all")
+    parser.add_argument('--bert-quantize-check', metavar='sampleJSONL', type=str, help='Parse the {"id", "text", "dct"} records in this JSONL sample with both the fp32 and the int8 quantized BERT model, report how often their DATE/DURATION types agree and how long each took, then exit.', required=False, default=None)
+    parser.add_argument('--jsonl', metavar='JSONLinput', type=str, help='Stream documents from a JSONL file (or - for stdin) with one {"id", "text", "dct"} record per line instead of reading an input directory.', required=False, default=None)
+    parser.add_argument('--jsonl-out', metavar='JSONLoutput', type=str, help='The JSONL file (or - for stdout, default) to write one record of TIMEX3 and SCATE entities per input record to when using --jsonl.', required=False, default="-")
+    parser.add_argument('--manifest', metavar='manifestFile', type=str, help='A JSONL file recording each completed document. Documents already completed with the same input and models are skipped, so an interrupted run can be restarted.', required=False, default=None)
+    parser.add_argument('--workers', metavar='N', type=int, help='The number of worker processes used to parse documents in parallel. Each worker loads its own copy of the models unless --bert-broker is given. Default is 1 (serial).', required=False, default=1)
+    parser.add_argument('--bert-broker', action="store_true", help='With --workers, load the BERT models once in a shared inference broker process that classifies the DATE/DURATION phrases of all the workers in micro-batches, instead of loading a copy in every worker.', default=False)
+    parser.add_argument('--bert-broker-wait', metavar='ms', type=float, help='How many milliseconds the inference broker waits for requests from other workers before running a micro-batch. Default is 5.', required=False, default=5)
     
     args = parser.parse_args()
+    if args.bert_onnx is not None and args.bert_quantize:
+        parser.error("--bert-onnx and --bert-quantize can not be combined.")
+    if args.bert_broker and args.workers < 2:
+        parser.error("--bert-broker shares the BERT models between --workers processes and needs --workers 2 or more.")
+    if args.jsonl is not None and args.workers > 1:
+        parser.error("--jsonl streams one record at a time and can not be combined with --workers.")
     ## Now we can access each argument as args.i, args.o, args.r
+
+    ## JSONL results written to stdout must not be mixed with the progress messages, so those go to stderr instead.
+    jsonl_stdout = sys.stdout
+    if args.jsonl is not None and args.jsonl_out == "-":
+        sys.stdout = sys.stderr
     
     #### need to check for input and output of one type here.
     global dictpath
@@ -111,7 +139,7 @@ if __name__ == "__main__":
                 outfiles.append(os.path.join(args.O,name))
                 if not os.path.exists(os.path.join(args.O)):
                     os.makedirs(os.path.join(args.O))
-    else:
+    elif args.i is not None:
         for root, dirs, files in os.walk(args.i, topdown = True):
            for name in dirs:
                 indirs.append(os.path.join(root, name))
@@ -120,122 +148,92 @@ if __name__ == "__main__":
                 if not os.path.exists(os.path.join(args.o,name)):
                     os.makedirs(os.path.join(args.o,name))
     
+    ## Skip the documents that a previous run already completed with the same input files and models.
+    completion_manifest = None
+    input_hashes = {}
+    if args.manifest is not None:
+        completion_manifest = manifest.CompletionManifest(args.manifest, manifest.modelIdentity(args))
+        todo = []
+        for f in range(0,len(infiles)) :
+            input_hashes[infiles[f]] = manifest.hashFiles(pipeline.documentInputFiles(infiles[f], args))
+            if completion_manifest.isComplete(infiles[f], input_hashes[infiles[f]]):
+                print("Skipping completed document " + infiles[f])
+            else:
+                todo.append(f)
+        infiles = [infiles[f] for f in todo]
+        outfiles = [outfiles[f] for f in todo]
+
     ## Get training data for ML methods by importing pre-made boolean matrix
-    ## Train ML methods on training data
-    if(args.m == "DT" and args.M is None):
-        ## Train the decision tree classifier and save in the classifier variable
-        #print("Got DT")
-        classifier, feats = DTree.build_dt_model(args.d, args.c)
-        with open('DT_model.pkl', 'wb') as mod:  
-            pickle.dump([classifier, feats], mod)
-
-    if(args.m == "RF" and args.M is None):
-        ## Train the decision tree classifier and save in the classifier variable
-        # print("Got RF")
-        classifier, feats = RandomForest.build_model(args.d, args.c)
-        with open('RF_model.pkl', 'wb') as mod:
-            pickle.dump([classifier, feats], mod)
-    
-    elif(args.m == "NN" and args.M is None):
-        #print("Got NN")
-        ## Train the neural network classifier and save in the classifier variable
-        classifier = ChronoKeras.build_model(args.d, args.c)
-        feats = utils.get_features(args.d)
-        classifier.save('NN_model.h5')
-            
-    elif(args.m == "SVM" and args.M is None):
-        #print("Got SVM")
-        ## Train the SVM classifier and save in the classifier variable
-        classifier, feats = SVMclass.build_model(args.d, args.c)
-        with open('SVM_model.pkl', 'wb') as mod:  
-            pickle.dump([classifier, feats], mod)
-            
-    elif(args.M is None):
-        #print("Got NB")
-        ## Train the naive bayes classifier and save in the classifier variable
-        classifier, feats, NB_input = NBclass.build_model(args.d, args.c)
-        classifier.show_most_informative_features(20)
-        with open('NB_model.pkl', 'wb') as mod:  
-            pickle.dump([classifier, feats], mod)
-                
-    elif(args.M is not None):
-        #print("use saved model")
-        if args.m == "NB" or args.m == "DT":
-            with open(args.M, 'rb') as mod:
-                print(args.M)
-                classifier, feats = pickle.load(mod)
-        elif args.m == "NN":
-            classifier = load_model(args.M)
-            feats = utils.get_features(args.d)
+    ## Train ML methods on training data, or load a pre-built model
+    classifier, feats = pipeline.loadClassifier(args.m, args.M, args.d, args.c)
+    chrono_pipeline = None
+    memo_merger = None
     
     ## Pass the ML classifier through to the parse SUTime entities method.
 
-    # load in BERT model
-    bert_model = BertModel.from_pretrained(args.b, output_hidden_states=True, use_cache=True, output_attentions=True)
-    bert_tokenizer = BertTokenizer.from_pretrained(args.b)
+    if args.bert_quantize_check is not None:
+        ## Report how closely the quantized BERT model matches the fp32 model on a sample before using it.
+        report = pipeline.compareQuantized(args.bert_quantize_check, args, classifier, feats)
+        for d in report["disagreements"]:
+            print("Disagreement in " + str(d["id"]) + " " + str(d["span"]) + " '" + str(d["text"]) + "': fp32 " +
+                  str(d["fp32"]) + ", int8 " + str(d["int8"]))
+        print("Documents: " + str(report["documents"]) + "  DATE/DURATION phrases: " + str(report["phrases"]) +
+              "  Agreement: " + str(report["agree"]) + "/" + str(report["phrases"]) +
+              " ({:.2%})".format(report["agreement"]))
+        print("Parse time fp32: {:.2f}s  int8: {:.2f}s".format(report["seconds"]["fp32"], report["seconds"]["int8"]))
+        for e in report["errors"]:
+            print("Could not parse " + str(e["id"]) + ": " + e["error"])
+
+    elif args.jsonl is not None:
+        ## Stream records through the pipeline one at a time so memory stays flat regardless of corpus size.
+        chrono_pipeline = pipeline.ChronoPipeline.fromArgs(args, classifier, feats)
+        with contextlib.redirect_stdout(jsonl_stdout):
+            pipeline.parseJsonl(args.jsonl, args.jsonl_out, chrono_pipeline)
+
+    elif args.workers > 1:
+        ## Each worker loads the BERT models once at startup, then parses documents as they are handed out.
+        ## With --bert-broker the BERT models are only loaded by the broker process, which gets all the torch threads.
+        ## Results are written by the workers as each document finishes.
+        num_threads = max(1, multiprocessing.cpu_count() // args.workers)
+        ctx = multiprocessing.get_context("spawn")
+        with contextlib.ExitStack() as stack:
+            broker_args = None
+            if args.bert_broker and args.b is not None:
+                broker = stack.enter_context(inference_broker.InferenceBroker(args, args.workers,
+                                                                              multiprocessing.cpu_count(),
+                                                                              args.bert_broker_wait / 1000.0, ctx=ctx))
+                broker_args = broker.clientArgs()
+            pool = stack.enter_context(ctx.Pool(processes=args.workers, initializer=pipeline.initWorker,
+                                                initargs=(args, None if args.m == "NN" else classifier, feats,
+                                                          num_threads, broker_args)))
+            if args.token_memo_size:
+                memo_merger = token_memo.TokenMemoMerger(args.token_memo_size, args.token_memo_vocab)
+            for infile, outfile, num_entities, memo_update in pool.imap_unordered(pipeline.parseDocumentWorker, zip(infiles, outfiles)):
+                print("Finished " + infile + " with " + str(num_entities) + " Chrono Entities")
+                if memo_update is not None:
+                    memo_merger.merge(memo_update)
+                if completion_manifest is not None:
+                    completion_manifest.markComplete(infile, outfile, input_hashes[infile])
 
-    if args.cnn:
-        bert_classifier = load_model(args.B)
     else:
-        bert_classifier = load(args.B)
-
-    ## Loop through each file and parse
-    for f in range(0,len(infiles)) :
-        print("Parsing "+ infiles[f] +" ...")
-        ## Init the ChronoEntity list
-        my_chronoentities = []
-        my_chrono_ID_counter = 1
-        
-        ## parse out the doctime
-        if args.I is not None:
-            doctime = utils.getDocTime(infiles[f], i2b2=True)
-        else:
-            doctime = utils.getDocTime(infiles[f] + ".dct", i2b2=False)
-        if(debug) : print(doctime)
-    
-        ## parse out reference tokens.  The spans returned are character spans, not token spans.
-        ## sents is per token, a 1 indicates that token is the last in the sentence.
-        ##
-        raw_text, text, tokens, abs_text_spans, rel_text_spans, tags, sents, sent_text, sent_membership = utils.getWhitespaceTokens2(infiles[f]+args.x)
-        #my_refToks = referenceToken.convertToRefTokens(tok_list=tokens, span=spans, remove_stopwords="./Chrono/stopwords_short2.txt")
-        my_refToks = referenceToken.convertToRefTokens(tok_list=tokens, abs_span=abs_text_spans, rel_span=rel_text_spans, pos=tags, sent_boundaries=sents, sent_membership=sent_membership)
-        
-        if(args.includeRelative):
-            print("Including Relative Terms")
-    
-        ## mark all ref tokens if they are numeric or temporal
-        chroList = utils.markTemporal(my_refToks, include_relative=args.includeRelative)
-        
-        if(debug) :
-            print("REFERENCE TOKENS:\n")
-            for tok in chroList : print(tok)
-            
-        tempPhrases = utils.getTemporalPhrases(chroList, sent_text, doctime)
-    
-        if(debug):
-            for c in tempPhrases:
-                print(c)
-    
+        # load in BERT model
+        chrono_pipeline = pipeline.ChronoPipeline.fromArgs(args, classifier, feats)
 
+        ## Loop through each file and parse
+        for f in range(0,len(infiles)) :
+            pipeline.parseDocument(infiles[f], outfiles[f], args, chrono_pipeline)
+            if completion_manifest is not None:
+                completion_manifest.markComplete(infiles[f], outfiles[f], input_hashes[infiles[f]])
 
-        chrono_master_list, my_chrono_ID_counter, timex_phrases = BuildEntities.buildChronoList(tempPhrases,
-                                                                                                my_chrono_ID_counter,
-                                                                                                chroList,
-                                                                                                (classifier, args.m),
-                                                                                                feats, bert_model,
-                                                                                                bert_tokenizer,
-                                                                                                bert_classifier,
-                                                                                                args.includeContext,
-                                                                                                args.includeAttention,
-                                                                                                args.cnn,
-                                                                                                doctime)
-        
-        print("Number of Chrono Entities: " + str(len(chrono_master_list)))
-        
-        if args.O is not None:
-            utils.write_i2b2(raw_text, timex_phrases, outfile=outfiles[f])
-        else:
-            utils.write_xml(chrono_list=chrono_master_list, outfile=outfiles[f])
-        
-    
-    
+    if completion_manifest is not None:
+        completion_manifest.close()
+
+    ## Report how well the token memo did, and save its vocabulary to warm later runs.  With --workers each worker
+    ## holds its own memo and the merged updates from all of them are used.
+    memo = memo_merger if memo_merger is not None else (chrono_pipeline.token_memo if chrono_pipeline is not None else None)
+    if memo is not None:
+        stats = memo.getStats()
+        print("Token memo: " + str(stats["hits"]) + " hits, " + str(stats["misses"]) + " misses ({:.2%} hit rate), ".format(stats["hit_rate"]) +
+              str(stats["entries"]) + " tokens", file=sys.stderr)
+        if args.token_memo_vocab is not None:
+            memo.saveVocabulary(args.token_memo_vocab)
@@ -52,8 +52,10 @@ from Chrono import utils
 # @author Nicholas Morton
 # @param list of TimePhrase Output
 # @param document creation time (optional)
+# @param embedding_cache An EmbeddingCache for the BERT sentence outputs (optional)
+# @param bert_max_length The length sentences are padded to for BERT, or None to pad only to the longest in each batch (optional)
 # @return List of Chrono entities and the ChronoID
-def buildChronoList(TimePhraseList, chrono_id, ref_list, PIclassifier, PIfeatures, bert_model, bert_tokenizer, bert_classifier, includeContext, includeAttention, cnn, dct=None):
+def buildChronoList(TimePhraseList, chrono_id, ref_list, PIclassifier, PIfeatures, bert_model, bert_tokenizer, bert_classifier, includeContext, includeAttention, cnn, dct=None, embedding_cache=None, bert_max_length=256):
     chrono_list = []
     
     ## Do some further pre-processing on the ref token list
@@ -64,9 +66,16 @@ def buildChronoList(TimePhraseList, chrono_id, ref_list, PIclassifier, PIfeature
     
     ## this list will contain only the phrases that have a temporal component with a scate entity.
     timex_list = []
+    ## the SCATE entities for each phrase in timex_list
+    phrase_entities = []
+
+    ## Classify all the period/interval candidates in the document with one call to the classifier before the entities are built.
+    pi_features = [PeriodInterval.getPeriodIntervalFeatures(s, ref_list, PIfeatures) for s in TimePhraseList]
+    pi_classes = iter(PeriodInterval.classifyPeriodIntervals([f for f in pi_features if f is not None], PIclassifier))
+    pi_classes = [None if f is None else next(pi_classes) for f in pi_features]
     
-    for s in TimePhraseList:
-        print("\nNOW PARSING PHRASE: " + s.getText() + "\n")
+    for s, pi_class in zip(TimePhraseList, pi_classes):
+        #print("\nNOW PARSING PHRASE: " + s.getText() + "\n")
         chrono_tmp_list = []
         
         # this is the new chrono time flags so we don't duplicate effort.  Will ned to eventually re-write this flow.
@@ -104,7 +113,7 @@ def buildChronoList(TimePhraseList, chrono_id, ref_list, PIclassifier, PIfeature
         chrono_tmp_list, chrono_id = PartOfDay.buildPartOfDay(s, chrono_id, chrono_tmp_list)
         chrono_tmp_list, chrono_id = PartOfWeek.buildPartOfWeek(s, chrono_id, chrono_tmp_list)
         chrono_tmp_list, chrono_id = Season.buildSeasonOfYear(s, chrono_id, chrono_tmp_list, ref_list)
-        chrono_tmp_list, chrono_id = PeriodInterval.buildPeriodInterval(s, chrono_id, chrono_tmp_list, ref_list, PIclassifier, PIfeatures)
+        chrono_tmp_list, chrono_id = PeriodInterval.buildPeriodInterval(s, chrono_id, chrono_tmp_list, ref_list, PIclassifier, PIfeatures, pi_class)
         chrono_tmp_list, chrono_id = TextYear.buildTextYear(s, chrono_id, chrono_tmp_list)
         chrono_tmp_list, chrono_id = This.buildThis(s, chrono_id, chrono_tmp_list)
         chrono_tmp_list, chrono_id = BeforeAfter.buildBeforeAfter(s, chrono_id, chrono_tmp_list)
@@ -127,11 +136,9 @@ def buildChronoList(TimePhraseList, chrono_id, ref_list, PIclassifier, PIfeature
         ## Need to add ISO conversion here!
         
         if len(tmplist) > 0:
-            #print("Converting phrase to ISO: " + str(s))
-            s.getISO(tmplist, bert_model, bert_tokenizer, bert_classifier, includeContext, includeAttention, cnn)
-            #print("ISO Value: " + str(s))
-            #print("TIMEX3 String: " + s.i2b2format())
+            ## the ISO conversion is done below, once all the DATE/DURATION phrases have been classified together
             timex_list.append(s)
+            phrase_entities.append(tmplist)
             
         
         
@@ -142,6 +149,23 @@ def buildChronoList(TimePhraseList, chrono_id, ref_list, PIclassifier, PIfeature
         #chrono_list, chrono_id = buildDuration(s, chrono_id, chrono_list)
         #chrono_list, chrono_id = buildSet(s, chrono_id, chrono_list)
     
+    ## Classify all the DATE/DURATION candidates in the document in one batch, then convert each phrase to ISO.
+    datedur_types = [None] * len(timex_list)
+    if bert_model is not None:
+        candidate_idxs = [i for i in range(0, len(timex_list)) if timex_list[i].isDateDurationCandidate(phrase_entities[i])]
+        candidates = [(timex_list[i].rel_token_idx_start, timex_list[i].rel_token_idx_end, timex_list[i].sent_text,
+                       timex_list[i].sent_membership) for i in candidate_idxs]
+        labels = utils.bert_classify_batch(candidates, bert_model, bert_tokenizer, bert_classifier, includeContext, includeAttention, cnn,
+                                           embedding_cache=embedding_cache, max_length=bert_max_length)
+        for i, label in zip(candidate_idxs, labels):
+            datedur_types[i] = label
+
+    for s, tmplist, datedur_type in zip(timex_list, phrase_entities, datedur_types):
+        #print("Converting phrase to ISO: " + str(s))
+        s.getISO(tmplist, bert_model, bert_tokenizer, bert_classifier, includeContext, includeAttention, cnn, datedur_type, embedding_cache, bert_max_length)
+        #print("ISO Value: " + str(s))
+        #print("TIMEX3 String: " + s.i2b2format())
+
     #print("TIMEX LIST: " + str(timex_list))
       
     return chrono_list, chrono_id, timex_list
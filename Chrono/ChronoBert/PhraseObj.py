@@ -31,6 +31,7 @@
 # Boston, MA  02111-1307, USA.
 
 import numpy
+from functools import cached_property
 from Chrono.ChronoBert import bert_utils as utils
 import torch
 
@@ -56,75 +57,128 @@ class PhraseObj(object):
         self.coords_bert = self.setCoordsBert(a2b)
         self.bert_length = self.coords_bert[-1] - self.coords_bert[0]
         self.bert_text = bert_sent[self.coords_bert[0]:self.coords_bert[-1] + 1]
-        self.summarized_embedding = utils.summarizeEmbeddingAvg(bert_sent, sent_embeddings, self.coords_bert,
-                                                                self.filter,
-                                                                self.merge)  ## will want to develop different options for this method
-
-        self.context_text_before, self.context_coords_before, self.summarized_context_embedding_before = \
-            self.getContextEmbeddings(bert_sent, sent_embeddings, context_window * -1)
-        ##print("Context Coords BEFORE: " + str(self.context_coords_before))
-
-        self.context_text_after, self.context_coords_after, self.summarized_context_embedding_after = \
-            self.getContextEmbeddings(bert_sent, sent_embeddings, context_window)
-        ##print("Context Coords AFTER: " + str(self.context_coords_after))
-
-        self.attendsToTokens, self.attendsToText, self.summarized_attention_embedding = self.getAttentionEmbedding(
-            attentions, bert_sent, sent_embeddings, context_window)
-
-        ## Need to add methods to obtain the following for CNN:
-        ##print("\nGETTING PHRASE MATRIX\n")
-        ##print(self.coords_bert)
-        ##print(list(range(self.coords_bert[0],self.coords_bert[1]+1)))
-        self.phrase_embedding_matrix = utils.getEmbeddingMtxDisconnected(bert_sent, sent_embeddings, list(range(self.coords_bert[0],self.coords_bert[1]+1)), self.filter)
-        ##print("\nGETTING BEFORE CONTEXT MATRIX\n")
-        ##print("Context Text BEFORE: " + str(self.context_text_before) + " Coords: " + str(self.context_coords_before))
-        self.context_before_matrix = utils.getEmbeddingMtxDisconnected(bert_sent, sent_embeddings,
-                                                                       list(range(self.context_coords_before[0],
-                                                                                  self.context_coords_before[1]+1)), self.filter)
-        ##print("\nGETTING AFTER CONTEXT MATRIX\n")
-        self.context_after_matrix = utils.getEmbeddingMtxDisconnected(bert_sent, sent_embeddings,
-                                                                      list(range(self.context_coords_after[0],
-                                                                                 self.context_coords_after[1]+1)), self.filter)
-
+        ## the BERT outputs for the sentence, from which the features below are computed the first time they are used
+        self.bert_sent = bert_sent
+        self.sent_embeddings = sent_embeddings
+        self.attentions = attentions
+
+    ## The average embedding of the phrase tokens.
+    @cached_property
+    def summarized_embedding(self):
+        return utils.summarizeEmbeddingAvg(self.bert_sent, self.sent_embeddings, self.coords_bert, self.filter,
+                                           self.merge)  ## will want to develop different options for this method
+
+    ## The (text, coords, summarized embedding) of the context before the phrase.
+    @cached_property
+    def context_before(self):
+        return self.getContextEmbeddings(self.bert_sent, self.sent_embeddings, self.context_window * -1)
+
+    ## The (text, coords, summarized embedding) of the context after the phrase.
+    @cached_property
+    def context_after(self):
+        return self.getContextEmbeddings(self.bert_sent, self.sent_embeddings, self.context_window)
+
+    @property
+    def context_text_before(self):
+        return self.context_before[0]
+
+    @property
+    def context_coords_before(self):
+        return self.context_before[1]
+
+    @property
+    def summarized_context_embedding_before(self):
+        return self.context_before[2]
+
+    @property
+    def context_text_after(self):
+        return self.context_after[0]
+
+    @property
+    def context_coords_after(self):
+        return self.context_after[1]
+
+    @property
+    def summarized_context_embedding_after(self):
+        return self.context_after[2]
+
+    ## The (attended token indices, attended text, summarized embedding) of the tokens the phrase attends to most, or
+    ## Nones if BERT was run without its attentions.
+    @cached_property
+    def attention_summary(self):
+        if self.attentions is None:
+            return None, None, None
+        return self.getAttentionEmbedding(self.attentions, self.bert_sent, self.sent_embeddings, self.context_window)
+
+    @property
+    def attendsToTokens(self):
+        return self.attention_summary[0]
+
+    @property
+    def attendsToText(self):
+        return self.attention_summary[1]
+
+    @property
+    def summarized_attention_embedding(self):
+        return self.attention_summary[2]
+
+    ## The token embedding matrices used by the CNN.
+    @cached_property
+    def phrase_embedding_matrix(self):
+        return utils.getEmbeddingMtxDisconnected(self.bert_sent, self.sent_embeddings,
+                                                 list(range(self.coords_bert[0], self.coords_bert[1]+1)), self.filter)
+
+    @cached_property
+    def context_before_matrix(self):
+        return utils.getEmbeddingMtxDisconnected(self.bert_sent, self.sent_embeddings,
+                                                 list(range(self.context_coords_before[0],
+                                                            self.context_coords_before[1]+1)), self.filter)
+
+    @cached_property
+    def context_after_matrix(self):
+        return utils.getEmbeddingMtxDisconnected(self.bert_sent, self.sent_embeddings,
+                                                 list(range(self.context_coords_after[0],
+                                                            self.context_coords_after[1]+1)), self.filter)
+
+    @cached_property
+    def attention_before_matrix(self):
+        if self.attentions is None:
+            return None
         attn_before = [i for i in self.attendsToTokens if i < self.coords_bert[0]]
-        attn_after = [i for i in self.attendsToTokens if i > self.coords_bert[-1]]
-        ##print("ATTN Before: " + str(attn_before))
-        ##print("ATTN After: " + str(attn_after))
-
-        ##print("\nGETTING BEFORE ATTN MATRIX\n")
-        self.attention_before_matrix = utils.getEmbeddingMtxDisconnected(bert_sent, sent_embeddings, attn_before, self.filter)
-        ###print("\nGETTING AFTER ATTN MATRIX\n")
-        self.attention_after_matrix = utils.getEmbeddingMtxDisconnected(bert_sent, sent_embeddings, attn_after, self.filter)
+        return utils.getEmbeddingMtxDisconnected(self.bert_sent, self.sent_embeddings, attn_before, self.filter)
 
+    @cached_property
+    def attention_after_matrix(self):
+        if self.attentions is None:
+            return None
+        attn_after = [i for i in self.attendsToTokens if i > self.coords_bert[-1]]
+        return utils.getEmbeddingMtxDisconnected(self.bert_sent, self.sent_embeddings, attn_after, self.filter)
 
     def getMtxFormattedPhrase(self, pad_to, include_context = False, include_attention = False):
 
         if include_context:
             ##print("\nReturning CONTEXT with phrase matrix")
             ##print("Length of context before: " + str(len(self.context_before_matrix)))
-            embed_mtx = self.context_before_matrix[:]
-            embed_mtx.extend(self.phrase_embedding_matrix)
-            embed_mtx.extend(self.context_after_matrix)
+            embed_mtx = torch.cat((self.context_before_matrix, self.phrase_embedding_matrix, self.context_after_matrix))
             pad_mtx = utils.padMtx(embed_mtx, pad_to)
             if(len(pad_mtx) != 15):
                 print("ERROR")
                 print("length of embed_mtx before padding: " + str(len(embed_mtx)))
                 print("length of embed_mtx after padding: " + str(len(pad_mtx)))
-            return torch.stack(pad_mtx).numpy()
+            return pad_mtx.numpy()
 
         elif include_attention:
+            self.checkAttention(include_attention)
             ##print("\nReturning ATTENTION with phrase matrix")
             ##print("Length of attn before: " + str(len(self.attention_before_matrix)))
-            embed_mtx = self.attention_before_matrix[:]
-            embed_mtx.extend(self.phrase_embedding_matrix)
-            embed_mtx.extend(self.attention_after_matrix)
+            embed_mtx = torch.cat((self.attention_before_matrix, self.phrase_embedding_matrix, self.attention_after_matrix))
             ##print("length of embed_mtx: " + str(len(embed_mtx)))
-            return torch.stack(utils.padMtx(embed_mtx, pad_to)).numpy()
+            return utils.padMtx(embed_mtx, pad_to).numpy()
         else:
             ##print("\nReturning just phrase matrix")
             embed_mtx = utils.padMtx(self.phrase_embedding_matrix, pad_to)
             ##print("Shape: " + str(len(embed_mtx)))
-            return torch.stack(embed_mtx).numpy()
+            return embed_mtx.numpy()
 
 
 
@@ -137,7 +191,8 @@ class PhraseObj(object):
             contextCoords = (max(self.coords_bert[0] + context_window, 0), self.coords_bert[0] - 1)
         else:
             ##print("getting context after: Start: " + str(self.coords_bert[1] + 1) + " End: " + str(min(self.coords_bert[1] + context_window, len(bert_sent))) )
-            contextCoords = (self.coords_bert[1] + 1, min(self.coords_bert[1] + context_window, len(bert_sent)) )
+            ## the last index is len(bert_sent) - 1; unpadded sentences can end right after the phrase
+            contextCoords = (self.coords_bert[1] + 1, min(self.coords_bert[1] + context_window, len(bert_sent) - 1) )
 
         if (contextCoords[1] - contextCoords[0]) > 0:
             ##print("getting context embedding...")
@@ -169,53 +224,37 @@ class PhraseObj(object):
         return context_text, contextCoords, context_embedding
 
     def getAttentionEmbedding(self, attention, bert_sent, sent_embeddings, k):
-        # Format Attentions
-        formatted_attentions = utils.format_attention(attention,
-                                                      layers=list(range(utils.num_attention_layers(attention))),
-                                                      heads=list(range(utils.num_attention_heads(attention))))
+        if len(attention[0].shape) != 4:
+            raise ValueError(
+                "The attention tensor does not have the correct number of dimensions. Make sure you set "
+                "output_attentions=True when initializing your model.")
 
         #### Summarizing attentions for phrases
         phrase_start = self.coords_bert[0]
-        phrase_end = self.coords_bert[1] + 1
+        phrase_end = max(self.coords_bert[1] + 1, phrase_start + 1)
 
         ##print("\nBert Sentence: " + str(bert_sent))
         ##print("\nCurrent Phrase Start: " + str(phrase_start) + " End: " + str(phrase_end))
         ##print("\nPhrase: " + str(bert_sent[phrase_start:phrase_end]))
 
-        layer_attention = torch.tensor(0)
-
-        for layer in range(0, utils.num_attention_layers(attention)):
-            # #print("\nLayer " + str(layer))
-            head_attention = torch.tensor(0)
+        # Only the rows of the phrase tokens are stacked: num_layers x num_heads x phrase_len x seq_len
+        phrase_rows = torch.stack([layer_attention[0, :, phrase_start:phrase_end, :] for layer_attention in attention])
 
-            for head in range(0, utils.num_attention_heads(attention)):
+        # The most each token is attended to by any phrase token, summed over the heads: num_layers x seq_len
+        head_attention = phrase_rows.max(dim=2).values.sum(dim=1)
 
-                phrase_attention = formatted_attentions[layer][head][phrase_start]
-                for n in range(phrase_start + 1, phrase_end):
-                    phrase_attention = torch.max(phrase_attention, formatted_attentions[layer][head][n])
+        # The phrase itself, [CLS], the first [SEP], and punctuation are never attended to
+        ignore = torch.zeros(head_attention.size(1), dtype=torch.bool)
+        ignore[phrase_start:phrase_end] = True
+        ignore[0] = True
+        ignore[bert_sent.index('[SEP]')] = True
+        ignore[[i for i, x in enumerate(bert_sent) if x in (".", ",")]] = True
+        head_attention = head_attention.masked_fill(ignore, 0)
 
-                head_attention = head_attention + phrase_attention
+        # Normalize each layer, then sum over the layers
+        layer_attention = (head_attention / head_attention.sum(dim=1, keepdim=True)).sum(dim=0)
 
-            head_attention[phrase_start:phrase_end] = 0
-            head_attention[0] = 0
-            head_attention[bert_sent.index('[SEP]')] = 0
-            if '.' in bert_sent:
-                indices = [i for i, x in enumerate(bert_sent) if x == "."]
-                head_attention[indices] = 0
-            if ',' in bert_sent:
-                indices = [i for i, x in enumerate(bert_sent) if x == ","]
-                head_attention[indices] = 0
-            # if '[PAD]' in bert_sent:
-            #    indices = [i for i, x in enumerate(bert_sent) if x == '[PAD]']
-            #    #print(indices)
-            #    head_attention[indices] = 0
-
-            # #print(head_attention)
-            tmp = head_attention / sum(head_attention)
-
-            layer_attention = layer_attention + tmp
-
-        m = layer_attention / sum(layer_attention)
+        m = layer_attention / layer_attention.sum()
         token_attn = m.numpy() * 100
         attends_to = numpy.sort(numpy.flip(numpy.argsort(token_attn))[0:k])
         attends_to_text = [bert_sent[x] for x in attends_to]
@@ -249,7 +288,14 @@ class PhraseObj(object):
     def getNumToks(self):
         return len(self.bert_text)
 
+    ## Checks that the attention features were computed if they are requested.
+    # @param include_attention Boolean indicating if the attention features are requested.
+    def checkAttention(self, include_attention):
+        if include_attention and self.attentions is None:
+            raise ValueError("Attention features were requested but the sentence was encoded without attentions.")
+
     def getSummarizedEmbedding(self, include_context, include_attention):
+        self.checkAttention(include_attention)
         if include_context and include_attention:
             return torch.cat([self.summarized_context_embedding_before, self.summarized_embedding,
                               self.summarized_context_embedding_after, self.summarized_attention_embedding], 0)
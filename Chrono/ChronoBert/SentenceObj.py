@@ -30,11 +30,14 @@
 # 59 Temple Place - Suite 330,
 # Boston, MA  02111-1307, USA.
 
-import tokenizations
 import torch
 import numpy as np
 from Chrono.ChronoBert import bert_utils as utils
 from Chrono.ChronoBert import PhraseObj
+from Chrono.ChronoBert import bert_encoder
+
+## The longest input BERT accepts, used to truncate sentences when they are not padded to a fixed length.
+MAX_BERT_LENGTH = 512
 
 
 
@@ -42,52 +45,103 @@ class SentenceObj(object):
 
     # init method or constructor
     def __init__(self, text, sentence_num, global_sent_char_start_coord, global_sentence_start_coord, phrase_idxs,
-                 max_length, bert_model, bert_tokenizer, context_window, gold_labels, filt):
+                 max_length, bert_model, bert_tokenizer, context_window, gold_labels, filt, embedding_cache=None,
+                 include_attention=True):
         self.text = text
         self.sentence_num = sentence_num
         self.global_sent_char_start_coord = global_sent_char_start_coord
         self.global_sentence_start_coord = global_sentence_start_coord
-        self.whitespace_tokenized_sentence, \
-            self.bert_tokenized_sentence, \
-            self.tokens_tensor, \
-            self.segments_mask, \
-            self.attention_mask, \
-            self.idx_map_white2bert = self.tokenizeSentence(bert_tokenizer, max_length)
-        self.bert_embeddings, self.bert_attentions = self.getSentEmbeddings(bert_model)
-        self.datedur_phrases = self.extractPhrases(phrase_idxs, context_window, gold_labels, filt)
+        self.max_length = max_length
+        self.embedding_cache = embedding_cache
+        ## without attentions the phrases do not have the attention features
+        self.include_attention = include_attention
+        self.phrase_idxs = phrase_idxs
+        self.context_window = context_window
+        self.gold_labels = gold_labels
+        self.filt = filt
+        self.bert_embeddings = None
+        self.bert_attentions = None
+        self.datedur_phrases = []
+        self.max_phrase_length = 0
+
+        ## reuse the tokenization, hidden states, and attentions already computed for this sentence
+        cached = embedding_cache.get(text, max_length) if embedding_cache is not None else None
+        if cached is not None:
+            self.whitespace_tokenized_sentence, \
+                self.bert_tokenized_sentence, \
+                self.tokens_tensor, \
+                self.segments_mask, \
+                self.attention_mask, \
+                self.idx_map_white2bert = cached["tokens"]
+            if cached["attentions"] is not None or not include_attention:
+                self.setSentEmbeddings(cached["embeddings"], cached["attentions"] if include_attention else None)
+                return
+        else:
+            self.whitespace_tokenized_sentence, \
+                self.bert_tokenized_sentence, \
+                self.tokens_tensor, \
+                self.segments_mask, \
+                self.attention_mask, \
+                self.idx_map_white2bert = self.tokenizeSentence(bert_tokenizer, max_length)
+
+        ## If no model is given the embeddings are computed later for a batch of sentences by batchSentEmbeddings()
+        if bert_model is not None:
+            self.setSentEmbeddings(*self.getSentEmbeddings(bert_model))
+            self.cacheSentEmbeddings()
+
+    ## Sets the BERT embeddings and attentions for this sentence and extracts the phrase objects from them.
+    # @param bert_embeddings The list of token embeddings from formatSentEmbeddings().
+    # @param bert_attentions The tuple of attention tensors for this sentence, one per layer, or None if they were
+    #                        not computed.
+    def setSentEmbeddings(self, bert_embeddings, bert_attentions):
+        self.bert_embeddings = bert_embeddings
+        self.bert_attentions = bert_attentions
+        self.datedur_phrases = self.extractPhrases(self.phrase_idxs, self.context_window, self.gold_labels, self.filt)
 
         self.max_phrase_length = self.calc_max_phrase_length()
 
+    ## Adds this sentence's tokenization and BERT outputs to the embedding cache, if there is one.
+    def cacheSentEmbeddings(self):
+        if self.embedding_cache is not None:
+            self.embedding_cache.put(self.text, self.max_length,
+                                     {"tokens": (self.whitespace_tokenized_sentence, self.bert_tokenized_sentence,
+                                                 self.tokens_tensor, self.segments_mask, self.attention_mask,
+                                                 self.idx_map_white2bert),
+                                      "embeddings": self.bert_embeddings, "attentions": self.bert_attentions})
+
     def tokenizeSentence(self, bert_tokenizer, max_length):
         ##print("Tokenizing sentence: Max Sentence Length: " + str(max_length))
         local_whitespace_tokenized_sentence = self.text.split()
-        local_bert_tokenized_sentence, local_tokens_tensor, local_segments_mask, local_attention_mask = \
-            self.bert_text_prep(self.text, bert_tokenizer, max_length)
 
-        a2b, b2a = tokenizations.get_alignments(local_whitespace_tokenized_sentence, local_bert_tokenized_sentence)
-        local_idx_map_white2bert = a2b
+        ## fast tokenizers return the word pieces and their character offsets in one call, so the whitespace tokens
+        ## can be mapped to the BERT tokens directly instead of re-tokenizing and aligning the two tokenizations
+        if getattr(bert_tokenizer, "is_fast", False):
+            local_bert_tokenized_sentence, local_tokens_tensor, local_segments_mask, local_attention_mask, offsets = \
+                self.bert_text_prep_fast(self.text, bert_tokenizer, max_length)
+            local_idx_map_white2bert = utils.alignWhitespaceToBert(self.text, offsets)
+        else:
+            import tokenizations
+            local_bert_tokenized_sentence, local_tokens_tensor, local_segments_mask, local_attention_mask = \
+                self.bert_text_prep(self.text, bert_tokenizer, max_length)
+
+            a2b, b2a = tokenizations.get_alignments(local_whitespace_tokenized_sentence, local_bert_tokenized_sentence)
+            local_idx_map_white2bert = a2b
 
         return local_whitespace_tokenized_sentence, local_bert_tokenized_sentence, local_tokens_tensor, \
             local_segments_mask, local_attention_mask, local_idx_map_white2bert
 
     def getSentEmbeddings(self, bert_model):
 
-        with torch.no_grad():
-            outputs = bert_model(self.tokens_tensor, self.segments_mask)
-            # Removing the first hidden state
-            # The first state is the input state
-            hidden_states = outputs[2][1:]
-            attentions = outputs[-1]
-
-        # Reformat the embedding matrix
-        token_embeddings = torch.stack(hidden_states, dim=0)  # Concatenate the tensors for all layers. We use
-        # `stack` here to create a_bert new dimension in the tensor.
-        token_embeddings = torch.squeeze(token_embeddings, dim=1)  # Remove dimension 1, the "batches".
-        token_embeddings = token_embeddings.permute(1, 0, 2)  # Swap dimensions 0 and 1.
+        # Only the last four hidden states are kept, and the attentions are only computed if they are needed
+        hidden_states, attentions = bert_encoder.asEncoder(bert_model).encode(self.tokens_tensor, self.getEncoderMask(),
+                                                                              self.include_attention)
 
-        local_bert_embeddings = utils.concat_last_4(token_embeddings)
+        return formatSentEmbeddings(hidden_states, attentions)
 
-        return local_bert_embeddings, attentions
+    ## Gets the mask BERT is run with.  Sentences padded to max_length are run with every position attended, padding
+    ## included, as the ChronoBERT classifiers were.  Unpadded sentences are run with their real attention mask.
+    def getEncoderMask(self):
+        return self.segments_mask if self.max_length is not None else self.attention_mask
 
     def extractPhrases(self, phrase_idxs, context_window, gold_labels, filt):
         ## input: [[2,3,4],[8,9]]
@@ -152,6 +206,18 @@ class SentenceObj(object):
                                         context_window=context_window, gold_label='', filt=filt))
         return local_datedur_phrases
 
+    ## Computes the summarized embedding of every phrase in this sentence at once, rather than one phrase at a time
+    ## when each is first used.
+    def summarizePhrases(self):
+        phrases = [p for p in self.datedur_phrases if "summarized_embedding" not in vars(p)]
+        if not phrases:
+            return
+        summaries, has_tokens = utils.summarizeEmbeddingAvgBatch(
+            self.bert_tokenized_sentence, self.bert_embeddings,
+            [range(p.coords_bert[0], p.coords_bert[1] + 1) for p in phrases], self.filt)
+        for phrase, summary, keep in zip(phrases, summaries, has_tokens):
+            phrase.summarized_embedding = summary if keep else ''
+
     def getFlatListPhraseEmbeddings(self, phrase_types, include_context, include_attention):
         phrase_list = []
         gold_label_list = []
@@ -201,15 +267,26 @@ class SentenceObj(object):
     def getGlobalStartCoord(self):
         return self.global_sentence_start_coord
 
+    ## Tokenizes the sentence for BERT.  If max_length is None the sentence is not padded, so short sentences do not
+    ## pay for self-attention over padding tokens.
     def bert_text_prep(self, sentence, tokenizer, max_length):
 
-        encoded_dict = tokenizer.encode_plus(sentence,
-                                             add_special_tokens=True,  # Add '[CLS]' and '[SEP]'
-                                             max_length=max_length,  # Pad & truncate all sentences.
-                                             pad_to_max_length=True,
-                                             return_attention_mask=True,  # Construct attn. masks.
-                                             return_tensors='pt',  # Return pytorch tensors.
-                                             )
+        if max_length is None:
+            encoded_dict = tokenizer.encode_plus(sentence,
+                                                 add_special_tokens=True,  # Add '[CLS]' and '[SEP]'
+                                                 max_length=MAX_BERT_LENGTH,  # Truncate to the longest BERT input.
+                                                 truncation=True,
+                                                 return_attention_mask=True,  # Construct attn. masks.
+                                                 return_tensors='pt',  # Return pytorch tensors.
+                                                 )
+        else:
+            encoded_dict = tokenizer.encode_plus(sentence,
+                                                 add_special_tokens=True,  # Add '[CLS]' and '[SEP]'
+                                                 max_length=max_length,  # Pad & truncate all sentences.
+                                                 pad_to_max_length=True,
+                                                 return_attention_mask=True,  # Construct attn. masks.
+                                                 return_tensors='pt',  # Return pytorch tensors.
+                                                 )
         # Add the encoded sentence to the list.
         indexed_tensor = encoded_dict['input_ids']
         attention_mask = encoded_dict['attention_mask']
@@ -218,6 +295,30 @@ class SentenceObj(object):
 
         return tokenized_text, indexed_tensor, segments_mask, attention_mask#, attention_tensor
 
+    ## Tokenizes a sentence with a fast tokenizer, returning the word pieces and their character offsets from the same
+    ## call rather than decoding and re-tokenizing the ids as bert_text_prep() does.
+    # @param sentence The sentence text.
+    # @param tokenizer A fast BERT tokenizer.
+    # @param max_length The length to pad and truncate to, or None to only truncate to the longest BERT input.
+    # @return The word pieces, the token ids, the segments mask, the attention mask, and the (start, end) character
+    #         offsets of each word piece in the sentence, which are (0, 0) for special tokens.
+    def bert_text_prep_fast(self, sentence, tokenizer, max_length):
+        encoded_dict = tokenizer(sentence,
+                                 add_special_tokens=True,  # Add '[CLS]' and '[SEP]'
+                                 max_length=MAX_BERT_LENGTH if max_length is None else max_length,
+                                 padding=False if max_length is None else "max_length",
+                                 truncation=True,
+                                 return_attention_mask=True,
+                                 return_offsets_mapping=True,
+                                 return_tensors='pt',
+                                 )
+        indexed_tensor = encoded_dict['input_ids']
+        attention_mask = encoded_dict['attention_mask']
+        segments_mask = torch.ones_like(indexed_tensor)
+        tokenized_text = tokenizer.convert_ids_to_tokens(indexed_tensor[0].tolist())
+
+        return tokenized_text, indexed_tensor, segments_mask, attention_mask, encoded_dict['offset_mapping'][0].tolist()
+
     def SVMPredict(self, model_svm, include_context, include_attention, label_dict=''):
         for phrase in self.datedur_phrases:
             if phrase:
@@ -272,3 +373,69 @@ class SentenceObj(object):
         return record_num
 
 
+## Reformats the hidden states of a single sentence into one embedding per token.
+# @param hidden_states The tuple of hidden state tensors for at least the last four layers, each 1 x seq_len x hidden.
+# @param attentions The tuple of attention tensors, one per layer, or None.
+# @return The list of token embeddings (the last 4 layers concatenated) and the attentions.
+def formatSentEmbeddings(hidden_states, attentions):
+    # Reformat the embedding matrix
+    token_embeddings = torch.stack(hidden_states, dim=0)  # Concatenate the tensors for all layers. We use
+    # `stack` here to create a_bert new dimension in the tensor.
+    token_embeddings = torch.squeeze(token_embeddings, dim=1)  # Remove dimension 1, the "batches".
+    token_embeddings = token_embeddings.permute(1, 0, 2)  # Swap dimensions 0 and 1.
+
+    local_bert_embeddings = utils.concat_last_4(token_embeddings)
+
+    return local_bert_embeddings, attentions
+
+
+## Groups sentences into batches of similar length.  The sentences are sorted by their tokenized length and split
+## into batches, so each batch needs as little padding as possible.
+# @param sentences The list of SentenceObj objects.
+# @param batch_size The maximum number of sentences in each batch.
+# @return A list of batches, each a list of SentenceObj objects.
+def bucketByLength(sentences, batch_size):
+    ordered = sorted(sentences, key=lambda sent: sent.tokens_tensor.size()[1])
+    return [ordered[b:b + batch_size] for b in range(0, len(ordered), batch_size)]
+
+
+## Computes the BERT embeddings for a list of sentences created without a model, running the sentences through BERT
+## in mini-batches of similar length rather than one forward pass per sentence.  Sentences that are shorter than the
+## longest in their batch are padded with an attention mask that hides the padding, and their outputs are trimmed
+## back to their own length, so each sentence gets the same embeddings it would get on its own.  Sentences that
+## already have embeddings (e.g. from the embedding cache) are skipped.
+# @param sentences The list of SentenceObj objects created with bert_model=None.
+# @param bert_model The BERT model.
+# @param batch_size The maximum number of sentences in each forward pass.
+# @return The list of sentences, with their embeddings and phrases set.
+def batchSentEmbeddings(sentences, bert_model, batch_size=16):
+    todo = [sent for sent in sentences if sent.bert_embeddings is None]
+    encoder = bert_encoder.asEncoder(bert_model)
+
+    for batch in bucketByLength(todo, batch_size):
+        lengths = [sent.tokens_tensor.size()[1] for sent in batch]
+        batch_length = max(lengths)
+        if min(lengths) == batch_length:
+            tokens_tensor = torch.cat([sent.tokens_tensor for sent in batch], dim=0)
+            mask = torch.cat([sent.getEncoderMask() for sent in batch], dim=0)
+        else:
+            ## pad with token id 0 ([PAD]) and mask the padding out
+            tokens_tensor = torch.zeros((len(batch), batch_length), dtype=batch[0].tokens_tensor.dtype)
+            mask = torch.zeros((len(batch), batch_length), dtype=batch[0].getEncoderMask().dtype)
+            for i, sent in enumerate(batch):
+                tokens_tensor[i, :lengths[i]] = sent.tokens_tensor[0]
+                mask[i, :lengths[i]] = sent.getEncoderMask()[0]
+
+        include_attention = any(sent.include_attention for sent in batch)
+        hidden_states, attentions = encoder.encode(tokens_tensor, mask, include_attention)
+
+        ## the attentions are copied so each sentence does not keep the whole batch's attentions alive
+        for i, sent in enumerate(batch):
+            n = lengths[i]
+            sent_attentions = None
+            if sent.include_attention:
+                sent_attentions = tuple(a[i:i + 1, :, :n, :n].clone() for a in attentions)
+            sent.setSentEmbeddings(*formatSentEmbeddings(tuple(h[i:i + 1, :n] for h in hidden_states), sent_attentions))
+            sent.cacheSentEmbeddings()
+
+    return sentences
@@ -0,0 +1,220 @@
+# Copyright (c) 2022
+# Amy L. Olex, Virginia Commonwealth University
+# alolex at vcu.edu
+#
+# Luke Maffey, Virginia Commonwealth University
+# maffeyl at vcu.edu
+#
+# Nicholas Morton,  Virginia Commonwealth University
+# nmorton at vcu.edu
+#
+# Bridget T. McInnes, Virginia Commonwealth University
+# btmcinnes at vcu.edu
+#
+# This file is part of Chrono
+#
+# Chrono is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# Chrono is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chrono; if not, write to
+#
+# The Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330,
+# Boston, MA  02111-1307, USA.
+
+
+## Runs BERT over tokenized sentences and returns only the outputs Chrono uses: the last four hidden states, which
+## are concatenated into the token embeddings, and the attentions, which are only requested when the attention
+## features are in use.  All other outputs are released as soon as the forward pass returns.  The encoder runs either
+## the torch model or, through OnnxBertEncoder, a graph exported with exportOnnx() on ONNX Runtime.
+
+import inspect
+import torch
+from chronoML import backends
+
+
+## The number of final hidden layers concatenated into each token embedding by bert_utils.concat_last_4().
+NUM_HIDDEN_LAYERS_USED = 4
+
+
+## Class to encode sentences with a BERT model from transformers.
+# @param bert_model The BERT model, or a handle that loads it on first use.
+class BertEncoder:
+
+    ## The constructor
+    def __init__(self, bert_model):
+        self.bert_model = bert_model
+
+    ## Runs a batch of tokenized sentences through BERT.
+    # @param tokens_tensor The batch x seq_len tensor of token ids.
+    # @param attention_mask The batch x seq_len attention mask.
+    # @param include_attention Boolean indicating if the attentions should be computed and returned.
+    # @return A tuple with the last four hidden states (each batch x seq_len x hidden), and a tuple with the attentions
+    #         of every layer (each batch x heads x seq_len x seq_len) or None if include_attention is False.
+    def encode(self, tokens_tensor, attention_mask, include_attention=True):
+        bert_model = self.bert_model
+        if isinstance(bert_model, backends.LazyModel):
+            bert_model = bert_model.getModel()
+        ## a handle may load another encoder, such as an OnnxBertEncoder, in place of the torch model
+        if isinstance(bert_model, BertEncoder):
+            return bert_model.encode(tokens_tensor, attention_mask, include_attention)
+
+        with torch.no_grad():
+            outputs = bert_model(tokens_tensor, attention_mask, output_hidden_states=True,
+                                 output_attentions=include_attention, return_dict=True)
+        hidden_states = tuple(outputs.hidden_states[-NUM_HIDDEN_LAYERS_USED:])
+        attentions = tuple(outputs.attentions) if include_attention else None
+        return hidden_states, attentions
+
+####
+#END_MODULE
+####
+
+
+## Class to encode sentences with a BERT model exported to ONNX by exportOnnx(), using ONNX Runtime on the CPU in
+## place of torch.  The outputs are returned as torch tensors so they can be used exactly like those of BertEncoder.
+# @param onnx_path The path of the exported ONNX graph.
+# @param intra_op_threads The number of threads used within each operator, or 0 to let ONNX Runtime decide.
+# @param inter_op_threads The number of threads used to run independent operators in parallel, or 0 to let ONNX
+#                         Runtime decide.
+# @param optimization The graph optimization level. One of disable, basic, extended, or all (default).
+class OnnxBertEncoder(BertEncoder):
+
+    ## The constructor.  Loads the graph into an inference session.
+    def __init__(self, onnx_path, intra_op_threads=0, inter_op_threads=0, optimization="all"):
+        import onnxruntime
+
+        levels = {"disable": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+                  "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+                  "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+                  "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL}
+        if optimization not in levels:
+            raise ValueError("Unknown ONNX graph optimization level " + str(optimization) + ". Must be one of " +
+                             ", ".join(levels) + ".")
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = levels[optimization]
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+
+        super().__init__(None)
+        self.onnx_path = onnx_path
+        self.session = onnxruntime.InferenceSession(onnx_path, sess_options=options,
+                                                    providers=["CPUExecutionProvider"])
+        output_names = [output.name for output in self.session.get_outputs()]
+        self.hidden_state_names = [name for name in output_names if name.startswith("hidden_state_")]
+        self.attention_names = [name for name in output_names if name.startswith("attention_")]
+
+    ## Runs a batch of tokenized sentences through the ONNX graph.
+    # @param tokens_tensor The batch x seq_len tensor of token ids.
+    # @param attention_mask The batch x seq_len attention mask.
+    # @param include_attention Boolean indicating if the attentions should be returned.
+    # @return The same outputs as BertEncoder.encode().
+    def encode(self, tokens_tensor, attention_mask, include_attention=True):
+        if include_attention and not self.attention_names:
+            raise ValueError("The ONNX graph " + str(self.onnx_path) + " was exported without attentions. Re-export "
+                             "it with --includeAttention to use the attention features.")
+
+        names = self.hidden_state_names + (self.attention_names if include_attention else [])
+        outputs = self.session.run(names, {"input_ids": tokens_tensor.numpy().astype("int64"),
+                                           "attention_mask": attention_mask.numpy().astype("int64")})
+        outputs = [torch.from_numpy(output) for output in outputs]
+
+        hidden_states = tuple(outputs[:len(self.hidden_state_names)])
+        attentions = tuple(outputs[len(self.hidden_state_names):]) if include_attention else None
+        return hidden_states, attentions
+
+####
+#END_MODULE
+####
+
+
+## Module used to export only the outputs of BERT that Chrono uses to ONNX.
+class _OnnxExportWrapper(torch.nn.Module):
+
+    def __init__(self, bert_model, include_attention):
+        super().__init__()
+        self.bert_model = bert_model
+        self.include_attention = include_attention
+
+    def forward(self, input_ids, attention_mask):
+        outputs = self.bert_model(input_ids, attention_mask, output_hidden_states=True,
+                                  output_attentions=self.include_attention, return_dict=True)
+        hidden_states = tuple(outputs.hidden_states[-NUM_HIDDEN_LAYERS_USED:])
+        return hidden_states + (tuple(outputs.attentions) if self.include_attention else ())
+
+####
+#END_MODULE
+####
+
+
+## Exports a BERT model to an ONNX graph with only the last four hidden states as outputs, plus the attentions of
+## every layer if they are included.  The batch size and sentence length are left dynamic.
+# @param bert_model The torch BERT model.
+# @param onnx_path The path to write the ONNX graph to.
+# @param include_attention Boolean indicating if the attentions should be exported too.
+# @param opset_version The ONNX opset version to export with.
+def exportOnnx(bert_model, onnx_path, include_attention=True, opset_version=14):
+    bert_model.eval()
+    output_names = ["hidden_state_" + str(i) for i in range(0, NUM_HIDDEN_LAYERS_USED)]
+    if include_attention:
+        output_names += ["attention_" + str(i) for i in range(0, bert_model.config.num_hidden_layers)]
+
+    dynamic_axes = {"input_ids": {0: "batch", 1: "sequence"}, "attention_mask": {0: "batch", 1: "sequence"}}
+    for name in output_names:
+        dynamic_axes[name] = {0: "batch", 2: "sequence", 3: "sequence"} if name.startswith("attention_") \
+            else {0: "batch", 1: "sequence"}
+
+    ## the wrapper must be in eval mode too, or the exporter restores it and the BERT model to training mode afterwards
+    wrapper = _OnnxExportWrapper(bert_model, include_attention).eval()
+    dummy_ids = torch.ones(1, 8, dtype=torch.long)
+    ## newer torch versions may default to the dynamo exporter, which does not take dynamic_axes the same way; older
+    ## versions (such as 1.10) do not have the argument and always use the TorchScript exporter
+    export_options = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(wrapper, (dummy_ids, torch.ones_like(dummy_ids)),
+                          onnx_path, input_names=["input_ids", "attention_mask"], output_names=output_names,
+                          dynamic_axes=dynamic_axes, opset_version=opset_version, **export_options)
+
+####
+#END_MODULE
+####
+
+
+## Finds the largest difference between the outputs of two encoders on the same input.
+# @param reference The reference encoder, such as the torch BertEncoder.
+# @param candidate The encoder to check, such as an OnnxBertEncoder.
+# @param tokens_tensor The batch x seq_len tensor of token ids.
+# @param attention_mask The batch x seq_len attention mask.
+# @param include_attention Boolean indicating if the attentions should be compared too.
+# @return The largest absolute difference between any of the outputs.
+def maxEncoderDifference(reference, candidate, tokens_tensor, attention_mask, include_attention=True):
+    ref_hidden, ref_attn = reference.encode(tokens_tensor, attention_mask, include_attention)
+    cand_hidden, cand_attn = candidate.encode(tokens_tensor, attention_mask, include_attention)
+    pairs = list(zip(ref_hidden, cand_hidden)) + (list(zip(ref_attn, cand_attn)) if include_attention else [])
+    return max(torch.max(torch.abs(r - c)).item() for r, c in pairs)
+
+####
+#END_MODULE
+####
+
+
+## Wraps a BERT model in a BertEncoder unless it already is an encoder.
+# @param bert_model A BERT model, a handle to one, or a BertEncoder.
+# @return A BertEncoder.
+def asEncoder(bert_model):
+    if isinstance(bert_model, BertEncoder):
+        return bert_model
+    return BertEncoder(bert_model)
+
+####
+#END_MODULE
+####
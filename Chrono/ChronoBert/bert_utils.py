@@ -37,17 +37,13 @@
 
 import torch
 import numpy as np
-import tokenizations
+import bisect
 import numpy
 import re
 from itertools import count, groupby
 from operator import itemgetter
-from sklearn.model_selection import StratifiedKFold
-import joblib
-import pandas as pd
-import tensorflow as tf
-from tensorflow.python.keras.preprocessing.sequence import pad_sequences
-from transformers import BertTokenizer, BertForTokenClassification
+## sklearn, joblib, pandas, tensorflow, tokenizations and transformers are only needed by the training and evaluation
+## helpers, so they are imported inside those functions to keep them off the inference start up path.
 
 def convert_to_sentence_classification(s):
     """
@@ -201,7 +197,7 @@ def get_max_length(sentences, tokenizer):
     return max_len
 
 
-def bert_text_preparation(sentences, tokenizer):
+def bert_text_preparation(sentences, tokenizer, dynamic_padding=False):
     """Preparing the input for BERT
 
     Takes a_bert string argument and performs
@@ -215,6 +211,10 @@ def bert_text_preparation(sentences, tokenizer):
         tokenizer_bert (obj): Tokenizer object
             to convert text into BERT-re-
             adable tokens and ids
+        dynamic_padding (bool): If True each
+            sentence is only padded to its
+            own length instead of the long-
+            est sentence in the corpus
 
     Returns:
         list: List of BERT-readable tokens
@@ -228,7 +228,7 @@ def bert_text_preparation(sentences, tokenizer):
     """
     #print("Number of input sentences: " + str(len(sentences)))
     # Get maximum length of sentences
-    max_length = get_max_length(sentences, tokenizer)
+    max_length = None if dynamic_padding else get_max_length(sentences, tokenizer)
 
     indexed_tensor = []
     attention_tensor = []
@@ -237,14 +237,24 @@ def bert_text_preparation(sentences, tokenizer):
 
     # For every sentence...
     for sent in sentences:
-        encoded_dict = tokenizer.encode_plus(
-            sent,  # Sentence to encode.
-            add_special_tokens=True,  # Add '[CLS]' and '[SEP]'
-            max_length=max_length,  # Pad & truncate all sentences.
-            pad_to_max_length=True,
-            return_attention_mask=True,  # Construct attn. masks.
-            return_tensors='pt',  # Return pytorch tensors.
-        )
+        if dynamic_padding:
+            encoded_dict = tokenizer.encode_plus(
+                sent,  # Sentence to encode.
+                add_special_tokens=True,  # Add '[CLS]' and '[SEP]'
+                max_length=512,  # Truncate to the longest BERT input.
+                truncation=True,
+                return_attention_mask=True,  # Construct attn. masks.
+                return_tensors='pt',  # Return pytorch tensors.
+            )
+        else:
+            encoded_dict = tokenizer.encode_plus(
+                sent,  # Sentence to encode.
+                add_special_tokens=True,  # Add '[CLS]' and '[SEP]'
+                max_length=max_length,  # Pad & truncate all sentences.
+                pad_to_max_length=True,
+                return_attention_mask=True,  # Construct attn. masks.
+                return_tensors='pt',  # Return pytorch tensors.
+            )
 
         # Add the encoded sentence to the list.
         indexed_tensor.append(encoded_dict['input_ids'])
@@ -292,6 +302,7 @@ def get_phrase_groups_with_labels(bert_indexes_with_labels):
 
 def pull_date_dur_embeddings(model_sents, orig_sents, model_embedings, orig_duration_idxs, orig_date_idxs,
                              filter=False, merge=False):
+    import tokenizations
     my_text = []
     my_embeddings = []
     my_labels = []
@@ -436,6 +447,7 @@ def pull_date_dur_embeddings(model_sents, orig_sents, model_embedings, orig_dura
 
 def pull_date_dur_embeddings2(model_sents, orig_sents, model_embedings, orig_duration_idxs, orig_date_idxs,
                              filter=False, merge=False):
+    import tokenizations
     my_text = []
     my_embeddings = []
     my_labels = []
@@ -580,6 +592,9 @@ def pull_date_dur_embeddings2(model_sents, orig_sents, model_embedings, orig_dur
 
 
 def prep_for_svm(filename, model, tokenizer, fold=5, for_eval=True, saveas='', has_labels=True):
+    from sklearn.model_selection import StratifiedKFold
+    import joblib
+
     f = open(filename)
     lines = f.readlines()
     f.close()
@@ -625,6 +640,11 @@ def prep_for_svm(filename, model, tokenizer, fold=5, for_eval=True, saveas='', h
 
 
 
+## The tokens removed from phrases when filtering is on.
+FILTER_TOKENS = ["at", "of", "the", "a", "on", "which", "this", "then", "that", "to", ".", "/", "-", ":", ";", ",",
+                 "#", "&"]
+
+
 def concat_last_4(token_embeddings):
     """Combine embeddings to get one vector per token
 
@@ -632,120 +652,114 @@ def concat_last_4(token_embeddings):
         token_embeddings (obj): Torch tensor size [n_tokens][m_layers][i_hidden_states]
 
     Returns:
-        list: List of list of floats of size
+        obj: Torch tensor of size
             [n_tokens, n_embedding_dimensions]
             containing embeddings for each token
 
     """
-    # concatenate the last 4 layers:
-    # Stores the token vectors, with shape [n_tokens x (4 x i_hidden_states)]
-    token_vecs_cat = []
+    # concatenate the last 4 layers, last layer first, in one call rather than token by token.
+    # Each layer vector is 768 values, so each token vector is length 3,072.
+    return torch.cat((token_embeddings[:, -1], token_embeddings[:, -2], token_embeddings[:, -3],
+                      token_embeddings[:, -4]), dim=1)
 
-    # For each token in the sentence...
-    for token in token_embeddings:
-        # `token` is a_bert [m_layers x i_hidden_states] tensor
 
-        # Concatenate the vectors (that is, append them together) from the last
-        # four layers.
-        # Each layer vector is 768 values, so `cat_vec` is length 3,072.
-        cat_vec = torch.cat((token[-1], token[-2], token[-3], token[-4]), dim=0)
+def embeddingMatrix(sent_embeddings):
+    """Returns the token embeddings of a sentence as a single tensor.
 
-        # Use `cat_vec` to represent `token`.
-        token_vecs_cat.append(cat_vec)
+    Args:
+        sent_embeddings: BERT token embeddings, as a [n_tokens, n_embedding_dimensions] tensor or a list of tensors.
 
-    return token_vecs_cat
+    Returns:
+        obj: Torch tensor of size [n_tokens, n_embedding_dimensions].
 
-def summarizeEmbeddingAvg(bert_sent, sent_embeddings, this_coords, this_filter, this_merge):
+    """
+    if isinstance(sent_embeddings, torch.Tensor):
+        return sent_embeddings
+    return torch.stack(list(sent_embeddings))
 
-    to_remove = []
-    if this_filter:
-        to_remove = ["at", "of", "the", "a", "on", "which", "this", "then", "that", "to", ".", "/", "-", ":", ";", ",",
-                     "#", "&"]
 
-    sum_embedding = 0  ## sum all of the embeddings for this phrase, then calc average after loop
+def filterMask(bert_sent, this_filter):
+    """Marks the tokens of a sentence that are kept in phrase embeddings.
 
-    # phrase length counter for filtered phrases
-    filt_length = 0
-    full_phrase_length = len(bert_sent[this_coords[0]:this_coords[1]+1])
+    Args:
+        bert_sent: sentence text tokenized by BERT
+        this_filter: TRUE or FALSE depending on if stop words and punctuation should be removed.
 
-    embedding_list = []
-    start_coord = max(0,this_coords[0])
-    end_coord = min(this_coords[1]+1, len(bert_sent))
+    Returns:
+        obj: Boolean torch tensor of size [n_tokens], True for the tokens to keep.
 
-    ## k is the BERT index for this token in the phrase
-    ## for each BERT token in the phrase filter out or extract the embedding
-    for k in range(start_coord, end_coord):
-        if this_filter and bert_sent[k] not in to_remove: #and not re.match("[0-9]*", bert_sent[k]).group(0):
+    """
+    if not this_filter:
+        return torch.ones(len(bert_sent), dtype=torch.bool)
+    return torch.tensor([tok not in FILTER_TOKENS for tok in bert_sent], dtype=torch.bool)
 
-            filt_length = filt_length + 1
-            if this_merge:
-                sum_embedding = sum_embedding + sent_embeddings[k]
-            else:
-                embedding_list.append(sent_embeddings[k])
 
-        elif not this_filter:  ## else if self.filter is False then include all the tokens
-            if this_merge:
-                sum_embedding = sum_embedding + sent_embeddings[k]
-            else:
-                embedding_list.append(sent_embeddings[k])
+def filterTokenIndexes(bert_sent, token_idx_list, this_filter):
+    """Converts a list of token indexes to an index tensor, removing the filtered tokens.
 
-    # if merging phrase tokens, then append to the global tracking variables
-    div_length = filt_length if this_filter else full_phrase_length
-    if this_merge and div_length > 0:  ## if div_length is zero then the full phrase was removed so don't add anything.
-        embedding_list.append(sum_embedding / div_length)
-    else:
-        embedding_list.append('')
+    Args:
+        bert_sent: sentence text tokenized by BERT
+        token_idx_list: list, array or tensor of bert token indexes
+        this_filter: TRUE or FALSE depending on if stop words and punctuation should be removed.
 
-    if len(embedding_list) == 1:
-        return embedding_list[0]
-    else:
-        return embedding_list
+    Returns:
+        obj: Long torch tensor with the indexes of the tokens to keep, in the same order.
 
+    """
+    idx = torch.as_tensor(numpy.asarray(token_idx_list, dtype=numpy.int64).reshape(-1))
+    if this_filter and len(idx) > 0:
+        idx = idx[filterMask(bert_sent, this_filter)[idx]]
+    return idx
 
-def summarizeEmbeddingAvgDisconnected(bert_sent, sent_embeddings, this_tokens, this_filter, this_merge):
 
-    to_remove = []
-    if this_filter:
-        to_remove = ["at", "of", "the", "a", "on", "which", "this", "then", "that", "to", ".", "/", "-", ":", ";", ",",
-                     "#", "&"]
+def summarizeEmbeddingAvg(bert_sent, sent_embeddings, this_coords, this_filter, this_merge):
+    # the phrase is every token from the first to the last coordinate
+    start_coord = max(0, this_coords[0])
+    end_coord = min(this_coords[1] + 1, len(bert_sent))
+    return summarizeEmbeddingAvgDisconnected(bert_sent, sent_embeddings, range(start_coord, max(start_coord, end_coord)),
+                                             this_filter, this_merge)
 
-    sum_embedding = torch.tensor(0)  ## sum all of the embeddings for this phrase, then calc average after loop
 
-    # phrase length counter for filtered phrases
-    filt_length = 0
-    full_phrase_length = len(this_tokens)
+def summarizeEmbeddingAvgDisconnected(bert_sent, sent_embeddings, this_tokens, this_filter, this_merge):
+    ## select the embeddings of the tokens kept after filtering with a single index
+    embeddings = embeddingMatrix(sent_embeddings)[filterTokenIndexes(bert_sent, this_tokens, this_filter)]
 
-    embedding_list = []
+    if not this_merge:
+        embedding_list = list(embeddings) + ['']
+        return embedding_list[0] if len(embedding_list) == 1 else embedding_list
 
-    ## k is the BERT index for this token in the phrase
-    ## for each BERT token in the phrase filter out or extract the embedding
-    for k in this_tokens:
+    ## if no tokens are left then the full phrase was removed so don't add anything.
+    if len(embeddings) == 0:
+        return ''
+    return embeddings.mean(dim=0)
 
-        if this_filter and bert_sent[k] not in to_remove: #and not re.match("[0-9]*", bert_sent[k]).group(0):
 
-            filt_length = filt_length + 1
-            if this_merge:
-                sum_embedding = sum_embedding + sent_embeddings[k]
-            else:
-                embedding_list.append(sent_embeddings[k])
+def summarizeEmbeddingAvgBatch(bert_sent, sent_embeddings, token_idx_lists, this_filter):
+    """Averages the token embeddings of many phrases in the same sentence with a single matrix product.
 
-        elif not this_filter:  ## else if self.filter is False then include all the tokens
-            if this_merge:
-                sum_embedding = sum_embedding + sent_embeddings[k]
-            else:
-                embedding_list.append(sent_embeddings[k])
+    Args:
+        bert_sent: sentence text tokenized by BERT
+        sent_embeddings: BERT token embeddings
+        token_idx_lists: list with the list of bert token indexes for each phrase
+        this_filter: TRUE or FALSE depending on if stop words and punctuation should be removed.
 
-    # if merging phrase tokens, then append to the global tracking variables
-    div_length = filt_length if this_filter else full_phrase_length
-    if this_merge and div_length > 0:  ## if div_length is zero then the full phrase was removed so don't add anything.
-        embedding_list.append(sum_embedding / div_length)
-    else:
-        embedding_list.append('')
+    Returns:
+        obj: Torch tensor of size [n_phrases, n_embedding_dimensions] with the average embedding of each phrase,
+            and a boolean torch tensor of size [n_phrases] that is False for phrases with no tokens left, whose rows
+            are all zeros.
+
+    """
+    embeddings = embeddingMatrix(sent_embeddings)
+    weights = torch.zeros(len(token_idx_lists), len(embeddings), dtype=embeddings.dtype)
+    for i, token_idx_list in enumerate(token_idx_lists):
+        idx = filterTokenIndexes(bert_sent, token_idx_list, this_filter)
+        weights[i].index_add_(0, idx, torch.ones(len(idx), dtype=embeddings.dtype))
+
+    counts = weights.sum(dim=1)
+    has_tokens = counts > 0
+    weights[has_tokens] = weights[has_tokens] / counts[has_tokens].unsqueeze(1)
+    return weights @ embeddings, has_tokens
 
-    if len(embedding_list) == 1:
-        return embedding_list[0]
-    else:
-        return embedding_list
 
 def getEmbeddingMtxDisconnected(bert_sent, sent_embeddings, token_idx_list, this_filter):
     """Extracts token embeddings for a list of tokens
@@ -757,62 +771,80 @@ def getEmbeddingMtxDisconnected(bert_sent, sent_embeddings, token_idx_list, this
         this_filter: TRUE or FALSE depending on if stop words and punctuation should be removed.
 
     Returns:
-        list: List of torch tensors for phrase.
+        obj: Torch tensor of size [n_kept_tokens, n_embedding_dimensions] for phrase.
+
+    """
+    return embeddingMatrix(sent_embeddings)[filterTokenIndexes(bert_sent, token_idx_list, this_filter)]
+
+
+def getEmbeddingMtxBatch(bert_sent, sent_embeddings, token_idx_lists, this_filter, pad_to):
+    """Extracts the padded token embedding matrices of many phrases in the same sentence.
+
+    Args:
+        bert_sent: sentence text tokenized by BERT
+        sent_embeddings: BERT token embeddings
+        token_idx_lists: list with the list of bert token indexes for each phrase
+        this_filter: TRUE or FALSE depending on if stop words and punctuation should be removed.
+        pad_to: integer with pad length.
+
+    Returns:
+        obj: Torch tensor of size [n_phrases, pad_to, n_embedding_dimensions].
 
     """
-    to_remove = []
-    if this_filter:
-        ##print("filtering...")
-        to_remove = ["at", "of", "the", "a", "on", "which", "this", "then", "that", "to", ".", "/", "-", ":", ";", ",",
-                     "#", "&"]
+    embeddings = embeddingMatrix(sent_embeddings)
+    ## gather every phrase with one index, using the zero row appended at the end for the padding
+    padded = torch.cat((embeddings, torch.zeros(1, embeddings.size(1), dtype=embeddings.dtype)))
+    gather_idx = torch.full((len(token_idx_lists), pad_to), len(embeddings), dtype=torch.long)
+    for i, token_idx_list in enumerate(token_idx_lists):
+        idx = filterTokenIndexes(bert_sent, token_idx_list, this_filter)[:pad_to]
+        gather_idx[i, :len(idx)] = idx
+    return padded[gather_idx]
 
-    embedding_list = []
 
-    ## k is the BERT index for this token in the phrase
-    ## for each BERT token in the phrase filter out or extract the embedding
-    ##print("getting matrix for tokens: " + str(token_idx_list))
-    for k in token_idx_list:
+def alignWhitespaceToBert(text, offsets):
+    """Maps each whitespace token of a sentence to the BERT tokens it was split into, using the character offsets
+    returned by a fast tokenizer.
 
-        if this_filter and bert_sent[k] not in to_remove: #and not re.match("[0-9]*", bert_sent[k]).group(0):
-            embedding_list.append(sent_embeddings[k])
+    Args:
+        text: the sentence text
+        offsets: list of (start, end) character offsets of each BERT token in text, with (0, 0) for special tokens
 
-        elif not this_filter:  ## else if self.filter is False then include all the tokens
-            ##print(bert_sent[k])
-            embedding_list.append(sent_embeddings[k])
+    Returns:
+        list: For each token in text.split(), the list of indexes of the BERT tokens within it, which is empty if
+            the token was truncated away.
+
+    """
+    starts = []
+    ends = []
+    for match in re.finditer(r"\S+", text):
+        starts.append(match.start())
+        ends.append(match.end())
+
+    a2b = [[] for i in range(0, len(starts))]
+    for b, (start, end) in enumerate(offsets):
+        if end <= start:
+            continue
+        w = bisect.bisect_right(starts, start) - 1
+        if w >= 0 and start < ends[w]:
+            a2b[w].append(b)
+    return a2b
 
-    return embedding_list
 
 def padMtx(vec_list, pad_to):
-    """Adds or crops a list of torch tensors to pad_tp length.
+    """Adds or crops a matrix of token embeddings to pad_tp rows.
 
     Args:
-        vec_list: list of torch tensors
+        vec_list: torch tensor of size [n_tokens, n_embedding_dimensions], or a list of torch tensors
         pad_to: integer with pad length.
 
     Returns:
-        list: List of torch tensors with length set to pad_to.
+        obj: Torch tensor of size [pad_to, n_embedding_dimensions].
 
     """
-    ##print("length of incoming list: " + str(vec_list))
-    ##print("padding: " + str(pad_to))
-
-    if len(vec_list) < pad_to:
-        to_add = pad_to - len(vec_list)
-        dim = vec_list[0].size()[0]
-        #print("Adding padding: " + str(to_add) + " With dim: " + str(dim))
-
-        for m in list(range(0, to_add)):
-            vec_list.extend([torch.zeros(dim, dtype=int)])
-            ##print("For m=" + str(m) + " vec list length = " + str(len(vec_list)) + " vec content: " + str(vec_list))
-        return vec_list
-    elif len(vec_list) > pad_to:
-        ##print("removing padding")
-        to_rm = (len(vec_list) - pad_to)*-1
-        #print("removing padding: " + str(to_rm))
-        return vec_list[0:pad_to]
-    else:
-        #print("returning as-is")
-        return vec_list
+    mtx = embeddingMatrix(vec_list)
+    if len(mtx) < pad_to:
+        return torch.cat((mtx, torch.zeros(pad_to - len(mtx), mtx.size(1), dtype=mtx.dtype)))
+    return mtx[0:pad_to]
 
 
 
@@ -912,6 +944,7 @@ def merge_label_pieces(orig_sentences, tokenized_texts, tokenized_labels):
     Returns:
         converted_labels: A list of labels merged to match the whitespace tokenized sentences.
     """
+    import tokenizations
     #print(len(orig_sentences))
     #print(len(tokenized_texts))
     #print("Length of tokenized_labels: " + str(len(tokenized_labels)))
@@ -999,6 +1032,7 @@ def merge_phrase_pieces(labeled_tokens):
     Returns:
         converted_phrases: A dataframe of tokens merged to contain the whole phrase.
     """
+    import pandas as pd
 
     #print("Length of df: " + str(len(labeled_tokens)))
     #["id", "label", "start", "end", "text"]
@@ -1083,6 +1117,7 @@ def load_bert(filepath):
     :return mod: Returns the pre-trained BERT model.
     :return tok: Returns a tokenizer object.
     """
+    from transformers import BertTokenizer, BertForTokenClassification
 
     tok = BertTokenizer.from_pretrained(filepath, do_lower_case=True)
     mod = BertForTokenClassification.from_pretrained(
@@ -1104,6 +1139,7 @@ def seq2seq_text_prep(test_sentences, tokenizer, tag2idx, max_length, test_label
         :return sents: Returns tokenized sentences for seq2seq prediction or training.
         :return labs: Returns labels for training use.
     """
+    from tensorflow.python.keras.preprocessing.sequence import pad_sequences
 
     if test_labels:
         # Tokenize and format into 2 lists of lists.
@@ -1137,6 +1173,7 @@ def mergeLenient(gold, pred):
         :param pred: the predicted data frame of results.
         :return df: a pandas dataframe with matched predicted data.
     """
+    import pandas as pd
 
     ## Input dataframe structure: "id", "label", "start", "end", "text", "context", "coords"
     #df = pd.DataFrame(columns=["gold_id", "gold_label", "gold_start", "gold_end", "gold_text", "gold_context", "gold_coords",
@@ -1210,6 +1247,8 @@ def num_attention_heads(attention):
 
 
 def create_cnn_model(num_filters, kernel_size1, kernel_size2, pool_size, stride, dropout, input_dim):
+    import tensorflow as tf
+
     model = tf.keras.Sequential()
     model.add(tf.keras.layers.Conv1D(num_filters, kernel_size1, activation='relu', input_shape = input_dim, padding="valid"))
     model.add(tf.keras.layers.MaxPooling1D(pool_size=pool_size, strides=stride, padding="valid"))
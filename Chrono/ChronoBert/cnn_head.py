@@ -0,0 +1,130 @@
+# Copyright (c) 2022
+# Amy L. Olex, Virginia Commonwealth University
+# alolex at vcu.edu
+#
+# Luke Maffey, Virginia Commonwealth University
+# maffeyl at vcu.edu
+#
+# Nicholas Morton,  Virginia Commonwealth University
+# nmorton at vcu.edu
+#
+# Bridget T. McInnes, Virginia Commonwealth University
+# btmcinnes at vcu.edu
+#
+# This file is part of Chrono
+#
+# Chrono is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# Chrono is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chrono; if not, write to
+#
+# The Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330,
+# Boston, MA  02111-1307, USA.
+
+
+
+
+## Runs the ChronoBERT CNN DATE/DURATION classifier built by bert_utils.create_cnn_model() with NumPy, so Chrono does
+## not have to load TensorFlow just to classify phrases with --cnn.  The trained Keras model is exported once with
+## exportCnnWeights() (see ChronoCnnExport.py) to a .npz bundle holding the weights of each layer and a JSON
+## description of the layer stack, which NumpyCnn then evaluates with the same forward pass as Keras.
+
+import json
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+## The Keras layer types NumpyCnn can evaluate.
+SUPPORTED_LAYERS = ("Conv1D", "MaxPooling1D", "Dropout", "Flatten", "Dense")
+
+## The activation functions NumpyCnn can evaluate.
+ACTIVATIONS = {"linear": lambda x: x,
+               "relu": lambda x: np.maximum(x, 0),
+               "tanh": np.tanh,
+               "sigmoid": lambda x: 1 / (1 + np.exp(-x))}
+
+
+## Exports the weights and layer configuration of a trained Keras CNN to a .npz bundle that NumpyCnn can load.
+# @param keras_model The trained Keras Sequential model from bert_utils.create_cnn_model().
+# @param npz_path The path to write the bundle to.
+# @return The list of layer descriptions written to the bundle.
+def exportCnnWeights(keras_model, npz_path):
+    layers = []
+    arrays = {}
+    for layer in keras_model.layers:
+        layer_type = layer.__class__.__name__
+        if layer_type not in SUPPORTED_LAYERS:
+            raise ValueError("The " + layer_type + " layer " + layer.name + " can not be exported to NumPy.")
+        config = layer.get_config()
+
+        spec = {"type": layer_type}
+        if layer_type == "Conv1D":
+            if config.get("padding", "valid") != "valid" or tuple(config.get("dilation_rate", (1,))) != (1,):
+                raise ValueError("Only Conv1D layers with valid padding and no dilation can be exported to NumPy.")
+            spec.update({"strides": int(config["strides"][0]), "activation": config["activation"]})
+        elif layer_type == "MaxPooling1D":
+            if config.get("padding", "valid") != "valid":
+                raise ValueError("Only MaxPooling1D layers with valid padding can be exported to NumPy.")
+            spec.update({"pool_size": int(config["pool_size"][0]), "strides": int(config["strides"][0])})
+        elif layer_type == "Dense":
+            spec.update({"activation": config["activation"]})
+
+        if layer_type in ("Conv1D", "Dense"):
+            if spec["activation"] not in ACTIVATIONS:
+                raise ValueError("The " + spec["activation"] + " activation of layer " + layer.name + " is not supported.")
+            kernel, bias = layer.get_weights()
+            arrays["kernel_" + str(len(layers))] = np.asarray(kernel, dtype=np.float32)
+            arrays["bias_" + str(len(layers))] = np.asarray(bias, dtype=np.float32)
+        layers.append(spec)
+
+    np.savez(npz_path, layers=np.array(json.dumps(layers)), **arrays)
+    return layers
+
+####
+#END_MODULE
+####
+
+
+## Class to evaluate a ChronoBERT CNN exported by exportCnnWeights().  It has the same predict() as the Keras model,
+## so it can be used in place of it by bert_classify() and bert_classify_batch().
+# @param npz_path The path of the exported .npz bundle.
+class NumpyCnn:
+
+    ## The constructor
+    def __init__(self, npz_path):
+        with np.load(npz_path, allow_pickle=False) as bundle:
+            self.layers = json.loads(str(bundle["layers"]))
+            for i, spec in enumerate(self.layers):
+                if spec["type"] in ("Conv1D", "Dense"):
+                    spec["kernel"] = bundle["kernel_" + str(i)]
+                    spec["bias"] = bundle["bias_" + str(i)]
+
+    ## Runs the forward pass of the CNN.  Dropout is only applied when training, so it is skipped.
+    # @param x A (phrases, rows, features) array of phrase matrices from PhraseObj.getMtxFormattedPhrase().
+    # @return A (phrases, 1) array with the DATE probability of each phrase, as returned by the Keras model.
+    def predict(self, x):
+        x = np.asarray(x, dtype=np.float32)
+        for spec in self.layers:
+            if spec["type"] == "Conv1D":
+                ## windows has shape (phrases, steps, features, kernel_size)
+                windows = sliding_window_view(x, spec["kernel"].shape[0], axis=1)[:, ::spec["strides"]]
+                x = ACTIVATIONS[spec["activation"]](np.einsum("ntck,kcf->ntf", windows, spec["kernel"]) + spec["bias"])
+            elif spec["type"] == "MaxPooling1D":
+                x = sliding_window_view(x, spec["pool_size"], axis=1)[:, ::spec["strides"]].max(axis=-1)
+            elif spec["type"] == "Flatten":
+                x = x.reshape(len(x), -1)
+            elif spec["type"] == "Dense":
+                x = ACTIVATIONS[spec["activation"]](x @ spec["kernel"] + spec["bias"])
+        return x
+
+####
+#END_MODULE
+####
@@ -0,0 +1,150 @@
+# Copyright (c) 2022
+# Amy L. Olex, Virginia Commonwealth University
+# alolex at vcu.edu
+#
+# Luke Maffey, Virginia Commonwealth University
+# maffeyl at vcu.edu
+#
+# Nicholas Morton,  Virginia Commonwealth University
+# nmorton at vcu.edu
+#
+# Bridget T. McInnes, Virginia Commonwealth University
+# btmcinnes at vcu.edu
+#
+# This file is part of Chrono
+#
+# Chrono is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# Chrono is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chrono; if not, write to
+#
+# The Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330,
+# Boston, MA  02111-1307, USA.
+
+
+## Caches the BERT tokenization, hidden states, and attentions computed for a sentence so they are only computed once
+## per sentence and model.  Entries are kept in memory up to a byte budget, evicting the least recently used first,
+## and can optionally be written to a directory on disk so later runs over the same corpus skip the encoder.
+
+import hashlib
+import os
+from collections import OrderedDict
+import torch
+
+
+## Counts the bytes held by the tensors in a cache entry.
+# @param value A tensor, or a list, tuple, or dictionary containing tensors.
+# @return The number of bytes.
+def entrySize(value):
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+    if isinstance(value, dict):
+        return sum(entrySize(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(entrySize(v) for v in value)
+    return 0
+
+####
+#END_MODULE
+####
+
+
+## Class to cache per-sentence BERT outputs for a single model.
+# @param model_id A string identifying the BERT model, such as its path.  Entries from other models are never reused.
+# @param max_bytes The memory budget for cached tensors.
+# @param cache_dir A directory to persist entries to, or None to only cache in memory.
+class EmbeddingCache:
+
+    ## The constructor
+    def __init__(self, model_id, max_bytes=512*1024*1024, cache_dir=None):
+        self.model_id = model_id
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        if cache_dir is not None and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    ## Builds the cache key for a sentence.
+    # @param text The sentence text.
+    # @param max_length The length the sentence is padded to.
+    # @return The key as a hex string.
+    def makeKey(self, text, max_length):
+        return hashlib.sha256((self.model_id + "\0" + str(max_length) + "\0" + text).encode("utf-8")).hexdigest()
+
+    ## Gets the cached outputs for a sentence, checking memory first and then the cache directory.
+    # @param text The sentence text.
+    # @param max_length The length the sentence is padded to.
+    # @return The cached entry dictionary, or None if the sentence is not cached.
+    def get(self, text, max_length):
+        key = self.makeKey(text, max_length)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits = self.hits + 1
+            return self.entries[key]
+
+        if self.cache_dir is not None:
+            path = os.path.join(self.cache_dir, key + ".pt")
+            if os.path.exists(path):
+                entry = torch.load(path)
+                self._store(key, entry)
+                self.hits = self.hits + 1
+                return entry
+
+        self.misses = self.misses + 1
+        return None
+
+    ## Adds the outputs for a sentence to the cache, and to the cache directory if there is one.
+    # @param text The sentence text.
+    # @param max_length The length the sentence is padded to.
+    # @param entry A dictionary with the tokenization, embeddings, and attentions of the sentence.
+    def put(self, text, max_length, entry):
+        key = self.makeKey(text, max_length)
+        self._store(key, entry)
+
+        if self.cache_dir is not None:
+            path = os.path.join(self.cache_dir, key + ".pt")
+            if not os.path.exists(path):
+                ## write to a temporary file and rename it so a partially written entry is never loaded
+                tmpname = path + "." + str(os.getpid()) + ".tmp"
+                torch.save(entry, tmpname)
+                os.replace(tmpname, path)
+
+    def _store(self, key, entry):
+        if key in self.entries:
+            self.total_bytes = self.total_bytes - self.sizes[key]
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        self.sizes[key] = entrySize(entry)
+        self.total_bytes = self.total_bytes + self.sizes[key]
+
+        ## evict the least recently used entries until we are within budget, always keeping the newest one
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            old_key, old_entry = self.entries.popitem(last=False)
+            self.total_bytes = self.total_bytes - self.sizes.pop(old_key)
+
+    ## Gets the number of sentences held in memory.
+    def getSize(self):
+        return len(self.entries)
+
+    ## Gets the cache statistics.
+    # @return A dictionary with the number of hits, misses, entries in memory, and bytes in memory.
+    def getStats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries), "bytes": self.total_bytes}
+
+####
+#END_MODULE
+####
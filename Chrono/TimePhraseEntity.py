@@ -36,7 +36,6 @@
 import dateutil.parser as dp
 from datetime import timedelta as td
 from Chrono import utils
-from Chrono.ChronoBert import bert_utils
 
 
 ## Class to define a TimePhrase entity parsed from the json output of TimePhrase
@@ -175,9 +174,21 @@ class TimePhraseEntity :
         
         
     
+    ## Checks if getISO() will need the BERT DATE/DURATION classifier for this phrase, so the phrases of a document
+    ## can be classified together in one batch before getISO() is called.
+    # chronolist is a list of the SCATE entities for this phrase only.
+    # @return True if the phrase has a period or interval, the same test getISO() uses to decide whether to classify it.
+    def isDateDurationCandidate(self, chronolist):
+        year,month,day,hour,minute,second,daypart,dayweek,interval,period,nth,nxt,thisx,tz,ampm,modifier,lastx,freq = utils.getPhraseEntities(chronolist)
+        return bool(interval or period)
+
     ## Uses the parsed Chrono entities to create the ISO value
     # chronolist is a list of the SCATE entities for this phrase only.
-    def getISO(self, chronolist, bert_model, bert_tokenizer, bert_classifier, includeContext, includeAttention, cnn):
+    # datedur_type is the DATE or DURATION label for this phrase if it was already classified in a batch, otherwise
+    # the phrase is classified here when needed.
+    # embedding_cache is an optional EmbeddingCache used when the phrase is classified here.
+    # bert_max_length is the length sentences are padded to for BERT, or None to not pad them.
+    def getISO(self, chronolist, bert_model, bert_tokenizer, bert_classifier, includeContext, includeAttention, cnn, datedur_type=None, embedding_cache=None, bert_max_length=256):
         
         mytype = "TIME"
         mymod = "NA"
@@ -305,9 +316,15 @@ class TimePhraseEntity :
             
             if interval or period:
                 ##print("HELLO DURATION")
-                mytype = utils.bert_classify(self.rel_token_idx_start, self.rel_token_idx_end, self.sent_text,
-                                          self.sent_membership, bert_model, bert_tokenizer, bert_classifier,
-                                             includeContext, includeAttention, cnn)
+                ## without a BERT model every period and interval is treated as a duration
+                if datedur_type is not None:
+                    mytype = datedur_type
+                elif bert_model is None:
+                    mytype = "DURATION"
+                else:
+                    mytype = utils.bert_classify(self.rel_token_idx_start, self.rel_token_idx_end, self.sent_text,
+                                              self.sent_membership, bert_model, bert_tokenizer, bert_classifier,
+                                                 includeContext, includeAttention, cnn, embedding_cache, bert_max_length)
 
 
                 if interval:
@@ -1,16 +1,7 @@
 import string
 import re
 from Chrono import chronoEntities as chrono
-import inspect
-import os
-
-global dictpath
-global FREQ
-thisfilename = inspect.getframeinfo(inspect.currentframe()).filename
-thispath = os.path.dirname(os.path.abspath(thisfilename))
-dictpath = os.path.join(thispath,"../../dictionary")
-
-FREQ = [line.rstrip() for line in open(os.path.join(dictpath,"Frequency.txt"), "r")]
+from Chrono import dictionary_registry
 
 
 def buildFrequency(s, chrono_id, chrono_list):
@@ -41,9 +32,7 @@ def hasFrequency(tpentity):
     #text_norm = text.translate(str.maketrans(string.punctuation, ' '*len(string.punctuation)))
     ## right now we are only looking at abbreviations for frequencies, so I will not transform the text or we will loose information.
     
-    search_string = "(" + "|".join(FREQ) + ")"
-    search_string = search_string.replace(".", "\.")
-    lst = re.search(search_string, text)
+    lst = dictionary_registry.getRegistry().getAlternation("Frequency").search(text)
 
     if lst is not None:
         return True, lst.group(1), lst.start(1), lst.end(1)
@@ -4,7 +4,7 @@ import numpy as np
 from Chrono import chronoEntities as chrono, utils
 from Chrono.TimePhraseToChrono.Modifier import hasNextLastThis
 from Chrono.utils import calculateSpan
-from chronoML import ChronoKeras
+from chronoML import backends
 
 
 ## Parses a TimePhrase entity's text field to determine if it contains a calendar interval or period phrase, then builds the associated chronoentity list
@@ -12,12 +12,12 @@ from chronoML import ChronoKeras
 # @param s The TimePhrase entity to parse
 # @param chronoID The current chronoID to increment as new chronoentities are added to list.
 # @param chronoList The list of chrono objects we currently have.  Will add to these.
+# @param my_class The period (1) or interval (0) class of the phrase if it was already classified with the rest of the document by classifyPeriodIntervals(), otherwise it is classified here.
 # @return chronoList, chronoID Returns the expanded chronoList and the incremented chronoID.
 ###### ISSUES: This method assumes the number is immediatly before the interval type. There is some concern about if the spans are going to be correct.  I do test for numbers written out as words, but this assumes the entire beginning of the string from TimePhrase represents the number.  If this is not the case the spans may be off.
 ###### More Issues: I created the training data incorrectly to remove the TimePhrase entity from consideration.  In order to classify from scratch we would need multiple classes: period, interval, everything else.  I only have a binary classifier here, so I need to narrow it down before trying to classify.
-def buildPeriodInterval(s, chrono_id, chrono_list, ref_list, classifier, feats):
+def buildPeriodInterval(s, chrono_id, chrono_list, ref_list, classifier, feats, my_class=None):
 
-    features = feats.copy()
     ref_Sspan, ref_Espan = s.getSpan()
     boo, val, idxstart, idxend, plural = hasPeriodInterval(s)
 
@@ -54,19 +54,9 @@ def buildPeriodInterval(s, chrono_id, chrono_list, ref_list, classifier, feats):
         # get index of overlapping reference token
         ref_idx = utils.getRefIdx(ref_list, abs_Sspan, abs_Espan)
 
-        # extract ML features
-        my_features = utils.extract_prediction_features(ref_list, ref_idx, feats.copy())
-
         # classify into period or interval
-        if classifier[1] == "NN":
-            my_class = ChronoKeras.keras_classify(classifier[0], np.array(list(my_features.values())))
-            #print("Class: " + str(my_class) + " : Start: " + str(abs_Sspan) + " : End: "+ str(abs_Espan))
-        elif classifier[1] in ("SVM", "RF"):
-            feat_array = [int(i) for i in my_features.values()]
-            my_class = classifier[0].predict([feat_array])[0]
-        else:
-            my_class = classifier[0].classify(my_features)
-            #print("Class: " + str(my_class) + " : Start: " + str(abs_Sspan) + " : End: "+ str(abs_Espan))
+        if my_class is None:
+            my_class = classifyPeriodIntervals([getPeriodIntervalFeatures(s, ref_list, feats)], classifier)[0]
 
         # if 1 then it is a period, if 0 then it is an interval
         if my_class == 1:
@@ -191,26 +181,9 @@ def buildPeriodInterval(s, chrono_id, chrono_list, ref_list, classifier, feats):
             abs_Sspan = ref_Sspan + idxstart
             abs_Espan = ref_Sspan + idxend
 
-            # get index of overlapping reference token
-            ref_idx = -1
-            for i in range(0,len(ref_list)):
-                if(utils.overlap(ref_list[i].getSpan(),(abs_Sspan,abs_Espan))):
-                    ref_idx = i
-                    break
-
-            # extract ML features
-            my_features = utils.extract_prediction_features(ref_list, ref_idx, features)
-
             # classify into period or interval
-            if(classifier[1] == "NN"):
-                my_class = ChronoKeras.keras_classify(classifier[0], np.array(list(my_features.values())))
-                #print("Class: " + str(my_class) + " : Start: " + str(abs_Sspan) + " : End: "+ str(abs_Espan))
-            elif classifier[1] in ("SVM", "RF"):
-                feat_array = [int(i) for i in my_features.values()]
-                my_class = classifier[0].predict([feat_array])[0]
-            else:
-                my_class = classifier[0].classify(my_features)
-                #print("Class: " + str(my_class) + " : Start: " + str(abs_Sspan) + " : End: "+ str(abs_Espan))
+            if my_class is None:
+                my_class = classifyPeriodIntervals([getPeriodIntervalFeatures(s, ref_list, feats)], classifier)[0]
 
              # if 1 then it is a period, if 0 then it is an interval
             if(my_class == 1):
@@ -279,6 +252,59 @@ def buildPeriodInterval(s, chrono_id, chrono_list, ref_list, classifier, feats):
         
     return chrono_list, chrono_id
 
+####
+#END_MODULE
+####
+
+
+## Extracts the ML features of a TimePhrase entity if buildPeriodInterval() needs to classify it as a period or a calendar interval.
+## Phrases that are always intervals or always periods, and phrases without a period or interval, do not need classifying.
+# @param s The TimePhrase entity to parse
+# @param ref_list The list of reference tokens for the document.
+# @param feats The feature dictionary used by the Period/Interval ML classifier.
+# @return The feature dictionary of the phrase, or None if it does not need to be classified.
+def getPeriodIntervalFeatures(s, ref_list, feats):
+    ref_Sspan, ref_Espan = s.getSpan()
+    boo, val, idxstart, idxend, plural = hasPeriodInterval(s)
+
+    if boo and (re.search("yesterday|yesterdays|tomorrow|tomorrows|today|todays|daily|/min|/week", s.getText()) or val == "Unknown"):
+        return None
+    elif not boo:
+        boo, val, idxstart, idxend, numstr = hasEmbeddedPeriodInterval(s)
+        if not boo:
+            return None
+
+    # get index of overlapping reference token
+    ref_idx = utils.getRefIdx(ref_list, ref_Sspan + idxstart, ref_Sspan + idxend)
+
+    # extract ML features
+    return utils.extract_prediction_features(ref_list, ref_idx, feats.copy())
+
+####
+#END_MODULE
+####
+
+
+## Classifies a list of period/interval candidates with a single call to the ML classifier.
+# @param feature_list The feature dictionaries from getPeriodIntervalFeatures() of each candidate.
+# @param classifier A tuple with the Period/Interval ML classifier and its method (NN, DT, RF, SVM, or NB).
+# @return A list with the class of each candidate, 1 if it is a period and 0 if it is an interval.
+def classifyPeriodIntervals(feature_list, classifier):
+    if len(feature_list) == 0:
+        return []
+
+    if classifier[1] == "NN":
+        return backends.getBackend("NN").keras_classify_batch(classifier[0], [list(f.values()) for f in feature_list])
+    elif classifier[1] in ("SVM", "RF"):
+        return list(classifier[0].predict([[int(i) for i in f.values()] for f in feature_list]))
+    else:
+        return classifier[0].classify_many(feature_list)
+
+####
+#END_MODULE
+####
+
+
 ## Takes in a TimePhrase entity and identifies if it has any period or calendar interval phrases like "week" or "days"
 # @author Amy Olex
 # @param tpentity The TimePhrase entity object being parsed
@@ -301,7 +327,7 @@ def hasPeriodInterval(tpentity):
     #print("text list: " + str(text_list))
 
     # define my period lists
-    print("TOFIX: PeriodInterval.py @ line 304: convert to using the dictionary.")
+    ## TOFIX: convert to using the dictionary.
     terms = ["decades", "decade", "yesterday", "yesterdays", "today", "todays", "tomorrow", "tomorrows", "day", "week",
              "month", "year", "daily", "weekly", "monthly", "yearly", "century", "minute", "second", "hour", "hourly",
              "days", "weeks", "months", "years", "centuries", "century", "minutes", "seconds", "hours", "time", "shortly",
@@ -385,7 +411,7 @@ def hasEmbeddedPeriodInterval(tpentity):
     text_list = text_norm.split(" ")
 
     # define my period/interval term lists
-    print("TOFIX: PeriodInterval.py @ line 388: convert to using the dictionary.")
+    ## TOFIX: convert to using the dictionary.
     terms = ["decades", "decade", "yesterday", "yesterdays", "today", "todays", "tomorrow", "tomorrows", "day", "week",
              "month", "year", "daily", "weekly", "monthly", "yearly", "century", "minute", "second", "hour", "hourly",
              "days", "weeks", "months", "years", "centuries", "century", "minutes", "seconds", "hours", "time", "shortly",
@@ -0,0 +1,189 @@
+# Copyright (c) 2022
+# Amy L. Olex, Virginia Commonwealth University
+# alolex at vcu.edu
+#
+# Luke Maffey, Virginia Commonwealth University
+# maffeyl at vcu.edu
+#
+# Nicholas Morton,  Virginia Commonwealth University
+# nmorton at vcu.edu
+#
+# Bridget T. McInnes, Virginia Commonwealth University
+# btmcinnes at vcu.edu
+#
+# This file is part of Chrono
+#
+# Chrono is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# Chrono is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chrono; if not, write to
+#
+# The Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330,
+# Boston, MA  02111-1307, USA.
+
+
+
+
+## Loads every dictionary file under dictionary/ once per process and shares it with all the modules that use them.
+## Each file is held as its tuple of lines, the frozenset of those lines, the frozenset of the words in it, and a
+## compiled regular expression matching any of its lines.  The lines and sets can be saved to a pickled snapshot
+## that short-lived worker processes load with a single read instead of opening every dictionary file.
+
+import inspect
+import os
+import pickle
+import re
+
+thisfilename = inspect.getframeinfo(inspect.currentframe()).filename
+thispath = os.path.dirname(os.path.abspath(thisfilename))
+dictpath = os.path.join(thispath, "../dictionary")
+
+## Bumped whenever the snapshot contents change so older snapshots are re-built.
+SNAPSHOT_VERSION = 1
+
+## The DictionaryRegistry shared by all modules, loaded by getRegistry().
+_registry = None
+
+
+## Gets the name, size, and modification time of every dictionary file, to tell if a snapshot is out of date.
+# @param path The dictionary directory.
+# @return A sorted tuple of (file name, size, modification time) tuples.
+def dictionarySignature(path=dictpath):
+    signature = []
+    for entry in os.scandir(path):
+        if entry.is_file() and entry.name.endswith(".txt"):
+            stat = entry.stat()
+            signature.append((entry.name, stat.st_size, stat.st_mtime_ns))
+    return tuple(sorted(signature))
+
+####
+#END_MODULE
+####
+
+
+## Class holding the contents of every dictionary file, keyed by the file name without the ".txt" extension
+## (e.g. "Frequency" or "Period-Interval").
+# @param lines A dictionary from each name to the tuple of lines in its file, with trailing whitespace removed.
+# @param signature The dictionarySignature() of the files the lines were read from.
+class DictionaryRegistry:
+
+    ## The constructor
+    def __init__(self, lines, signature=()):
+        self.lines = lines
+        self.signature = signature
+        self.sets = {name: frozenset(values) for name, values in lines.items()}
+        self.words = {name: frozenset(word for value in values for word in value.split()) for name, values in lines.items()}
+        self.patterns = {}
+
+    ## Reads every dictionary file in a directory.
+    # @param path The dictionary directory.
+    # @return A DictionaryRegistry object.
+    @classmethod
+    def fromFiles(cls, path=dictpath):
+        signature = dictionarySignature(path)
+        lines = {}
+        for name, size, mtime in signature:
+            with open(os.path.join(path, name), "r") as f:
+                lines[name[:-len(".txt")]] = tuple(line.rstrip() for line in f)
+        return cls(lines, signature)
+
+    ## Loads a snapshot saved by saveSnapshot(), if it is still up to date with the dictionary files.
+    # @param snapshot_path The snapshot file.
+    # @param path The dictionary directory.
+    # @return A DictionaryRegistry object, or None if the snapshot does not exist, can not be read, or is out of date.
+    @classmethod
+    def fromSnapshot(cls, snapshot_path, path=dictpath):
+        if not os.path.exists(snapshot_path):
+            return None
+        try:
+            with open(snapshot_path, "rb") as f:
+                snapshot = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION or snapshot.get("signature") != dictionarySignature(path):
+            return None
+
+        registry = cls.__new__(cls)
+        registry.lines = snapshot["lines"]
+        registry.signature = snapshot["signature"]
+        registry.sets = snapshot["sets"]
+        registry.words = snapshot["words"]
+        registry.patterns = {}
+        return registry
+
+    ## Saves the dictionaries to a snapshot file that fromSnapshot() can load.
+    # @param snapshot_path The snapshot file to write.
+    def saveSnapshot(self, snapshot_path):
+        snapshot = {"version": SNAPSHOT_VERSION, "signature": self.signature, "lines": self.lines,
+                    "sets": self.sets, "words": self.words}
+        ## write to a temporary file and rename it so a partially written snapshot is never read
+        tmpname = snapshot_path + "." + str(os.getpid()) + ".tmp"
+        with open(tmpname, "wb") as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpname, snapshot_path)
+
+    ## Gets the lines of a dictionary file.
+    # @param name The dictionary file name without the ".txt" extension.
+    # @return A tuple with the lines of the file, in order.
+    def getList(self, name):
+        return self.lines[name]
+
+    ## Gets the set of lines of a dictionary file.
+    # @param name The dictionary file name without the ".txt" extension.
+    # @return A frozenset of the lines of the file.
+    def getSet(self, name):
+        return self.sets[name]
+
+    ## Gets the set of whitespace separated words in a dictionary file.
+    # @param name The dictionary file name without the ".txt" extension.
+    # @return A frozenset of the words in the file.
+    def getWords(self, name):
+        return self.words[name]
+
+    ## Gets a compiled regular expression that matches any line of a dictionary file, compiling it on first use.
+    ## Periods in the lines are matched literally; any other regular expression syntax in them is kept.
+    # @param name The dictionary file name without the ".txt" extension.
+    # @return A compiled regular expression with the matched line in group 1.
+    def getAlternation(self, name):
+        pattern = self.patterns.get(name)
+        if pattern is None:
+            search_string = "(" + "|".join(self.lines[name]) + ")"
+            pattern = re.compile(search_string.replace(".", "\\."))
+            self.patterns[name] = pattern
+        return pattern
+
+####
+#END_MODULE
+####
+
+
+## Gets the DictionaryRegistry shared by all modules, loading it the first time it is needed.
+# @param snapshot_path A snapshot file to load the dictionaries from if it is up to date.  If it does not exist or is
+#                      out of date the dictionary files are read and a new snapshot is saved to it.  None to always
+#                      read the dictionary files.  Only used when the registry has not been loaded yet.
+# @return The shared DictionaryRegistry object.
+def getRegistry(snapshot_path=None):
+    global _registry
+    if _registry is None:
+        registry = None
+        if snapshot_path is not None:
+            registry = DictionaryRegistry.fromSnapshot(snapshot_path)
+        if registry is None:
+            registry = DictionaryRegistry.fromFiles()
+            if snapshot_path is not None:
+                registry.saveSnapshot(snapshot_path)
+        _registry = registry
+    return _registry
+
+####
+#END_MODULE
+####
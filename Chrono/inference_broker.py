@@ -0,0 +1,252 @@
+# Copyright (c) 2022
+# Amy L. Olex, Virginia Commonwealth University
+# alolex at vcu.edu
+#
+# Luke Maffey, Virginia Commonwealth University
+# maffeyl at vcu.edu
+#
+# Nicholas Morton,  Virginia Commonwealth University
+# nmorton at vcu.edu
+#
+# Bridget T. McInnes, Virginia Commonwealth University
+# btmcinnes at vcu.edu
+#
+# This file is part of Chrono
+#
+# Chrono is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# Chrono is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chrono; if not, write to
+#
+# The Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330,
+# Boston, MA  02111-1307, USA.
+
+
+
+
+## Runs the BERT DATE/DURATION classification for all the worker processes of a --workers run in one shared broker
+## process, so the BERT model and the ChronoBERT classifier are held in memory once instead of once per worker.
+## Workers send the DATE/DURATION candidates of each document to the broker on a request queue and wait for the
+## labels on their own response queue, giving up if the broker process exits before answering.  The broker gathers the requests that arrive close together from all the
+## workers into one micro-batch, so sentences from different workers share the same BERT batches.
+
+import multiprocessing
+import queue
+
+
+## Class to start and stop the broker process.  Use as a context manager around the worker pool.
+# @param args The parsed command line arguments from Chrono.py, used to load the BERT models in the broker.
+# @param num_clients The number of worker processes that will send requests, each of which gets its own response queue.
+# @param num_threads The number of torch threads the broker may use.
+# @param max_wait The number of seconds to wait for more requests after the first before running a micro-batch.
+# @param max_phrases The largest number of candidate phrases gathered into one micro-batch.
+# @param ctx The multiprocessing context to start the broker with.  Defaults to spawn.
+class InferenceBroker:
+
+    ## The constructor
+    def __init__(self, args, num_clients, num_threads=None, max_wait=0.005, max_phrases=256, ctx=None):
+        self.ctx = ctx if ctx is not None else multiprocessing.get_context("spawn")
+        self.request_queue = self.ctx.Queue()
+        self.response_queues = [self.ctx.Queue() for i in range(0, num_clients)]
+        ## each worker claims the next free response queue when it starts
+        self.next_client = self.ctx.Value("i", 0)
+        ## only the broker holds the sending end of this pipe, so the workers' end reads as closed once it exits
+        self.broker_sentinel, self.broker_end = self.ctx.Pipe(duplex=False)
+        self.process = self.ctx.Process(target=serveBroker,
+                                        args=(args, self.request_queue, self.response_queues, num_threads, max_wait,
+                                              max_phrases, self.broker_end),
+                                        daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    ## Starts the broker process.
+    def start(self):
+        self.process.start()
+        self.broker_end.close()
+
+    ## Asks the broker process to finish once the requests already queued are answered and waits for it to exit.
+    def stop(self):
+        if self.process.is_alive():
+            self.request_queue.put(None)
+            self.process.join()
+
+    ## Gets the arguments a worker process needs to connect to the broker with connectClient().  These can be passed
+    ## to a worker through the initargs of a multiprocessing Pool.
+    # @return A tuple with the request queue, the response queues, the shared client counter, and the broker sentinel.
+    def clientArgs(self):
+        return self.request_queue, self.response_queues, self.next_client, self.broker_sentinel
+
+####
+#END_MODULE
+####
+
+
+## Connects a worker process to the broker by claiming one of its response queues.
+# @param client_args The tuple returned by InferenceBroker.clientArgs().
+# @return A BrokerClient object.
+def connectClient(client_args):
+    request_queue, response_queues, next_client, broker_sentinel = client_args
+    with next_client.get_lock():
+        client_id = next_client.value
+        next_client.value = client_id + 1
+    if client_id >= len(response_queues):
+        raise RuntimeError("More workers connected to the inference broker than it was started for.")
+    return BrokerClient(client_id, request_queue, response_queues[client_id], broker_sentinel)
+
+####
+#END_MODULE
+####
+
+
+## Class used by a worker process to have the broker classify its DATE/DURATION candidates.  It is passed to the
+## pipeline in place of the BERT model, and bert_classify_batch() and bert_classify() hand the candidates to it.
+# @param client_id The index of this worker's response queue.
+# @param request_queue The queue shared by all the workers to send requests to the broker.
+# @param response_queue The queue the broker sends this worker's labels back on.
+# @param broker_sentinel The receiving end of a pipe that reads as closed once the broker process has exited, or None.
+# @param poll_interval The number of seconds to wait for the labels before checking that the broker is still running.
+class BrokerClient:
+
+    ## The constructor
+    def __init__(self, client_id, request_queue, response_queue, broker_sentinel=None, poll_interval=1.0):
+        self.client_id = client_id
+        self.request_queue = request_queue
+        self.response_queue = response_queue
+        self.broker_sentinel = broker_sentinel
+        self.poll_interval = poll_interval
+
+    ## Classifies the DATE/DURATION candidates of one document.
+    # @param candidates A list of (start_span, end_span, sent_text, sent_idx) tuples as passed to bert_classify_batch().
+    # @param options A tuple of (includeContext, includeAttention, cnn, max_length) for the ChronoBERT classifier.
+    # @return A list with the "DATE" or "DURATION" label of each candidate, in the same order.
+    def classify(self, candidates, options):
+        if len(candidates) == 0:
+            return []
+        self.request_queue.put((self.client_id, list(candidates), options))
+        status, result = self.waitForResponse()
+        if status != "ok":
+            raise RuntimeError("The inference broker could not classify the phrases: " + str(result))
+        return result
+
+    ## Waits for the broker's response to the last request.  Raises a RuntimeError if the broker process exits
+    ## without answering, so the failure reaches the parent process instead of leaving the worker blocked forever.
+    # @return A tuple with the "ok" or "error" status and the labels or the error message.
+    def waitForResponse(self):
+        while True:
+            try:
+                return self.response_queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                pass
+            if self.broker_sentinel is not None and self.broker_sentinel.poll():
+                ## the broker may have answered just before it exited
+                try:
+                    return self.response_queue.get(timeout=self.poll_interval)
+                except queue.Empty:
+                    raise RuntimeError("The inference broker process exited before classifying the phrases.")
+
+####
+#END_MODULE
+####
+
+
+## Gathers the next micro-batch of requests.  Blocks until one request arrives, then keeps collecting requests until
+## max_wait seconds pass without a new one or max_phrases candidates have been gathered.
+# @param request_queue The queue the workers send requests on.
+# @param max_wait The number of seconds to wait for each further request.
+# @param max_phrases The largest number of candidate phrases to gather.
+# @return A list of (client_id, candidates, options) requests, and True if the broker was asked to stop.
+def gatherRequests(request_queue, max_wait, max_phrases):
+    request = request_queue.get()
+    if request is None:
+        return [], True
+
+    requests = [request]
+    num_phrases = len(request[1])
+    while num_phrases < max_phrases:
+        try:
+            request = request_queue.get(timeout=max_wait)
+        except queue.Empty:
+            break
+        if request is None:
+            return requests, True
+        requests.append(request)
+        num_phrases = num_phrases + len(request[1])
+
+    return requests, False
+
+####
+#END_MODULE
+####
+
+
+## The main loop of the broker process.  Loads the BERT models once, then answers micro-batches of requests until it
+## is asked to stop.  Requests with the same classifier options are classified together in one bert_classify_batch()
+## call, and the labels are split back out to each worker.  If classification fails the error is sent back to the
+## workers in the batch instead of stopping the broker.
+# @param args The parsed command line arguments from Chrono.py.
+# @param request_queue The queue the workers send requests on.
+# @param response_queues The response queue of each worker.
+# @param num_threads The number of torch threads to use, or None to leave the torch default.
+# @param max_wait The number of seconds to wait for more requests before running a micro-batch.
+# @param max_phrases The largest number of candidate phrases gathered into one micro-batch.
+# @param broker_end The sending end of the broker sentinel pipe.  It is never written to, only held open until the
+#                   broker exits.
+def serveBroker(args, request_queue, response_queues, num_threads, max_wait, max_phrases, broker_end=None):
+    from Chrono import pipeline
+    from Chrono import utils
+
+    if num_threads is not None:
+        import torch
+        torch.set_num_threads(num_threads)
+
+    bert_model, bert_tokenizer, bert_classifier = pipeline.loadBertModels(
+        args.b, args.B, args.cnn, getattr(args, "bert_idle_timeout", None), getattr(args, "bert_quantize", False),
+        getattr(args, "bert_quantize_cache", None), getattr(args, "bert_onnx", None),
+        {"intra_op_threads": getattr(args, "onnx_threads", 0),
+         "inter_op_threads": getattr(args, "onnx_inter_threads", 0),
+         "optimization": getattr(args, "onnx_optimization", "all")})
+    embedding_cache = pipeline.loadEmbeddingCache(args.b, getattr(args, "bert_cache_mb", 0),
+                                                  getattr(args, "bert_cache_dir", None),
+                                                  getattr(args, "bert_quantize", False), getattr(args, "bert_onnx", None))
+
+    stop = False
+    while not stop:
+        requests, stop = gatherRequests(request_queue, max_wait, max_phrases)
+
+        by_options = {}
+        for request in requests:
+            by_options.setdefault(request[2], []).append(request)
+
+        for (include_context, include_attention, cnn, max_length), group in by_options.items():
+            candidates = [candidate for client_id, request_candidates, options in group for candidate in request_candidates]
+            try:
+                labels = utils.bert_classify_batch(candidates, bert_model, bert_tokenizer, bert_classifier,
+                                                   include_context, include_attention, cnn,
+                                                   embedding_cache=embedding_cache, max_length=max_length)
+            except Exception as e:
+                for client_id, request_candidates, options in group:
+                    response_queues[client_id].put(("error", repr(e)))
+                continue
+
+            start = 0
+            for client_id, request_candidates, options in group:
+                response_queues[client_id].put(("ok", labels[start:start + len(request_candidates)]))
+                start = start + len(request_candidates)
+
+####
+#END_MODULE
+####
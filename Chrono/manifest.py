@@ -0,0 +1,145 @@
+# Copyright (c) 2022
+# Amy L. Olex, Virginia Commonwealth University
+# alolex at vcu.edu
+#
+# Luke Maffey, Virginia Commonwealth University
+# maffeyl at vcu.edu
+#
+# Nicholas Morton,  Virginia Commonwealth University
+# nmorton at vcu.edu
+#
+# Bridget T. McInnes, Virginia Commonwealth University
+# btmcinnes at vcu.edu
+#
+# This file is part of Chrono
+#
+# Chrono is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# Chrono is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chrono; if not, write to
+#
+# The Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330,
+# Boston, MA  02111-1307, USA.
+
+
+
+## Records which documents a Chrono batch run has finished so an interrupted run can be restarted without
+## re-parsing them.  The manifest is an append-only JSONL file with one record per completed document holding the
+## hash of its input files and the identity of the models used.  A document is only skipped on restart if both
+## still match.
+
+import hashlib
+import json
+import os
+
+
+## Computes a SHA-256 hash over the contents of all the input files for a document.
+# @param paths The list of input files (e.g. the text file and the .dct file).  Files that do not exist are skipped.
+# @return The hex digest of the hash.
+def hashFiles(paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        digest.update(path.encode("utf-8"))
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+####
+#END_MODULE
+####
+
+
+## Builds a string identifying the models and options used for a run.  Model files are identified by their path,
+## size, and modification time rather than by hashing their contents, as the BERT models are very large.
+# @param args The parsed command line arguments from Chrono.py.
+# @return A hash of the model identities and the options that change the output.
+def modelIdentity(args):
+    identity = {"m": args.m, "includeRelative": args.includeRelative, "includeContext": args.includeContext,
+                "includeAttention": args.includeAttention, "cnn": args.cnn}
+    ## only added when set so manifests written before the option existed still match
+    if getattr(args, "bert_quantize", False):
+        identity["bert_quantize"] = True
+    if getattr(args, "bert_onnx", None) is not None:
+        identity["bert_onnx"] = os.path.abspath(args.bert_onnx)
+    if getattr(args, "pos_tagging", "full") != "full":
+        identity["pos_tagging"] = args.pos_tagging
+    for name in ("M", "d", "c", "b", "B"):
+        path = getattr(args, name)
+        identity[name] = path
+        if path and os.path.exists(path):
+            stat = os.stat(path)
+            identity[name + "_stat"] = [stat.st_size, stat.st_mtime]
+    return hashlib.sha256(json.dumps(identity, sort_keys=True).encode("utf-8")).hexdigest()
+
+####
+#END_MODULE
+####
+
+
+## Class to track the completed documents of a batch run in a JSONL manifest file.
+# @param path The path of the manifest file.  It is created if it does not exist.
+# @param model_id The model identity of this run from modelIdentity().
+class CompletionManifest:
+
+    ## The constructor.  Loads any records written by previous runs.
+    def __init__(self, path, model_id):
+        self.path = path
+        self.model_id = model_id
+        self.completed = {}
+
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        ## the last line may be partial if the previous run was killed mid-write
+                        continue
+                    self.completed[record["infile"]] = record
+
+        self.fout = open(path, "a")
+        ## start a fresh line if the previous run left a partial record at the end of the file
+        if self.fout.tell() > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self.fout.write("\n")
+
+    ## Checks if a document was already completed with the same input and models.
+    # @param infile The input document.
+    # @param input_hash The hash of the document's input files from hashFiles().
+    # @return True if the document can be skipped.
+    def isComplete(self, infile, input_hash):
+        record = self.completed.get(infile)
+        return record is not None and record["input_hash"] == input_hash and record["model_id"] == self.model_id
+
+    ## Records a document as completed.  Should only be called after its output has been fully written.
+    # @param infile The input document.
+    # @param outfile The output file for the document.
+    # @param input_hash The hash of the document's input files from hashFiles().
+    def markComplete(self, infile, outfile, input_hash):
+        record = {"infile": infile, "outfile": outfile, "input_hash": input_hash, "model_id": self.model_id}
+        self.completed[infile] = record
+        self.fout.write(json.dumps(record) + "\n")
+        self.fout.flush()
+        os.fsync(self.fout.fileno())
+
+    ## Closes the manifest file.
+    def close(self):
+        self.fout.close()
+
+####
+#END_MODULE
+####
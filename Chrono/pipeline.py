@@ -0,0 +1,599 @@
+# Copyright (c) 2022
+# Amy L. Olex, Virginia Commonwealth University
+# alolex at vcu.edu
+#
+# Luke Maffey, Virginia Commonwealth University
+# maffeyl at vcu.edu
+#
+# Nicholas Morton,  Virginia Commonwealth University
+# nmorton at vcu.edu
+#
+# Bridget T. McInnes, Virginia Commonwealth University
+# btmcinnes at vcu.edu
+#
+# This file is part of Chrono
+#
+# Chrono is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# Chrono is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chrono; if not, write to
+#
+# The Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330,
+# Boston, MA  02111-1307, USA.
+
+
+## Loads the models needed to run Chrono and parses individual documents.  These methods are shared by the
+## serial driver loop in Chrono.py, the worker processes used when Chrono is run with --workers (optionally sharing
+## the BERT models through an inference_broker process), and ChronoServer.py.
+## ChronoPipeline can also be used directly as a library to parse text held in memory.
+
+import contextlib
+import json
+import os
+import pickle
+import sys
+import time
+import dateutil.parser
+from chronoML import backends
+from Chrono import BuildEntities
+from Chrono import dictionary_registry
+from Chrono import referenceToken
+from Chrono import utils
+
+debug = False
+
+## Holds the arguments and the ChronoPipeline loaded by each worker process so the models are only loaded once per worker.
+_worker_models = {}
+
+
+## Trains the Period/Interval ML classifier on the training data matrix, or loads a pre-built model.
+# @param method The machine learning method to use. One of NN, DT, RF, SVM, or NB.
+# @param model_file The path and file name of a pre-built ML model for loading, or None to train a new model.
+# @param train_data The CSV file with the training data matrix.
+# @param train_class The file with the known classes for the training data matrix.
+# @return The Period/Interval classifier and the feature dictionary it uses.
+def loadClassifier(method, model_file, train_data, train_class):
+    if(method == "DT" and model_file is None):
+        ## Train the decision tree classifier and save in the classifier variable
+        #print("Got DT")
+        classifier, feats = backends.getBackend("DT").build_dt_model(train_data, train_class)
+        with open('DT_model.pkl', 'wb') as mod:  
+            pickle.dump([classifier, feats], mod)
+
+    if(method == "RF" and model_file is None):
+        ## Train the decision tree classifier and save in the classifier variable
+        # print("Got RF")
+        classifier, feats = backends.getBackend("RF").build_model(train_data, train_class)
+        with open('RF_model.pkl', 'wb') as mod:
+            pickle.dump([classifier, feats], mod)
+    
+    elif(method == "NN" and model_file is None):
+        #print("Got NN")
+        ## Train the neural network classifier and save in the classifier variable
+        classifier = backends.getBackend("NN").build_model(train_data, train_class)
+        feats = utils.get_features(train_data)
+        classifier.save('NN_model.h5')
+            
+    elif(method == "SVM" and model_file is None):
+        #print("Got SVM")
+        ## Train the SVM classifier and save in the classifier variable
+        classifier, feats = backends.getBackend("SVM").build_model(train_data, train_class)
+        with open('SVM_model.pkl', 'wb') as mod:  
+            pickle.dump([classifier, feats], mod)
+            
+    elif(model_file is None):
+        #print("Got NB")
+        ## Train the naive bayes classifier and save in the classifier variable
+        classifier, feats, NB_input = backends.getBackend("NB").build_model(train_data, train_class)
+        classifier.show_most_informative_features(20)
+        with open('NB_model.pkl', 'wb') as mod:  
+            pickle.dump([classifier, feats], mod)
+                
+    elif(model_file is not None):
+        #print("use saved model")
+        if method in ("NB", "DT", "SVM", "RF"):
+            with open(model_file, 'rb') as mod:
+                print(model_file)
+                classifier, feats = pickle.load(mod)
+        elif method == "NN":
+            classifier = backends.loadKerasModel(model_file)
+            feats = utils.get_features(train_data)
+
+    return classifier, feats
+
+####
+#END_MODULE
+####
+
+
+## Creates handles to the BERT model, tokenizer, and the DATE/DURATION classifier used by ChronoBERT.  The models
+## are only loaded the first time a period or interval phrase needs to be classified, so documents without one never
+## load BERT.  If no BERT model is given Chrono runs without BERT and every period or interval phrase is normalized
+## as a DURATION.
+# @param bert_path The path to the pre-built BERT model, or None to run without BERT.
+# @param bert_classifier_path The path to the pre-trained SVM or CNN classification model from ChronoBERT.
+# @param cnn Boolean indicating if the ChronoBERT classifier is a Keras CNN, or a CNN exported to .npz by
+#            ChronoCnnExport.py.
+# @param idle_timeout The number of idle seconds after which the models are unloaded, or None to keep them loaded.
+# @param quantize Boolean indicating if the BERT model should be dynamically quantized to int8.
+# @param quantized_cache A file to save the quantized BERT model to and load it from on later runs, or None.
+# @param onnx_path An ONNX graph exported from the BERT model by ChronoBertExport.py to run on ONNX Runtime in place
+#                  of torch, or None.  The tokenizer is still loaded from bert_path.
+# @param onnx_options A dictionary of OnnxBertEncoder options (intra_op_threads, inter_op_threads, optimization).
+# @return The BERT model, the BERT tokenizer, and the ChronoBERT classifier handles, or three Nones.
+def loadBertModels(bert_path, bert_classifier_path, cnn, idle_timeout=None, quantize=False, quantized_cache=None,
+                   onnx_path=None, onnx_options=None):
+    if bert_path is None:
+        return None, None, None
+
+    if onnx_path is not None:
+        from Chrono.ChronoBert import bert_encoder
+        bert_model = backends.LazyModel(lambda: bert_encoder.OnnxBertEncoder(onnx_path, **(onnx_options or {})),
+                                        idle_timeout)
+    else:
+        bert_model = backends.LazyModel(lambda: backends.loadBertModel(bert_path, quantize, quantized_cache),
+                                        idle_timeout)
+    bert_tokenizer = backends.LazyModel(lambda: backends.loadBertTokenizer(bert_path), idle_timeout)
+
+    if cnn:
+        bert_classifier = backends.LazyModel(lambda: backends.loadCnnModel(bert_classifier_path), idle_timeout)
+    else:
+        bert_classifier = backends.LazyModel(lambda: backends.loadJoblibModel(bert_classifier_path), idle_timeout)
+
+    return bert_model, bert_tokenizer, bert_classifier
+
+####
+#END_MODULE
+####
+
+
+## Creates the cache for the BERT outputs of each sentence, if one was requested.
+# @param bert_path The path to the pre-built BERT model, whose files identify the model in the cache.
+# @param cache_mb The memory budget of the cache in megabytes.
+# @param cache_dir A directory to persist the cache to so later runs can reuse it, or None.
+# @param quantize Boolean indicating if the BERT model is quantized, which gives it different outputs.
+# @param onnx_path The ONNX graph run in place of the BERT model, whose outputs differ slightly, or None.
+# @return An EmbeddingCache, or None if BERT is not used or no cache was requested.
+def loadEmbeddingCache(bert_path, cache_mb, cache_dir, quantize=False, onnx_path=None):
+    if bert_path is None or (not cache_mb and cache_dir is None):
+        return None
+
+    from Chrono.ChronoBert import embedding_cache
+    ## the sizes and modification times of the model files are included so a re-trained or re-exported model in the
+    ## same place never reuses the cached outputs of the old one
+    identity = backends.bertModelIdentity(bert_path)
+    if onnx_path is not None:
+        stat = os.stat(onnx_path)
+        identity.append(["onnx", os.path.abspath(onnx_path), stat.st_size, stat.st_mtime])
+    elif quantize:
+        identity.append("int8")
+    model_id = json.dumps(identity)
+    return embedding_cache.EmbeddingCache(model_id, max_bytes=int((cache_mb or 0) * 1024 * 1024), cache_dir=cache_dir)
+
+####
+#END_MODULE
+####
+
+
+## Creates the memo of the numeric and temporal flags of tokens, if one was requested.
+# @param max_entries The largest number of tokens to remember, or 0 for no memo.
+# @param vocab_path A vocabulary file saved by TokenMemo.saveVocabulary() to warm the memo from, or None.  It is
+#                   skipped if it does not exist yet.
+# @param include_relative Boolean indicating if relative temporal terms are marked as temporal.
+# @return A TokenMemo, or None.
+def loadTokenMemo(max_entries, vocab_path=None, include_relative=False):
+    if not max_entries:
+        return None
+
+    from Chrono import token_memo
+    memo = token_memo.TokenMemo(max_entries)
+    if vocab_path is not None and os.path.exists(vocab_path):
+        memo.warm(vocab_path, include_relative)
+    return memo
+
+####
+#END_MODULE
+####
+
+
+## Holds the loaded Chrono models and runs the full pipeline on in-memory text, without needing the
+## Anafora directory structure, a .dct file, or a file on disk for each document.
+# @param classifier The Period/Interval ML classifier.
+# @param feats The feature dictionary used by the Period/Interval ML classifier.
+# @param method The machine learning method of the classifier. One of NN, DT, RF, SVM, or NB.
+# @param bert_model The BERT model.
+# @param bert_tokenizer The BERT tokenizer.
+# @param bert_classifier The ChronoBERT DATE/DURATION classifier.
+# @param include_relative Boolean indicating if relative temporal terms should be marked as temporal.
+# @param include_context Boolean indicating if the ChronoBERT classifier uses context embeddings.
+# @param include_attention Boolean indicating if the ChronoBERT classifier uses attention embeddings.
+# @param cnn Boolean indicating if the ChronoBERT classifier is a Keras CNN.
+# @param embedding_cache An EmbeddingCache used to reuse the BERT outputs of sentences seen before, or None.
+# @param bert_max_length The length sentences are padded to for BERT, or None to only pad to the longest in each batch.
+# @param pos_tagging "full" to part of speech tag every sentence, or "gated" to only tag the sentences with a temporal
+#                    or numeric candidate, when their tags are first needed.
+# @param token_memo A TokenMemo that remembers the numeric and temporal flags of tokens across documents, or None.
+class ChronoPipeline:
+
+    ## The constructor
+    def __init__(self, classifier, feats, method, bert_model, bert_tokenizer, bert_classifier,
+                 include_relative=False, include_context=False, include_attention=False, cnn=False,
+                 embedding_cache=None, bert_max_length=256, pos_tagging="full", token_memo=None):
+        self.classifier = classifier
+        self.feats = feats
+        self.method = method
+        self.bert_model = bert_model
+        self.bert_tokenizer = bert_tokenizer
+        self.bert_classifier = bert_classifier
+        self.include_relative = include_relative
+        self.include_context = include_context
+        self.include_attention = include_attention
+        self.cnn = cnn
+        self.embedding_cache = embedding_cache
+        self.bert_max_length = bert_max_length
+        self.pos_tagging = pos_tagging
+        self.token_memo = token_memo
+
+    ## Loads all the models named by the parsed command line arguments and returns a ready to use pipeline.
+    # @param args The parsed command line arguments from Chrono.py or ChronoServer.py.
+    # @param classifier The Period/Interval ML classifier if it is already loaded, otherwise it is loaded from args.
+    # @param feats The feature dictionary used by the classifier if it is already loaded.
+    # @param bert_broker A BrokerClient to classify the DATE/DURATION phrases with a shared inference broker process
+    #                    instead of loading the BERT models, or None.
+    # @return A ChronoPipeline object.
+    @classmethod
+    def fromArgs(cls, args, classifier=None, feats=None, bert_broker=None):
+        dictionary_registry.getRegistry(getattr(args, "dictionary_snapshot", None))
+        if classifier is None:
+            classifier, feats = loadClassifier(args.m, args.M, args.d, args.c)
+        bert_max_length = None if getattr(args, "bert_padding", "max") == "dynamic" else 256
+        pos_tagging = getattr(args, "pos_tagging", "full")
+        token_memo = loadTokenMemo(getattr(args, "token_memo_size", 0), getattr(args, "token_memo_vocab", None),
+                                   args.includeRelative)
+
+        ## the broker owns the BERT models and the sentence cache, so none are loaded here
+        if bert_broker is not None:
+            return cls(classifier, feats, args.m, bert_broker, None, None,
+                       include_relative=args.includeRelative, include_context=args.includeContext,
+                       include_attention=args.includeAttention, cnn=args.cnn, bert_max_length=bert_max_length,
+                       pos_tagging=pos_tagging, token_memo=token_memo)
+
+        quantize = getattr(args, "bert_quantize", False)
+        onnx_path = getattr(args, "bert_onnx", None)
+        onnx_options = {"intra_op_threads": getattr(args, "onnx_threads", 0),
+                        "inter_op_threads": getattr(args, "onnx_inter_threads", 0),
+                        "optimization": getattr(args, "onnx_optimization", "all")}
+        bert_model, bert_tokenizer, bert_classifier = loadBertModels(args.b, args.B, args.cnn,
+                                                                     getattr(args, "bert_idle_timeout", None),
+                                                                     quantize, getattr(args, "bert_quantize_cache", None),
+                                                                     onnx_path, onnx_options)
+
+        embedding_cache = loadEmbeddingCache(args.b, getattr(args, "bert_cache_mb", 0),
+                                             getattr(args, "bert_cache_dir", None), quantize, onnx_path)
+
+        return cls(classifier, feats, args.m, bert_model, bert_tokenizer, bert_classifier,
+                   include_relative=args.includeRelative, include_context=args.includeContext,
+                   include_attention=args.includeAttention, cnn=args.cnn, embedding_cache=embedding_cache,
+                   bert_max_length=bert_max_length, pos_tagging=pos_tagging, token_memo=token_memo)
+
+    ## Runs the full Chrono pipeline on a text string.
+    # @param text The raw text of the document.
+    # @param doctime The document time as a datetime object or a date string.
+    # @return The list of Chrono entities and the list of TimePhrase entities with TIMEX3 values.
+    def process(self, text, doctime):
+        if isinstance(doctime, str):
+            doctime = dateutil.parser.parse(doctime)
+
+        my_chrono_ID_counter = 1
+
+        ## parse out reference tokens.  The spans returned are character spans, not token spans.
+        ## the sentence boundary flag is per token, a 1 indicates that token is the last in the sentence.
+        token_table = utils.getTokenTable(text, self.pos_tagging)
+        sent_text = token_table.sentences
+        my_refToks = referenceToken.convertTokenTableToRefTokens(token_table)
+
+        ## mark all ref tokens if they are numeric or temporal
+        chroList = utils.markTemporal(my_refToks, include_relative=self.include_relative,
+                                      gate_pos=self.pos_tagging == "gated", token_memo=self.token_memo)
+
+        if(debug) :
+            print("REFERENCE TOKENS:\n")
+            for tok in chroList : print(tok)
+
+        tempPhrases = utils.getTemporalPhrases(chroList, sent_text, doctime)
+
+        if(debug):
+            for c in tempPhrases:
+                print(c)
+
+        chrono_master_list, my_chrono_ID_counter, timex_phrases = BuildEntities.buildChronoList(tempPhrases,
+                                                                                                my_chrono_ID_counter,
+                                                                                                chroList,
+                                                                                                (self.classifier, self.method),
+                                                                                                self.feats, self.bert_model,
+                                                                                                self.bert_tokenizer,
+                                                                                                self.bert_classifier,
+                                                                                                self.include_context,
+                                                                                                self.include_attention,
+                                                                                                self.cnn,
+                                                                                                doctime,
+                                                                                                self.embedding_cache,
+                                                                                                self.bert_max_length)
+
+        return chrono_master_list, timex_phrases
+
+    ## Runs the full Chrono pipeline on each document in turn.  Results are yielded as each document
+    ## finishes so long streams do not need to be held in memory.
+    # @param documents An iterable of (text, doctime) tuples.
+    # @return A generator of (chrono_master_list, timex_phrases) tuples in the same order as the input.
+    def process_many(self, documents):
+        for text, doctime in documents:
+            yield self.process(text, doctime)
+
+####
+#END_MODULE
+####
+
+
+## Lists the input files that are read when parsing a document.
+# @param infile The path and file name of the document to parse, without the file extension.
+# @param args The parsed command line arguments from Chrono.py.
+# @return The list of input files.
+def documentInputFiles(infile, args):
+    if args.I is not None:
+        return [infile + args.x]
+    return [infile + args.x, infile + ".dct"]
+
+####
+#END_MODULE
+####
+
+
+## Parses a single document and writes out the Anafora or i2b2 XML results.
+# @param infile The path and file name of the document to parse, without the file extension.
+# @param outfile The path and file name of the output file.
+# @param args The parsed command line arguments from Chrono.py.
+# @param chrono_pipeline The ChronoPipeline object holding the loaded models.
+# @return The number of Chrono entities identified in the document.
+def parseDocument(infile, outfile, args, chrono_pipeline):
+    print("Parsing "+ infile +" ...")
+    if(chrono_pipeline.include_relative):
+        print("Including Relative Terms")
+
+    ## parse out the doctime
+    if args.I is not None:
+        doctime = utils.getDocTime(infile, i2b2=True)
+    else:
+        doctime = utils.getDocTime(infile + ".dct", i2b2=False)
+    if(debug) : print(doctime)
+
+    with open(infile + args.x, "r") as file:
+        raw_text = file.read()
+
+    chrono_master_list, timex_phrases = chrono_pipeline.process(raw_text, doctime)
+    print("Number of Chrono Entities: " + str(len(chrono_master_list)))
+
+    if args.O is not None:
+        utils.write_i2b2(raw_text, timex_phrases, outfile=outfile)
+    else:
+        utils.write_xml(chrono_list=chrono_master_list, outfile=outfile)
+
+    return len(chrono_master_list)
+
+####
+#END_MODULE
+####
+
+
+## Lazily reads the records in a JSONL file, one record per line.  Blank lines are skipped.
+# @param stream An open file or stream with one JSON record per line.
+# @return A generator of (line number, record) tuples.  The record is None if the line is not valid JSON.
+def readJsonl(stream):
+    for line_num, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_num, json.loads(line)
+        except ValueError:
+            yield line_num, None
+
+####
+#END_MODULE
+####
+
+
+## Streams {"id", "text", "dct"} records from a JSONL file through the pipeline and writes one JSONL record with the
+## TIMEX3 and SCATE entities for each input record.  Only one record is held in memory at a time.  Records that can
+## not be parsed are written out with an "error" field so every input line has a matching output line.
+# @param infile The path of the JSONL input file, or - to read from stdin.
+# @param outfile The path of the JSONL output file, or - to write to stdout.
+# @param chrono_pipeline The ChronoPipeline object holding the loaded models.
+# @return The number of records written.
+def parseJsonl(infile, outfile, chrono_pipeline):
+    num_records = 0
+    with contextlib.ExitStack() as stack:
+        fin = sys.stdin if infile == "-" else stack.enter_context(open(infile, "r"))
+        fout = sys.stdout if outfile == "-" else stack.enter_context(open(outfile, "w"))
+
+        for line_num, record in readJsonl(fin):
+            if not isinstance(record, dict):
+                result = {"id": None, "error": "Line " + str(line_num) + " is not a JSON object."}
+            elif "text" not in record or "dct" not in record:
+                result = {"id": record.get("id"), "error": "Records must have 'text' and 'dct' fields."}
+            else:
+                ## a record that fails to parse gets an error line so every input line still has one output line
+                try:
+                    chrono_master_list, timex_phrases = chrono_pipeline.process(record["text"], record["dct"])
+                    result = {"id": record.get("id"),
+                              "timex_phrases": [timexToDict(t) for t in timex_phrases],
+                              "chrono_master_list": [chronoEntityToDict(c) for c in chrono_master_list]}
+                except Exception as e:
+                    result = {"id": record.get("id"), "error": repr(e)}
+
+            fout.write(json.dumps(result, default=str) + "\n")
+            fout.flush()
+            num_records = num_records + 1
+
+    return num_records
+
+####
+#END_MODULE
+####
+
+
+## Runs a sample of documents through the pipeline with the fp32 BERT model and with the int8 quantized BERT model,
+## and reports how often the two agree on the DATE/DURATION type of each temporal phrase and how long each took.
+## Neither run uses the sentence cache, so every sentence is encoded by both models.
+# @param sample_file The path of a JSONL file with one {"id", "text", "dct"} record per line.
+# @param args The parsed command line arguments from Chrono.py.
+# @param classifier The Period/Interval ML classifier.
+# @param feats The feature dictionary used by the Period/Interval ML classifier.
+# @return A dictionary with the number of documents and phrases compared, the number of agreements, the agreement
+#         rate, the seconds taken by each model, the disagreeing phrases, and the records that failed to parse.
+def compareQuantized(sample_file, args, classifier, feats):
+    if args.b is None:
+        raise ValueError("A BERT model (-b) is required to compare it with its quantized version.")
+
+    dictionary_registry.getRegistry(getattr(args, "dictionary_snapshot", None))
+    pipelines = {}
+    for name, quantize in (("fp32", False), ("int8", True)):
+        quantized_cache = getattr(args, "bert_quantize_cache", None) if quantize else None
+        bert_model, bert_tokenizer, bert_classifier = loadBertModels(args.b, args.B, args.cnn, quantize=quantize,
+                                                                     quantized_cache=quantized_cache)
+        ## load the models up front so the timings only cover parsing
+        bert_model.getModel()
+        bert_tokenizer.getModel()
+        bert_classifier.getModel()
+        pipelines[name] = ChronoPipeline(classifier, feats, args.m, bert_model, bert_tokenizer, bert_classifier,
+                                         include_relative=args.includeRelative, include_context=args.includeContext,
+                                         include_attention=args.includeAttention, cnn=args.cnn,
+                                         bert_max_length=None if getattr(args, "bert_padding", "max") == "dynamic" else 256,
+                                         pos_tagging=getattr(args, "pos_tagging", "full"))
+
+    report = {"documents": 0, "phrases": 0, "agree": 0, "seconds": {"fp32": 0.0, "int8": 0.0}, "disagreements": [],
+              "errors": []}
+    with open(sample_file, "r") as fin:
+        for line_num, record in readJsonl(fin):
+            if not isinstance(record, dict) or "text" not in record or "dct" not in record:
+                continue
+
+            types = {}
+            try:
+                for name, chrono_pipeline in pipelines.items():
+                    ## parse the first document once untimed so one-off start up costs are not counted against either model
+                    if report["documents"] == 0:
+                        chrono_pipeline.process(record["text"], record["dct"])
+                    start = time.perf_counter()
+                    chrono_master_list, timex_phrases = chrono_pipeline.process(record["text"], record["dct"])
+                    report["seconds"][name] += time.perf_counter() - start
+                    types[name] = {t.getSpan(): (t.getText(), t.getType()) for t in timex_phrases}
+            except Exception as e:
+                ## a record that fails to parse is reported and left out of the comparison
+                report["errors"].append({"id": record.get("id"), "error": repr(e)})
+                continue
+
+            ## only the phrases typed as a DATE or DURATION by either model can have been classified by BERT
+            report["documents"] += 1
+            for span in sorted(set(types["fp32"]) | set(types["int8"]), key=str):
+                fp32_text, fp32_type = types["fp32"].get(span, (None, None))
+                int8_text, int8_type = types["int8"].get(span, (None, None))
+                if fp32_type not in ("DATE", "DURATION") and int8_type not in ("DATE", "DURATION"):
+                    continue
+                report["phrases"] += 1
+                if fp32_type == int8_type:
+                    report["agree"] += 1
+                else:
+                    report["disagreements"].append({"id": record.get("id"), "span": list(span),
+                                                    "text": fp32_text or int8_text, "fp32": fp32_type,
+                                                    "int8": int8_type})
+
+    report["agreement"] = report["agree"] / report["phrases"] if report["phrases"] else 1.0
+    return report
+
+####
+#END_MODULE
+####
+
+
+## Converts a TimePhrase entity with a TIMEX3 value into a dictionary that can be serialized as JSON.
+# @param phrase The TimePhraseEntity object.
+# @return A dictionary with the TIMEX3 attributes of the phrase.
+def timexToDict(phrase):
+    start, end = phrase.getSpan()
+    return {"id": "T" + str(phrase.getID()), "start": start, "end": end, "text": phrase.getText(),
+            "type": phrase.getType(), "val": phrase.getValue(), "mod": phrase.getMod()}
+
+####
+#END_MODULE
+####
+
+
+## Converts a Chrono (SCATE) entity into a dictionary that can be serialized as JSON.
+# @param entity The ChronoEntity object.
+# @return A dictionary with the entity id, span, type, parent type, and all remaining properties.
+def chronoEntityToDict(entity):
+    properties = {k: v for k, v in vars(entity).items() if k not in ("entityID", "start_span", "end_span", "type", "parent_type")}
+    return {"id": entity.get_id(), "span": [entity.get_start_span(), entity.get_end_span()],
+            "type": entity.get_type(), "parentsType": entity.get_parent_type(), "properties": properties}
+
+####
+#END_MODULE
+####
+
+
+## Initializes a worker process by loading all the models once, before any documents are parsed.
+# @param args The parsed command line arguments from Chrono.py.
+# @param classifier The Period/Interval ML classifier, or None if it should be loaded from disk by the worker (NN models).
+# @param feats The feature dictionary used by the Period/Interval ML classifier.
+# @param num_threads The number of torch threads each worker may use.
+# @param broker_args The InferenceBroker.clientArgs() of a shared inference broker to classify the DATE/DURATION
+#                    phrases with, or None to load the BERT models in this worker.
+def initWorker(args, classifier, feats, num_threads, broker_args=None):
+    ## Keras models can not be pickled so the NN classifier is re-loaded in each worker.
+    if classifier is None and args.m == "NN":
+        classifier = backends.loadKerasModel(args.M if args.M is not None else 'NN_model.h5')
+
+    if broker_args is not None:
+        from Chrono import inference_broker
+        chrono_pipeline = ChronoPipeline.fromArgs(args, classifier, feats,
+                                                  bert_broker=inference_broker.connectClient(broker_args))
+    else:
+        ## torch is only imported when this worker runs BERT, so NB/SVM-only workers start without it
+        if args.b is not None or getattr(args, "bert_onnx", None) is not None:
+            import torch
+            torch.set_num_threads(num_threads)
+        chrono_pipeline = ChronoPipeline.fromArgs(args, classifier, feats)
+    ## the parent process merges the tokens each worker adds to its memo and saves them as one vocabulary
+    if chrono_pipeline.token_memo is not None:
+        chrono_pipeline.token_memo.reportUpdates()
+
+    _worker_models.update({"args": args, "chrono_pipeline": chrono_pipeline})
+
+####
+#END_MODULE
+####
+
+
+## Parses a single document using the models loaded by initWorker().
+# @param job A tuple with the input file and the output file.
+# @return A tuple with the input file, the output file, the number of Chrono entities identified, and the
+#         TokenMemo.takeUpdate() of the worker's token memo for a TokenMemoMerger, or None if there is no memo.
+def parseDocumentWorker(job):
+    infile, outfile = job
+    num_entities = parseDocument(infile, outfile, **_worker_models)
+    token_memo = _worker_models["chrono_pipeline"].token_memo
+    return infile, outfile, num_entities, token_memo.takeUpdate() if token_memo is not None else None
+
+####
+#END_MODULE
+####
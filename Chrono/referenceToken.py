@@ -34,7 +34,12 @@
 ## Class definitions to represent a whitespace-parsed token in the raw text file.
 
 
+import re
 import string
+from array import array
+
+## Matches the tokens found by nltk's WhitespaceTokenizer.
+WHITESPACE_TOKEN = re.compile(r"\S+")
 
 
 ## Class to define a whitespace-parsed token from raw text.
@@ -46,11 +51,13 @@ import string
 # @param pos The part of speech assigned to this token
 # @param temporal A boolean indicating if this token contains any temporal components
 # @param sent_boundary A boolean indicating if this token is at the end of a sentence or line
+# @param pos_table A TokenTable to get the part of speech from the first time it is needed, if pos is not given
+# @param table_idx The index of this token in pos_table
 class refToken:
 
     ## The constructor
     def __init__(self, id, rel_id, text, abs_start_span=None, abs_end_span=None, rel_start_span=None, rel_end_span=None, pos=None, temporal=None, numeric=None,
-                 sent_boundary=None, sent_membership=None, link_term=None):
+                 sent_boundary=None, sent_membership=None, link_term=None, pos_table=None, table_idx=None):
         self.id = id  ## essentially the absolute token index
         self.rel_id = rel_id
         self.text = text
@@ -64,6 +71,8 @@ class refToken:
         self.sent_boundary = sent_boundary
         self.link_term = link_term
         self.sent_membership = sent_membership
+        self.pos_table = pos_table
+        self.table_idx = table_idx
 
     ## Defines how to convert a refToken to string
     def __str__(self):
@@ -148,8 +157,10 @@ class refToken:
     def getRelSpan(self):
         return (self.rel_start_span, self.rel_end_span)
 
-    ## Gets the entity's POS
+    ## Gets the entity's POS, tagging its sentence first if it is tagged lazily
     def getPos(self):
+        if self.pos is None and self.pos_table is not None:
+            self.pos = self.pos_table.getPos(self.table_idx)
         return (self.pos)
 
     ## Gets the entity's temporal flag
@@ -186,6 +197,176 @@ class refToken:
             return False
 
 
+## Class to hold all the whitespace-parsed tokens of a document in columns, rather than one list per attribute that has
+## to be re-built as each sentence is added.  Each column is an array with one entry per token, built in a single pass
+## over the sentences, and the token text is sliced from the document text by its span when it is needed.  The tokens
+## are either all tagged at once with setTags(), or each sentence is tagged the first time the part of speech of one of
+## its tokens is needed when a tagger is given with setTagger().
+# @param raw_text The raw text of the document.
+# @param text The text of the document that was tokenized.
+# @param sentences The list of sentences in the text.
+# @param sent_spans The (start, end) character span of each sentence in text.
+class TokenTable:
+
+    ## The constructor.  Tokenizes each sentence on white space.
+    def __init__(self, raw_text, text, sentences, sent_spans):
+        self.raw_text = raw_text
+        self.text = text
+        self.sentences = sentences
+        self.abs_start = array("l")
+        self.abs_end = array("l")
+        self.rel_start = array("l")
+        self.rel_end = array("l")
+        self.sent_membership = array("l")
+        ## the index of the first token of each sentence, plus the number of tokens
+        self.sent_token_start = array("l")
+        self.pos_id = array("H")
+        self.pos_names = []
+        self.tagger = None
+        self.sent_tagged = bytearray(len(sentences))
+
+        ## the last token of each sentence, which is the token before it if the sentence is empty
+        boundary_idxs = []
+        for s in range(0, len(sentences)):
+            self.sent_token_start.append(len(self.abs_start))
+            sent_start = sent_spans[s][0]
+            for match in WHITESPACE_TOKEN.finditer(sentences[s]):
+                self.rel_start.append(match.start())
+                self.rel_end.append(match.end())
+                self.abs_start.append(sent_start + match.start())
+                self.abs_end.append(sent_start + match.end())
+                self.sent_membership.append(s)
+            boundary_idxs.append(len(self.abs_start) - 1)
+        self.sent_token_start.append(len(self.abs_start))
+
+        self.sent_boundary = array("b", bytes(len(self.abs_start)))
+        if len(self.sent_boundary) > 0:
+            for idx in boundary_idxs:
+                self.sent_boundary[idx] = 1
+
+    ## Gets the number of tokens
+    def __len__(self):
+        return len(self.abs_start)
+
+    ## Sets the part of speech of each token.  The tags are stored as ids into the list of distinct tags.
+    # @param tags A list of (token, tag) tuples for each token, as returned by nltk.pos_tag().
+    def setTags(self, tags):
+        if len(tags) != len(self):
+            raise ValueError('pos list is not same length as token list.')
+        self.pos_names = []
+        self.pos_id = array("H", bytes(2 * len(self)))
+        self._storeTags(0, tags)
+        self.sent_tagged = bytearray(b"\x01" * len(self.sentences))
+
+    ## Sets the tagger used to tag each sentence the first time the part of speech of one of its tokens is needed.
+    # @param tagger A function that takes a list of tokens and returns a list of (token, tag) tuples, like nltk.pos_tag().
+    def setTagger(self, tagger):
+        self.tagger = tagger
+        self.pos_names = []
+        self.pos_id = array("H", bytes(2 * len(self)))
+        self.sent_tagged = bytearray(len(self.sentences))
+
+    ## Checks if every sentence has been tagged
+    def isTagged(self):
+        return all(self.sent_tagged)
+
+    ## Tags the tokens of one sentence with the tagger given to setTagger(), if it has not been tagged yet.
+    # @param sent_idx The index of the sentence
+    def tagSentence(self, sent_idx):
+        if self.sent_tagged[sent_idx]:
+            return
+        start = self.sent_token_start[sent_idx]
+        end = self.sent_token_start[sent_idx + 1]
+        if end > start:
+            self._storeTags(start, self.tagger([self.getText(idx) for idx in range(start, end)]))
+        self.sent_tagged[sent_idx] = 1
+
+    ## Stores the tags of a run of tokens as ids into the list of distinct tags.
+    def _storeTags(self, start, tags):
+        tag_ids = {tag: i for i, tag in enumerate(self.pos_names)}
+        for offset, (tok, tag) in enumerate(tags):
+            if tag not in tag_ids:
+                tag_ids[tag] = len(self.pos_names)
+                self.pos_names.append(tag)
+            self.pos_id[start + offset] = tag_ids[tag]
+
+    ## Gets the text of a token
+    # @param idx The token index
+    def getText(self, idx):
+        return self.text[self.abs_start[idx]:self.abs_end[idx]]
+
+    ## Gets the part of speech of a token, tagging its sentence first if needed.  Returns None if the tokens have not
+    ## been tagged and there is no tagger.
+    # @param idx The token index
+    def getPos(self, idx):
+        sent_idx = self.sent_membership[idx]
+        if not self.sent_tagged[sent_idx]:
+            if self.tagger is None:
+                return None
+            self.tagSentence(sent_idx)
+        return self.pos_names[self.pos_id[idx]]
+
+    ## Gets the text of all the tokens as a list
+    def getTokens(self):
+        return [self.text[start:end] for start, end in zip(self.abs_start, self.abs_end)]
+
+    ## Gets the absolute character spans of all the tokens as a list of tuples
+    def getAbsSpans(self):
+        return list(zip(self.abs_start, self.abs_end))
+
+    ## Gets the character spans of all the tokens within their sentence as a list of tuples
+    def getRelSpans(self):
+        return list(zip(self.rel_start, self.rel_end))
+
+    ## Gets the (token, tag) tuple of all the tokens as a list, in the format returned by nltk.pos_tag()
+    def getTags(self):
+        return [(self.getText(idx), self.getPos(idx)) for idx in range(0, len(self))]
+
+    ## Gets the sentence boundary flag of all the tokens as a list, a 1 indicates the last token of a sentence
+    def getSentBoundaries(self):
+        return self.sent_boundary.tolist()
+
+    ## Gets the index of the sentence each token is in as a list
+    def getSentMembership(self):
+        return self.sent_membership.tolist()
+
+####
+#END_MODULE
+####
+
+
+## Function to convert the tokens in a TokenTable into a list of refToken objects, reading each attribute directly
+## from the table's columns.  Gives the same refTokens as convertToRefTokens() given the table's columns as lists.
+# @param table The TokenTable.
+# @param id_counter The number the ID counter should start at. Default is 0.
+# @return A list of refToken objects in the same order as the tokens in the table.  If the table is tagged lazily, each
+#         refToken gets its part of speech from the table the first time it is needed.
+def convertTokenTableToRefTokens(table, id_counter=0):
+    ref_list = list()
+    rel_id_counter = 0
+    has_pos = table.isTagged()
+    pos_table = table if not has_pos and table.tagger is not None else None
+    for idx in range(0, len(table)):
+        ## if we have a new sentence
+        if idx > 0 and table.sent_membership[idx] - table.sent_membership[idx-1] == 1:
+            rel_id_counter = 0
+        ref_list.append(refToken(id=id_counter, rel_id=rel_id_counter, text=table.getText(idx),
+                                 abs_start_span=table.abs_start[idx], abs_end_span=table.abs_end[idx],
+                                 rel_start_span=table.rel_start[idx], rel_end_span=table.rel_end[idx],
+                                 pos=table.pos_names[table.pos_id[idx]] if has_pos else None,
+                                 sent_boundary=table.sent_boundary[idx],
+                                 sent_membership=table.sent_membership[idx],
+                                 pos_table=pos_table, table_idx=idx))
+        id_counter = id_counter + 1
+        rel_id_counter = rel_id_counter + 1
+
+    return ref_list
+
+####
+#END_MODULE
+####
+
+
 ## Function to convert a list of tokens into a list of refToken objects
 # @author Amy Olex
 # @param tok_list The list of tokens (required)
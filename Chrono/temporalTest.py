@@ -38,15 +38,269 @@
 
 
 import string
-import os
-import inspect
 import re
+from collections import OrderedDict
 from Chrono import utils
+from Chrono import dictionary_registry
+
+## Temporal lexicons used by temporalTest().  They are compiled once, the first time they are needed, into a single
+## Aho-Corasick automaton that finds every lexicon word in a string in one pass, so testing a token scans each of its
+## normalized forms once instead of scanning every word list.
+MONTH = "TextMonth"
+DAY_OF_WEEK = "DayOfWeek"
+PERIOD_INTERVAL = "PeriodInterval"
+AMPM = "AMPM"
+PART_OF_WEEK = "PartOfWeek"
+SEASON_OF_YEAR = "SeasonOfYear"
+PART_OF_DAY = "PartOfDay"
+TIME_ZONE = "TimeZone"
+TEMP_TEXT = "TempText"
+MODIFIER = "Modifier"
+CLIN_ABR = "ClinAbr"
+
+#Note: I took out converting to lower case because the capitilazation adds information for month and day of week mentions.
+full_month = ["January","February","March","April","May","June","July","August","September","October","November","December","january","february","march","april","may","june","july","august","september","october","november","december"]
+abbr_month = ["Jan.", "Feb.","Mar.","Apr.","Jun.","Jul.","Aug.","Sept.","Oct.","Nov.","Dec.","jan.","feb.","mar.","apr.","jun.","jul.","aug.","sept.","oct.","nov.","dec.", "Jan", "Feb","Mar","Apr","Jun","Jul","Aug","Sept","Oct","Nov","Dec","jan","feb","mar","apr","jun","jul","aug","sept","oct","nov","dec"]
+full_day = ["Monday","Tuesday","Wednesday","Thursday","Friday","Saturday","Sunday"]
+abbr_day = ["Mon.","Tues.","Wed.","Thurs.","Fri.","Sat.","Sun."]
+period_interval = ["decades", "decade", "yesterday", "yesterdays", "today", "todays", "tomorrow", "tomorrows", "day", "week",
+         "month", "year", "daily", "weekly", "monthly", "yearly", "century", "minute", "second", "hour", "hourly",
+         "days", "weeks", "months", "years", "centuries", "century", "minutes", "seconds", "hours", "time",
+         "annual", "hr", "hrs", "min", "mins", "quarter"] #, "date"]
+         # removed relative terms: "shortly", "soon", "briefly", "awhile", "future", "lately",
+         ## possibly add in abbreviations like yr, sec, min, etc.
+am = ["AM","am","A.M.","AM.","a.m.","am."]
+pm = ["PM","pm","P.M.","p.m.","pm.","PM."]
+part_of_week = ["weekend", "weekends"]
+season_of_year = ["summer", "winter", "fall", "spring"]
+part_of_day = ["morning","evening","afternoon","night","dawn","dusk","tonight","overnight","nights","mornings","evening","afternoons","noon","bedtime","midnight","eve"]
+time_zones = ["AST","EST","EDT","CST","CDT","MST","MDT","PST","PDT","HST","SST","SDT","GMT","UTC","BST","CET","IST","MSD","MSK",
+              "AKST","HAST","HADT","CHST","CEST","EEST"]
+temp_text = ["this","now", "current", "last", "before", "previously", "ago", "pre", "after", "later",
+    "earlier", "early", "until", "quarter", "time", "next", "previous", "coming", "past", "point", "long", "period",
+    "lately", "future", "awhile", "briefly", "longstanding", "soon", "shortly", "length", "final", "latest", "prior", "recent",
+    "recently","post-op","postoperative","hospital","life"]
+modifier_text = ["nearly", "almost", "or so", "late", "mid","fiscal","fy", "over", "early", "few", "approximately", "<", "beginning"]
+
+#remove all punctuation except periods for AM/PM
+ampm_punct = "!\"#$%&\'()*+,-/:;<=>?@[]^_`{|}~"
+drop_commas = str.maketrans("", "", ",")
+punct_to_space = str.maketrans(string.punctuation, " "*len(string.punctuation))
+ampm_punct_to_space = str.maketrans(ampm_punct, " "*len(ampm_punct))
+zone_punct_to_space = str.maketrans(string.punctuation+"0123456789", " "*(len(string.punctuation)+10))
+pod_pattern = re.compile('POD[#\s]{0,1}[#\s]{0,1}[0-9]{1,}')
+
+## Each lexicon is tested against one normalized form of the text:
+#    comma - commas removed, case kept
+#    lower - lower case with punctuation replaced by spaces
+#    punct - punctuation replaced by spaces, case kept
+#    ampm  - punctuation other than periods replaced by spaces
+#    zone  - punctuation and digits replaced by spaces
+#    raw   - the text as is
+normalizers = {"comma": lambda text: text.translate(drop_commas),
+               "lower": lambda text: text.lower().translate(punct_to_space).strip(),
+               "punct": lambda text: text.translate(punct_to_space).strip(),
+               "ampm": lambda text: text.translate(ampm_punct_to_space).strip(),
+               "zone": lambda text: text.translate(zone_punct_to_space).strip(),
+               "raw": lambda text: text}
+
+## How a lexicon hit in the normalized text decides the test, mirroring the original list scans:
+#    any        - a lexicon word anywhere in the text
+#    first      - a lexicon word in the first space separated piece
+#    first_word - the first piece that contains a lexicon word must itself be part of a lexicon word
+#    some_word  - some piece contains a lexicon word and is itself part of a lexicon word
+## The clinical abbreviations are named by their file in the dictionary_registry instead of listed here.
+lexicons = OrderedDict([(MONTH, (full_month + abbr_month, "comma", "any")),
+                        (DAY_OF_WEEK, (full_day + abbr_day, "comma", "any")),
+                        (PERIOD_INTERVAL, (period_interval, "lower", "any")),
+                        (AMPM, (am + pm, "ampm", "some_word")),
+                        (PART_OF_WEEK, (part_of_week, "punct", "first")),
+                        (SEASON_OF_YEAR, (season_of_year, "punct", "first_word")),
+                        (PART_OF_DAY, (part_of_day, "lower", "first")),
+                        (TIME_ZONE, (time_zones, "zone", "any")),
+                        (TEMP_TEXT, (temp_text, "lower", "first_word")),
+                        (MODIFIER, (modifier_text, "lower", "first_word")),
+                        (CLIN_ABR, ("AbrClinical", "raw", "first_word"))])
+
+
+## Class that finds every occurrence of a set of categorized words in a string with an Aho-Corasick automaton.
+# @param words A list of (word, category) tuples.
+class LexiconMatcher:
+
+    ## The constructor
+    def __init__(self, words):
+        ## goto transitions, failure links, and the (word length, category) outputs of each state
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        ## every substring of the words in each category, to test if a piece of text is part of a word
+        self.substrings = {}
+
+        for word, category in words:
+            if word == "":
+                continue
+            state = 0
+            for char in word:
+                nxt = self.goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][char] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = nxt
+            if (len(word), category) not in self.output[state]:
+                self.output[state].append((len(word), category))
+            parts = self.substrings.setdefault(category, set())
+            for start in range(len(word)):
+                for end in range(start + 1, len(word) + 1):
+                    parts.add(word[start:end])
+
+        ## breadth first pass to set the failure links, merging in the outputs of the failure state
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, nxt in self.goto[state].items():
+                queue.append(nxt)
+                back = self.fail[state]
+                while back and char not in self.goto[back]:
+                    back = self.fail[back]
+                self.fail[nxt] = self.goto[back].get(char, 0)
+                self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+
+    ## Finds all lexicon words in the text, including overlapping ones.
+    # @param text The string to scan
+    # @return A dictionary from each category found to a list of (start, end) spans of its words.
+    def findAll(self, text):
+        hits = {}
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        state = 0
+        for idx, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, category in output[state]:
+                hits.setdefault(category, []).append((idx + 1 - length, idx + 1))
+        return hits
+
+    ## Tests if a piece of text is part of any word in a category.
+    # @param text The string to test
+    # @param category The category of words
+    # @return True if text is a substring of a word in the category.
+    def isPartOfWord(self, text, category):
+        return text in self.substrings.get(category, ())
+
+####
+#END_MODULE
+####
+
+## The LexiconMatcher of all the lexicons, built by getLexiconMatcher().
+matcher = None
 
-global dictpath
-thisfilename = inspect.getframeinfo(inspect.currentframe()).filename
-thispath = os.path.dirname(os.path.abspath(thisfilename))
-dictpath = os.path.join(thispath,"../dictionary")
+
+## Gets the LexiconMatcher of all the lexicons, building it the first time it is needed.
+# @return The shared LexiconMatcher object.
+def getLexiconMatcher():
+    global matcher
+    if matcher is None:
+        dictionaries = dictionary_registry.getRegistry()
+        words = []
+        for category, (lexicon, form, rule) in lexicons.items():
+            if isinstance(lexicon, str):
+                lexicon = dictionaries.getList(lexicon)
+            words.extend((word, category) for word in lexicon)
+        matcher = LexiconMatcher(words)
+    return matcher
+
+####
+#END_MODULE
+####
+
+
+## Normalizes a string into every form the lexicons are tested against and scans each distinct form once.
+# @param text The string being parsed
+# @return A dictionary from each form name to a tuple of the normalized string and its lexicon hits.
+def scanForms(text):
+    lexicon_matcher = getLexiconMatcher()
+    scans = {}
+    ## most tokens have no punctuation or digits, so many of their forms are the same string
+    hits = {}
+    for form, normalize in normalizers.items():
+        norm = normalize(text)
+        if norm not in hits:
+            hits[norm] = lexicon_matcher.findAll(norm)
+        scans[form] = (norm, hits[norm])
+    return scans
+
+####
+#END_MODULE
+####
+
+## Applies the test for one lexicon category to a string.
+# @param category The lexicon category to test
+# @param text The string being parsed
+# @param scans The scanForms() of text if already computed, otherwise only the form needed is scanned.
+# @return True if the text passes the test for the category.
+def testLexicon(category, text, scans=None):
+    lexicon_matcher = getLexiconMatcher()
+    lexicon, form, rule = lexicons[category]
+    if scans is None:
+        scans = {}
+    scan = scans.get(form)
+    if scan is None:
+        norm = normalizers[form](text)
+        scan = (norm, lexicon_matcher.findAll(norm))
+        scans[form] = scan
+    norm, hits = scan
+
+    spans = hits.get(category)
+    if not spans:
+        return False
+    if rule == "any":
+        return True
+
+    #convert to list of pieces, keeping the span of each one
+    start = 0
+    for t in norm.split(" "):
+        end = start + len(t)
+        found = any(s >= start and e <= end for s, e in spans)
+        start = end + 1
+        if rule == "first":
+            return found
+        if not found:
+            continue
+        if lexicon_matcher.isPartOfWord(t, category):
+            return True
+        if rule == "some_word":
+            continue
+        if category == CLIN_ABR and pod_pattern.search(t):
+            #print("FOUND POD!!!  " + t)
+            return True
+        return False
+    return False
+
+####
+#END_MODULE
+####
+
+## Takes in a single text string and identifies if it contains any of the temporal lexicons, in the same order as the
+## individual has*() tests, scanning each normalized form of the text only once.
+# @param text The string being parsed
+# @param include_relative Boolean indicating if relative temporal terms (TempText) are included.
+# @return True if any lexicon test passes, False otherwise.
+def hasTemporalLexicon(text, include_relative=True):
+    scans = scanForms(text)
+    for category, (lexicon, form, rule) in lexicons.items():
+        if category == TEMP_TEXT and not include_relative:
+            continue
+        if category in scans[form][1] and testLexicon(category, text, scans):
+            return True
+    return False
+
+####
+#END_MODULE
+####
 
 
 ## Takes in a single text string and identifies if it is a month of the year
@@ -54,28 +308,7 @@ dictpath = os.path.join(thispath,"../dictionary")
 # @param text The text to parse
 # @return value The normalized string value for the month of the year, or None if no month of year found.
 def hasTextMonth(text):
-    
-    #Note: I took out converting to lower case because the capitilazation adds information for month mentions.
-    #remove all commas
-    text_norm = text.translate(str.maketrans("", "", ","))
-    #convert to list
-    #text_list = text_norm.split(" ")
-    
-    #define my day lists
-    full_month = ["January","February","March","April","May","June","July","August","September","October","November","December","january","february","march","april","may","june","july","august","september","october","november","december"]
-    abbr_month = ["Jan.", "Feb.","Mar.","Apr.","Jun.","Jul.","Aug.","Sept.","Oct.","Nov.","Dec.","jan.","feb.","mar.","apr.","jun.","jul.","aug.","sept.","oct.","nov.","dec.", "Jan", "Feb","Mar","Apr","Jun","Jul","Aug","Sept","Oct","Nov","Dec","jan","feb","mar","apr","jun","jul","aug","sept","oct","nov","dec"]
-    
-    answer = next((m for m in full_month if m in text_norm), None)
-    if answer is not None:
-        return True
-    else:
-        answer2 = next((a for a in abbr_month if a in text_norm), None)
-        if answer2 is not None:
-            return True
-        else:
-            return False
-
-    
+    return testLexicon(MONTH, text)
 ####
 #END_MODULE
 ####
@@ -85,27 +318,7 @@ def hasTextMonth(text):
 # @param text The text to parse
 # @return value True if day of week is found, False otherwise.
 def hasDayOfWeek(text):
-    
-    #Note: I took out converting to lower case because the capitilazation adds information for day of week mentions.
-    #remove all commas
-    text_norm = text.translate(str.maketrans("", "", ","))
-    #convert to list
-    #text_list = text_norm.split(" ")
-    
-    #define my day lists
-    full_day = ["Monday","Tuesday","Wednesday","Thursday","Friday","Saturday","Sunday"]
-    abbr_day = ["Mon.","Tues.","Wed.","Thurs.","Fri.","Sat.","Sun."]
-
-    answer = next((m for m in full_day if m in text_norm), None)
-    if answer is not None:
-        return True
-    else:
-        answer2 = next((a for a in abbr_day if a in text_norm), None)
-        if answer2 is not None:
-            return True
-        else:
-            return False
-
+    return testLexicon(DAY_OF_WEEK, text)
 ####
 #END_MODULE
 ####
@@ -115,29 +328,7 @@ def hasDayOfWeek(text):
 # @param text The string being parsed
 # @return True if a calendar interval or period phrase exists, False otherwise.
 def hasPeriodInterval(text):
-    
-    #convert to all lower
-    text_lower = text.lower()
-    #remove all punctuation
-    text_norm = text_lower.translate(str.maketrans(string.punctuation, ' '*len(string.punctuation)))
-    #convert to list
-    text_list = text_norm.split(" ")
-    
-    #define my period lists
-    terms = ["decades", "decade", "yesterday", "yesterdays", "today", "todays", "tomorrow", "tomorrows", "day", "week",
-             "month", "year", "daily", "weekly", "monthly", "yearly", "century", "minute", "second", "hour", "hourly", 
-             "days", "weeks", "months", "years", "centuries", "century", "minutes", "seconds", "hours", "time", 
-             "annual", "hr", "hrs", "min", "mins", "quarter"] #, "date"]
-             # removed relative terms: "shortly", "soon", "briefly", "awhile", "future", "lately", 
-             
-    ## possibly add in abbreviations like yr, sec, min, etc.
-    
-    answer = next((m for m in terms if m in text_norm), None)
-    if answer is not None:
-        return True
-    else:
-        return False
-    
+    return testLexicon(PERIOD_INTERVAL, text)
 ####
 #END_MODULE
 ####
@@ -149,30 +340,7 @@ def hasPeriodInterval(text):
 # Note: this may be a little strict. I require the text to be found in the list, and a list item to be found in the text string.
 # Thus, strings such as 1330AM won't be identified, but that could probably be caught with some other method.
 def hasAMPM(text):
-    
-    #remove all ounctuation except periods
-    punct = "!\"#$%&\'()*+,-/:;<=>?@[]^_`{|}~"
-    text_norm = text.translate(str.maketrans(punct, ' '*len(punct))).strip()
-    #convert to list
-    text_list = text_norm.split(' ')
-    
-    #define my day lists
-    am = ["AM","am","A.M.","AM.","a.m.","am."]
-    pm = ["PM","pm","P.M.","p.m.","pm.","PM."]
-    
-    ampm = am+pm
-    
-    t_flag = False
-    for t in text_list:
-        answer = next((m for m in ampm if t in m), None)
-        if answer is not None and not t_flag:
-            answer2 = next((m for m in ampm if m in t), None)
-            if answer2 is not None and not t_flag:
-                t_flag = True
-
-    
-    return t_flag
-    
+    return testLexicon(AMPM, text)
 ####
 #END_MODULE
 ####
@@ -249,24 +417,7 @@ def hasDateOrTime(text):
 # @param text String being parsed
 # @return Outputs True if it contains a Part of Week.
 def hasPartOfWeek(text):
-    
-    #convert to all lower
-    text_lower = text.lower()
-    #remove all punctuation
-    text_norm = text.translate(str.maketrans(string.punctuation, " "*len(string.punctuation))).strip()
-    #convert to list
-    text_list = text_norm.split(" ")
-    
-    #define my period lists
-    partofday = ["weekend", "weekends"]
-    
-    for t in text_list:
-        answer = next((m for m in partofday if m in t), None)
-        if answer is not None:
-            return True
-        else:
-            return False
-    
+    return testLexicon(PART_OF_WEEK, text)
 ####
 #END_MODULE
 ####
@@ -276,26 +427,7 @@ def hasPartOfWeek(text):
 # @param text String being parsed
 # @return Outputs True if it contains a season.
 def hasSeasonOfYear(text):
-    
-    #convert to all lower
-    text_lower = text.lower()
-    #remove all punctuation
-    text_norm = text.translate(str.maketrans(string.punctuation, " "*len(string.punctuation))).strip()
-    #convert to list
-    text_list = text_norm.split(" ")
-    
-    #define my season lists
-    seasonofyear = ["summer", "winter", "fall", "spring"]
-    
-    for t in text_list:
-        answer = next((m for m in seasonofyear if m in t), None)
-        if answer is not None:
-            answer2 = next((m for m in seasonofyear if t in m), None)
-            if answer2 is not None:
-                return True
-            else:
-                return False
-    return False
+    return testLexicon(SEASON_OF_YEAR, text)
 ####
 #END_MODULE
 ####
@@ -305,24 +437,7 @@ def hasSeasonOfYear(text):
 # @param text String being parsed
 # @return Outputs True if it contains a part of day.
 def hasPartOfDay(text):
-    
-    #convert to all lower
-    text_lower = text.lower()
-    #remove all punctuation
-    text_norm = text_lower.translate(str.maketrans(string.punctuation, " "*len(string.punctuation))).strip()
-    #convert to list
-    text_list = text_norm.split(" ")
-    
-    #define my part of day lists
-    partofday = ["morning","evening","afternoon","night","dawn","dusk","tonight","overnight","nights","mornings","evening","afternoons","noon","bedtime","midnight","eve"]
-    
-    for t in text_list:
-        answer = next((m for m in partofday if m in t), None)
-        if answer is not None:
-            return True
-        else:
-            return False
-    return False
+    return testLexicon(PART_OF_DAY, text)
 ####
 #END_MODULE
 ####
@@ -332,34 +447,7 @@ def hasPartOfDay(text):
 # @param text String being parsed
 # @return Outputs True if it contains a time zone.
 def hasTimeZone(text):
-    
-    # #remove all punctuation
-    # text_norm = text.translate(str.maketrans(string.punctuation+"0123456789", " "*(len(string.punctuation)+10))).strip()
-    # #convert to list
-    # text_list = text_norm.split(" ")
-    #
-    # #define my season lists
-    # zones = ["AST","EST","EDT","CST","CDT","MST","MDT","PST","PDT","AKST","HST","HAST","HADT","SST","SDT","GMT","CHST","UTC"]
-    #
-    # for t in text_list:
-    #     answer = next((m for m in zones if m in t), None)
-    #     if answer is not None:
-    #         answer2 = next((m for m in zones if t in m), None)
-    #         if answer2 is not None:
-    #             return True
-    #         else:
-    #             return False
-    # return False
-    text_norm = text.translate(str.maketrans(string.punctuation+"0123456789", " "*(len(string.punctuation)+10))).strip()
-    tz = re.search('\d{0,4}(AST|EST|EDT|CST|CDT|MST|MDT|PST|PDT|HST|SST|SDT|GMT|UTC|BST|CET|IST|MSD|MSK)', text_norm)
-
-    if tz:
-        return True
-    else:
-        tz = re.search('\d{0,4}(AKST|HAST|HADT|CHST|CEST|EEST)', text_norm)
-        if tz:
-            return True
-    return False
+    return testLexicon(TIME_ZONE, text)
 ####
 #END_MODULE
 ####
@@ -370,29 +458,7 @@ def hasTimeZone(text):
 # @param text String being parsed
 # @return Outputs True if it contains "now"
 def hasTempText(text):
-    
-    #remove all punctuation and convert to lowercase
-    text_norm = text.translate(str.maketrans(string.punctuation, " "*len(string.punctuation))).strip().lower()
-    #convert to list
-    text_list = text_norm.split(" ")
-    
-    temp_text = ["this","now", "current", "last", "before", "previously", "ago", "pre", "after", "later", 
-    "earlier", "early", "until", "quarter", "time", "next", "previous", "coming", "past", "point", "long", "period",
-    "lately", "future", "awhile", "briefly", "longstanding", "soon", "shortly", "length", "final", "latest", "prior", "recent",
-    "recently","post-op","postoperative","hospital","life"]
- 
-                
-    
-    for t in text_list:
-        answer = next((m for m in temp_text if m in t), None)
-        if answer is not None:
-            answer2 = next((m for m in temp_text if t in m), None)
-            if answer2 is not None:
-                return True
-            else:
-                return False
-    return False
-
+    return testLexicon(TEMP_TEXT, text)
 ####
 #END_MODULE
 ####
@@ -402,22 +468,7 @@ def hasTempText(text):
 # @param text String being parsed
 # @return Outputs True if it contains a modifier
 def hasModifierText(text):
-    # remove all punctuation and convert to lowercase
-    text_norm = text.translate(str.maketrans(string.punctuation, " " * len(string.punctuation))).strip().lower()
-    # convert to list
-    text_list = text_norm.split(" ")
-
-    temp_text = ["nearly", "almost", "or so", "late", "mid","fiscal","fy", "over", "early", "few", "approximately", "<", "beginning"]
-
-    for t in text_list:
-        answer = next((m for m in temp_text if m in t), None)
-        if answer is not None:
-            answer2 = next((m for m in temp_text if t in m), None)
-            if answer2 is not None:
-                return True
-            else:
-                return False
-    return False
+    return testLexicon(MODIFIER, text)
 ####
 #END_MODULE
 ####
@@ -428,24 +479,7 @@ def hasModifierText(text):
 # @return Outputs True if it contains a clinical temporal abbreviation
 def hasClinAbr(text):
     # not we do not want to remove punctuation or loiwercase because these features are important for identifying abbreviations.
-    # convert to list
-    text_list = text.split(" ")
-
-    #load in dictionary of clinical abbreviations
-    temp_text = [line.rstrip() for line in open(os.path.join(dictpath, "AbrClinical.txt"), "r")]
-
-    for t in text_list:
-        answer = next((m for m in temp_text if m in t), None)
-        if answer is not None:
-            answer2 = next((m for m in temp_text if t in m), None)
-            if answer2 is not None:
-                return True
-            elif re.search('POD[#\s]{0,1}[#\s]{0,1}[0-9]{1,}', t):
-                print("FOUND POD!!!  " + t)
-                return True
-            else:
-                return False
-    return False
+    return testLexicon(CLIN_ABR, text)
 ####
 #END_MODULE
 ####
@@ -0,0 +1,219 @@
+# Copyright (c) 2022
+# Amy L. Olex, Virginia Commonwealth University
+# alolex at vcu.edu
+#
+# Luke Maffey, Virginia Commonwealth University
+# maffeyl at vcu.edu
+#
+# Nicholas Morton,  Virginia Commonwealth University
+# nmorton at vcu.edu
+#
+# Bridget T. McInnes, Virginia Commonwealth University
+# btmcinnes at vcu.edu
+#
+# This file is part of Chrono
+#
+# Chrono is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# Chrono is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chrono; if not, write to
+#
+# The Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330,
+# Boston, MA  02111-1307, USA.
+
+
+
+
+## Remembers whether each token is numeric and temporal so markTemporal() only runs numericTest() and temporalTest()
+## once per distinct token.  The memo is held by the pipeline, so it persists across all the documents parsed by a
+## process and the common vocabulary of a corpus quickly costs a single dictionary lookup per token.  It can be warmed
+## from, and saved to, a vocabulary file with one token per line.  Worker processes each hold their own memo and report
+## the tokens they add to it with each document, so the parent process can save a single vocabulary for the run.
+
+import os
+from collections import OrderedDict
+from Chrono import utils
+
+
+## Class to memoize the numeric and temporal flags of tokens, keeping the most recently used entries up to a limit.
+# @param max_entries The largest number of tokens to remember.
+class TokenMemo:
+
+    ## The constructor
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        ## the tokens added, and the hit and miss counts, not yet reported by takeUpdate(), or None if the memo does
+        ## not report updates
+        self.new_tokens = None
+        self.reported_hits = 0
+        self.reported_misses = 0
+
+    ## Gets the numeric and temporal flags of a token, computing them if the token has not been seen before.
+    # @param tok The token text
+    # @param pos The part of speech of the token, only used to check if it is a CD
+    # @param include_relative Boolean indicating if relative temporal terms are marked as temporal.
+    # @return A tuple with the numeric flag and the temporal flag.
+    def classify(self, tok, pos, include_relative):
+        key = (tok, pos == "CD", include_relative)
+        flags = self.entries.get(key)
+        if flags is not None:
+            self.entries.move_to_end(key)
+            self.hits = self.hits + 1
+            return flags
+
+        self.misses = self.misses + 1
+        if self.new_tokens is not None:
+            self.new_tokens.append(tok)
+        flags = (utils.numericTest(tok, pos), utils.temporalTest(tok, include_relative))
+        self._store(key, flags)
+        return flags
+
+    def _store(self, key, flags):
+        self.entries[key] = flags
+        self.entries.move_to_end(key)
+        ## evict the least recently used tokens
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    ## Classifies every token in a vocabulary file ahead of time.  Warming does not count towards the hits and misses.
+    # @param path The vocabulary file, with one token per line.
+    # @param include_relative Boolean indicating if relative temporal terms are marked as temporal.
+    # @return The number of tokens read.
+    def warm(self, path, include_relative):
+        num_tokens = 0
+        for tok in readVocabulary(path):
+            temporal = utils.temporalTest(tok, include_relative)
+            self._store((tok, False, include_relative), (utils.numericTest(tok, None), temporal))
+            ## CD tokens are always numeric
+            self._store((tok, True, include_relative), (True, temporal))
+            num_tokens = num_tokens + 1
+        return num_tokens
+
+    ## Writes the tokens in the memo to a vocabulary file that warm() can read, least recently used first.
+    # @param path The vocabulary file to write.
+    # @return The number of tokens written.
+    def saveVocabulary(self, path):
+        tokens = list(OrderedDict.fromkeys(tok for tok, is_cd, include_relative in self.entries))
+        return writeVocabulary(path, tokens)
+
+    ## Starts keeping the tokens added to the memo so they can be reported with takeUpdate().  Only worker processes
+    ## do this, so a long running memo does not keep a growing list of tokens no one takes.
+    def reportUpdates(self):
+        self.new_tokens = []
+        self.reported_hits = self.hits
+        self.reported_misses = self.misses
+
+    ## Takes the tokens added to the memo, and the number of hits and misses, since the last call (or since
+    ## reportUpdates()).  Used by worker processes to report to a TokenMemoMerger in the parent process.
+    # @return A dictionary with the new "tokens", in the order they were added, and the "hits" and "misses".
+    def takeUpdate(self):
+        update = {"tokens": self.new_tokens, "hits": self.hits - self.reported_hits,
+                  "misses": self.misses - self.reported_misses}
+        self.new_tokens = []
+        self.reported_hits = self.hits
+        self.reported_misses = self.misses
+        return update
+
+    ## Gets the memo statistics.
+    # @return A dictionary with the number of hits, misses, tokens remembered, and the hit rate.
+    def getStats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries),
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+####
+#END_MODULE
+####
+
+
+## Class that merges the updates reported by the TokenMemo of each worker process, so the parent process can report
+## the memo statistics of the whole run and save one vocabulary from it.  The vocabulary starts with the tokens in the
+## vocabulary file the workers were warmed from, followed by the tokens the workers added, up to a limit.
+# @param max_entries The largest number of tokens to keep in the vocabulary.
+# @param vocab_path The vocabulary file the workers were warmed from, or None.
+class TokenMemoMerger:
+
+    ## The constructor
+    def __init__(self, max_entries=100000, vocab_path=None):
+        self.max_entries = max_entries
+        self.tokens = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if vocab_path is not None and os.path.exists(vocab_path):
+            self._add(readVocabulary(vocab_path))
+
+    ## Adds the update reported by a worker's TokenMemo.takeUpdate().
+    # @param update The dictionary with the new "tokens" and the "hits" and "misses".
+    def merge(self, update):
+        self.hits = self.hits + update["hits"]
+        self.misses = self.misses + update["misses"]
+        self._add(update["tokens"])
+
+    def _add(self, tokens):
+        for tok in tokens:
+            self.tokens[tok] = True
+            self.tokens.move_to_end(tok)
+        while len(self.tokens) > self.max_entries:
+            self.tokens.popitem(last=False)
+
+    ## Writes the merged vocabulary to a file that TokenMemo.warm() can read.
+    # @param path The vocabulary file to write.
+    # @return The number of tokens written.
+    def saveVocabulary(self, path):
+        return writeVocabulary(path, list(self.tokens))
+
+    ## Gets the memo statistics of all the workers.
+    # @return A dictionary with the number of hits, misses, tokens in the vocabulary, and the hit rate.
+    def getStats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.tokens),
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+####
+#END_MODULE
+####
+
+
+## Reads the tokens in a vocabulary file, skipping blank lines.
+# @param path The vocabulary file, with one token per line.
+# @return A generator over the tokens.
+def readVocabulary(path):
+    with open(path, "r") as f:
+        for line in f:
+            tok = line.rstrip("\n")
+            if tok:
+                yield tok
+
+####
+#END_MODULE
+####
+
+
+## Writes tokens to a vocabulary file, one per line.
+# @param path The vocabulary file to write.
+# @param tokens The list of tokens.
+# @return The number of tokens written.
+def writeVocabulary(path, tokens):
+    ## write to a temporary file and rename it so a partially written vocabulary is never read
+    tmpname = path + "." + str(os.getpid()) + ".tmp"
+    with open(tmpname, "w") as f:
+        for tok in tokens:
+            f.write(tok + "\n")
+    os.replace(tmpname, path)
+    return len(tokens)
+
+####
+#END_MODULE
+####
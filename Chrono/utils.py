@@ -42,10 +42,12 @@ from nltk.stem.snowball import SnowballStemmer
 from nltk.tokenize.util import align_tokens
 # from Chrono import chronoEntities as t6
 from Chrono import temporalTest as tt
+from Chrono import dictionary_registry
 import dateutil.parser
 # import datetime
 # from Chrono import TimePhrase_to_Chrono
 from Chrono import TimePhraseEntity as tp
+from Chrono import referenceToken
 import re
 import csv
 from collections import OrderedDict
@@ -56,28 +58,7 @@ import string
 import copy
 import dateutil.parser as dup
 import datetime
-import inspect
 import os
-from Chrono.ChronoBert import SentenceObj
-
-
-
-## Load the dictionary files
-
-global dictpath
-thisfilename = inspect.getframeinfo(inspect.currentframe()).filename
-thispath = os.path.dirname(os.path.abspath(thisfilename))
-dictpath = os.path.join(thispath,"../dictionary")
-
-global APPROX2
-global APPROX3
-global APPROX10
-global PERIODINT
-
-APPROX2 = [line.rstrip() for line in open(os.path.join(dictpath,"Approximation2.txt"), "r")]
-APPROX3 = [line.rstrip() for line in open(os.path.join(dictpath,"Approximation3.txt"), "r")]
-APPROX10 = [line.rstrip() for line in open(os.path.join(dictpath,"Approximation10.txt"), "r")]
-PERIODINT = [line.rstrip() for line in open(os.path.join(dictpath,"Period-Interval.txt"), "r")]
 
 
 ## Parses a text file to idenitfy all sentences, then identifies all tokens in each sentence seperated by white space with their original file span coordinates.
@@ -89,84 +70,57 @@ PERIODINT = [line.rstrip() for line in open(os.path.join(dictpath,"Period-Interv
 def getWhitespaceTokens2(file_path):
     file = open(file_path, "r")
     raw_text = file.read()
+    file.close()
+    return getWhitespaceTokensFromText(raw_text)
+
+ ####
+ #END_MODULE
+ ####
+
+## Identifies all sentences in a text string, then identifies all tokens in each sentence seperated by white space with their original span coordinates.
+# @param raw_text String containing the raw text blob to be parsed.
+# @return The same values as getWhitespaceTokens2().
+def getWhitespaceTokensFromText(raw_text):
+    table = getTokenTable(raw_text)
+    return raw_text, table.text, table.getTokens(), table.getAbsSpans(), table.getRelSpans(), table.getTags(), \
+        table.getSentBoundaries(), table.sentences, table.getSentMembership()
+
+ ####
+ #END_MODULE
+ ####
+
+## Identifies all sentences in a text string, then identifies all tokens in each sentence seperated by white space and
+## their part of speech, and stores them in a columnar TokenTable in a single pass over the sentences.
+# @param raw_text String containing the raw text blob to be parsed.
+# @param pos_tagging "full" to tag all the tokens at once, or "gated" to only tag each sentence the first time the part
+#                    of speech of one of its tokens is needed (see markTemporal()).
+# @return A referenceToken.TokenTable with the tokens of the text.
+def getTokenTable(raw_text, pos_tagging="full"):
     ## Testing the replacement of all "=" signs by spaces before tokenizing.
     text = raw_text.translate(str.maketrans("=", ' '))
     
     ## Tokenize the sentences
     sentences = sent_tokenize(text)
 
-    #print("Initial sentence 0: " + str(sentences[0]))
     ## Then create a new sentence list by breaking down those with new lines.
     new_sent_list = []
     for s in sentences:
-        #print(s)
         if "\n" in s:
             new_sent_list.extend(s.split("\n"))
         else:
             new_sent_list.append(s)
 
-    #print("New Sent 0: " + str(new_sent_list[0]))
     ## Get spans of the sentences
     sent_spans = align_tokens(new_sent_list, text)
-    
-    ## create empty arrays for white space tokens and sentence delimiters
-    tokenized_text = []
-    rel_text_spans = []
-    abs_text_spans = []
-    
-    ## Loop through each sentence and get the tokens and token spans
-    for s in range(0,len(new_sent_list)):
-        # get the tokens and token spans within the sentence
-        toks = WhitespaceTokenizer().tokenize(new_sent_list[s])
-        span_generator = WhitespaceTokenizer().span_tokenize(new_sent_list[s])
-        rel_spans = [span for span in span_generator]
-        
-        # convert the relative spans into absolute spans
-        abs_spans = []
-        for start, end in rel_spans:
-            abs_spans = abs_spans + [(sent_spans[s][0]+start, sent_spans[s][0]+end)]
-        
-        tokenized_text = tokenized_text + toks
-        abs_text_spans = abs_text_spans + abs_spans
-        rel_text_spans = rel_text_spans + rel_spans
-    
-    ## Now we have the token list and the spans.  We should be able to continue finding sentnence boundaries as before
-    tags = nltk.pos_tag(tokenized_text)
-    sent_boundaries = [0] * len(tokenized_text)
-    sent_membership = [0] * len(tokenized_text)
-
-    ## figure out which tokens are at the end of a sentence
-    tok_counter = 0
-
-    for s in range(0,len(new_sent_list)):
-        sent = new_sent_list[s]
-        #print(sent)
-        sent_split = WhitespaceTokenizer().tokenize(sent)
-        nw_idx = len(sent_split) + tok_counter - 1
-        sent_boundaries[nw_idx] = 1
-        sent_membership[tok_counter:nw_idx + 1] = [s] * ((nw_idx + 1) - tok_counter)
-        tok_counter = tok_counter + len(sent_split)
-
-    #for s in range(0, len(sentences)):
-    #    sent = sentences[s]
-    #
-    #    if "\n" in sent:
-    #        sent_newline = sent.split("\n")
-    #        for sn in sent_newline:
-    #            sent_split = WhitespaceTokenizer().tokenize(sn)
-    #            nw_idx = len(sent_split) + tok_counter - 1
-    #            sent_boundaries[nw_idx] = 1
-    #            sent_membership[tok_counter:nw_idx + 1] = [s] * ((nw_idx + 1) - tok_counter)
-    #            tok_counter = tok_counter + len(sent_split)
-    #
-    #    else:
-    #        sent_split = WhitespaceTokenizer().tokenize(sent)
-    #        nw_idx = len(sent_split) + tok_counter - 1
-    #        sent_boundaries[nw_idx] = 1
-    #        sent_membership[tok_counter:nw_idx + 1] = [s] * ((nw_idx + 1) - tok_counter)
-    #        tok_counter = tok_counter + len(sent_split)
-            
-    return raw_text, text, tokenized_text, abs_text_spans, rel_text_spans, tags, sent_boundaries, new_sent_list, sent_membership
+
+    ## Get the tokens, their spans, and the sentence boundaries, then tag them
+    table = referenceToken.TokenTable(raw_text, text, new_sent_list, sent_spans)
+    if pos_tagging == "gated":
+        table.setTagger(nltk.pos_tag)
+    else:
+        table.setTags(nltk.pos_tag(table.getTokens()))
+
+    return table
 
  ####
  #END_MODULE
@@ -194,7 +148,9 @@ def getDocTime(file, i2b2):
 # @param outfile A string containing the output file location and beginning of file name.
 def write_i2b2(text, phrase_list, outfile):
     outname = outfile.replace(".txt", "")
-    fout = open(outname, "w")
+    ## write to a temporary file and rename it so a partially written file is never left at outname
+    tmpname = outname + ".tmp"
+    fout = open(tmpname, "w")
     
     fout.write("<?xml version=\"1.0\" encoding=\"UTF-8\" ?>\n<ClinicalNarrativeTemporalAnnotation>\n<TEXT><![CDATA[\n")
     
@@ -209,6 +165,7 @@ def write_i2b2(text, phrase_list, outfile):
     fout.write("</TAGS>\n</ClinicalNarrativeTemporalAnnotation>")
     
     fout.close()
+    os.replace(tmpname, outname)
  ####
  #END_MODULE
  ####  
@@ -219,13 +176,17 @@ def write_i2b2(text, phrase_list, outfile):
 # @param chrono_list The list of Chrono objects needed to be written in the file.
 # @param outfile A string containing the output file location and name.
 def write_xml(chrono_list, outfile):
-    fout = open(outfile + ".completed.xml", "w")
+    ## write to a temporary file and rename it so a partially written file is never left in place
+    outname = outfile + ".completed.xml"
+    tmpname = outname + ".tmp"
+    fout = open(tmpname, "w")
     fout.write("<data>\n<annotations>\n")
     for c in chrono_list :
         fout.write(str(c.print_xml()))
     
     fout.write("\n</annotations>\n</data>")
     fout.close()
+    os.replace(tmpname, outname)
  ####
  #END_MODULE
  ####   
@@ -463,16 +424,38 @@ def get_features(data_file):
 ## Marks all the reference tokens that are identified as temporal.
 # @author Amy Olex
 # @param refToks The list of reference Tokens
+# @param include_relative Boolean indicating if relative temporal terms should be marked as temporal.
+# @param gate_pos Boolean indicating if the part of speech should only be looked at in sentences with a temporal or numeric candidate.
+# @param token_memo A token_memo.TokenMemo to look up the numeric and temporal flags of tokens seen before, or None.
 # @return modified list of reftoks
-def markTemporal(refToks, include_relative = True):
-    for ref in refToks:
-        #mark if numeric
-        ref.setNumeric(numericTest(ref.getText(), ref.getPos()))
-        #mark if temporal
-        ref.setTemporal(temporalTest(ref.getText(), include_relative))
+def markTemporal(refToks, include_relative = True, gate_pos = False, token_memo = None):
+    if token_memo is not None:
+        classify = token_memo.classify
+    else:
+        classify = lambda tok, pos, include_relative: (numericTest(tok, pos), temporalTest(tok, include_relative))
+
+    if gate_pos:
+        ## only look for CD tagged numbers in sentences that already have a temporal or numeric candidate, so the
+        ## sentences without one never have to be tagged
+        candidate_sents = set()
+        for ref in refToks:
+            numeric, temporal = classify(ref.getText(), None, include_relative)
+            ref.setNumeric(numeric)
+            ref.setTemporal(temporal)
+            if ref.isNumeric() or ref.isTemporal() or re.search("[0-9]", ref.getText()):
+                candidate_sents.add(ref.getSentMembership())
+        for ref in refToks:
+            if not ref.isNumeric() and ref.getSentMembership() in candidate_sents:
+                ref.setNumeric(ref.getPos() == "CD")
+    else:
+        for ref in refToks:
+            #mark if numeric and temporal
+            numeric, temporal = classify(ref.getText(), ref.getPos(), include_relative)
+            ref.setNumeric(numeric)
+            ref.setTemporal(temporal)
     
-    ## read in the link terms dictionary
-    terms = open("dictionary/LinkTerms.txt", 'r').read().split()
+    ## get the link terms dictionary
+    terms = dictionary_registry.getRegistry().getWords("LinkTerms")
     
     
     ## Now go through the list again and mark all linking words a, an, in, of that appear between 2 temporal and or number tokens.
@@ -546,27 +529,8 @@ def temporalTest(tok, include_relative=True):
         return True
      
    
-    if tt.hasTextMonth(tok):
-        return True
-    if tt.hasDayOfWeek(tok):
-        return True
-    if tt.hasPeriodInterval(tok):
-        return True
-    if tt.hasAMPM(tok):
-        return True
-    if tt.hasPartOfWeek(tok):
-        return True
-    if tt.hasSeasonOfYear(tok):
-        return True
-    if tt.hasPartOfDay(tok):
-        return True
-    if tt.hasTimeZone(tok):
-        return True
-    if tt.hasTempText(tok) and include_relative:
-        return True
-    if tt.hasModifierText(tok):
-        return True
-    if tt.hasClinAbr(tok):
+    #look for the temporal lexicons: months, days of the week, periods, AM/PM, time zones, etc.
+    if tt.hasTemporalLexicon(tok, include_relative):
         return True
     
     return False
@@ -1173,17 +1137,18 @@ def getPhraseNumber(phrase_text, chrono_list, eid):
         
         phrase_set = set(phrase_text.split())
         #print(phrase_set)
+        dictionaries = dictionary_registry.getRegistry()
         
-        #intersect2 = list(set(APPROX2) & phrase_set)
+        #intersect2 = list(dictionaries.getSet("Approximation2") & phrase_set)
         #print(intersect2)
         
-        intersect3 = list(set(APPROX3) & phrase_set)
+        intersect3 = list(dictionaries.getSet("Approximation3") & phrase_set)
         #print(intersect3)
         
-        intersect10 = list(set(APPROX10) & phrase_set)
+        intersect10 = list(dictionaries.getSet("Approximation10") & phrase_set)
         #print(intersect10)
         
-        intersectperiodint = list(set(PERIODINT) & phrase_set)
+        intersectperiodint = list(dictionaries.getSet("Period-Interval") & phrase_set)
         #print(intersectperiodint)
         
         #if len(intersect2) == 1:
@@ -1201,7 +1166,28 @@ def getPhraseNumber(phrase_text, chrono_list, eid):
     return("","NA")
 
 
-def bert_classify(start_span, end_span, sent_text, sent_idx, bert_model, bert_tokenizer, bert_classifier, includeContext, includeAttention, cnn):
+## Determines if BERT has to be run with its attentions for the given feature options.  The CNN only uses the
+## attention features when the context features are not included.
+# @param includeContext Boolean indicating if the context features are used.
+# @param includeAttention Boolean indicating if the attention features are used.
+# @param cnn Boolean indicating if the classifier is the CNN.
+# @return True if the attentions are needed, False otherwise.
+def needsAttention(includeContext, includeAttention, cnn):
+    if cnn:
+        return includeAttention and not includeContext
+    return includeAttention
+
+
+def bert_classify(start_span, end_span, sent_text, sent_idx, bert_model, bert_tokenizer, bert_classifier, includeContext, includeAttention, cnn, embedding_cache=None, max_length=256):
+    from Chrono import inference_broker
+
+    ## the phrase is classified by the shared inference broker process when a client to it is given as the model
+    if isinstance(bert_model, inference_broker.BrokerClient):
+        return bert_model.classify([(start_span, end_span, sent_text, sent_idx)],
+                                   (includeContext, includeAttention, cnn, max_length))[0]
+
+    ## imported here so torch is only loaded when a BERT model is in use
+    from Chrono.ChronoBert import SentenceObj
     #print("In BERT CLASSIFY")
     ## First parse into the SentenceObj structure
     #print("Start Span: " + str(start_span))
@@ -1212,20 +1198,19 @@ def bert_classify(start_span, end_span, sent_text, sent_idx, bert_model, bert_to
     phrase_idx_list.append(list(range(start_span, end_span+1)))  ## based on the way I coded the method I have to have a nested list.
     this_sent = SentenceObj.SentenceObj(text=sent_text, sentence_num=sent_idx, global_sent_char_start_coord=0,
                                         global_sentence_start_coord=0, phrase_idxs=phrase_idx_list,
-                                        max_length=256, bert_model=bert_model, bert_tokenizer=bert_tokenizer,
-                                        context_window=3, gold_labels="", filt=False)
+                                        max_length=max_length, bert_model=bert_model, bert_tokenizer=bert_tokenizer,
+                                        context_window=3, gold_labels="", filt=False, embedding_cache=embedding_cache,
+                                        include_attention=needsAttention(includeContext, includeAttention, cnn))
     #print("BERT tokenized sentence: " + str(this_sent.bert_tokenized_sentence))
     #print("Temporal Phrase Text: " + str(this_sent.datedur_phrases[0].getText()))
 
     ## Second extract BERT embeddings as features for the first and only temporal phrase
-    embedding = this_sent.datedur_phrases[0].getSummarizedEmbedding(include_context=includeContext, include_attention=includeAttention)
-
-    #print("BERT Embedding: " + str(embedding))
-
     ## Third use the embedding to classify the phrase as a DATE or DURATION
     if cnn:
         pred = bert_classifier.predict(np.expand_dims(this_sent.datedur_phrases[0].getMtxFormattedPhrase(15, includeContext, includeAttention), 0)).tolist()[0]
     else:
+        embedding = this_sent.datedur_phrases[0].getSummarizedEmbedding(include_context=includeContext, include_attention=includeAttention)
+        #print("BERT Embedding: " + str(embedding))
         pred = bert_classifier.predict(np.reshape(embedding.numpy(), (1, -1)))
     label_dict = {0:"DURATION", 1:"DATE"}
     #print("PREDICTION: " + str(pred) + " LABEL: " + str(label_dict[pred[0]]))
@@ -1243,6 +1228,59 @@ def bert_classify(start_span, end_span, sent_text, sent_idx, bert_model, bert_to
     result = 1 if pred[0] >=0.5 else 0
     return label_dict[result]
 
+
+## Classifies a batch of temporal phrases as a DATE or DURATION.  Phrases in the same sentence share one SentenceObj,
+## the sentences are run through BERT in mini-batches, and all the phrases are classified with a single call to the
+## classifier, rather than one forward pass and one prediction per phrase as in bert_classify().
+# @param candidates A list of (start_span, end_span, sent_text, sent_idx) tuples, one per phrase, with the same
+#                   meaning as the arguments to bert_classify().
+# @param batch_size The maximum number of sentences in each BERT forward pass.
+# @param embedding_cache An EmbeddingCache to reuse the BERT outputs of sentences seen before, or None.
+# @param max_length The length every sentence is padded to, or None to only pad sentences to the longest in each batch.
+# @return A list with "DATE" or "DURATION" for each candidate, in the same order.
+def bert_classify_batch(candidates, bert_model, bert_tokenizer, bert_classifier, includeContext, includeAttention, cnn, batch_size=16, embedding_cache=None, max_length=256):
+    from Chrono import inference_broker
+
+    if len(candidates) == 0:
+        return []
+
+    ## workers sharing an inference broker hand the phrases to it, and never load torch themselves
+    if isinstance(bert_model, inference_broker.BrokerClient):
+        return bert_model.classify(candidates, (includeContext, includeAttention, cnn, max_length))
+
+    ## imported here so torch is only loaded when a BERT model is in use
+    from Chrono.ChronoBert import SentenceObj
+
+    ## group the phrases by sentence, remembering where each candidate ends up
+    sentence_phrases = OrderedDict()
+    for start_span, end_span, sent_text, sent_idx in candidates:
+        sentence_phrases.setdefault((sent_idx, sent_text), []).append(list(range(start_span, end_span+1)))
+
+    sentences = [SentenceObj.SentenceObj(text=sent_text, sentence_num=sent_idx, global_sent_char_start_coord=0,
+                                         global_sentence_start_coord=0, phrase_idxs=phrase_idx_list,
+                                         max_length=max_length, bert_model=None, bert_tokenizer=bert_tokenizer,
+                                         context_window=3, gold_labels="", filt=False,
+                                         embedding_cache=embedding_cache,
+                                         include_attention=needsAttention(includeContext, includeAttention, cnn))
+                 for (sent_idx, sent_text), phrase_idx_list in sentence_phrases.items()]
+    SentenceObj.batchSentEmbeddings(sentences, bert_model, batch_size)
+
+    phrase_lookup = {}
+    for key, sent in zip(sentence_phrases.keys(), sentences):
+        phrase_lookup[key] = iter(sent.datedur_phrases)
+    phrases = [next(phrase_lookup[(sent_idx, sent_text)]) for start_span, end_span, sent_text, sent_idx in candidates]
+
+    if cnn:
+        preds = bert_classifier.predict(np.stack([p.getMtxFormattedPhrase(15, includeContext, includeAttention) for p in phrases])).tolist()
+        preds = [pred[0] for pred in preds]
+    else:
+        for sent in sentences:
+            sent.summarizePhrases()
+        preds = bert_classifier.predict(np.stack([np.reshape(p.getSummarizedEmbedding(include_context=includeContext, include_attention=includeAttention).numpy(), -1) for p in phrases]))
+
+    label_dict = {0:"DURATION", 1:"DATE"}
+    return [label_dict[1 if pred >= 0.5 else 0] for pred in preds]
+
     
     
     
@@ -0,0 +1,81 @@
+# Copyright (c) 2022
+# Amy L. Olex, Virginia Commonwealth University
+# alolex at vcu.edu
+#
+# Luke Maffey, Virginia Commonwealth University
+# maffeyl at vcu.edu
+#
+# Nicholas Morton,  Virginia Commonwealth University
+# nmorton at vcu.edu
+#
+# Bridget T. McInnes, Virginia Commonwealth University
+# btmcinnes at vcu.edu
+#
+# This file is part of Chrono
+#
+# Chrono is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# Chrono is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chrono; if not, write to
+#
+# The Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330,
+# Boston, MA  02111-1307, USA.
+
+
+## Exports the ChronoBERT feature extractor (the -b BERT model) to an ONNX graph that Chrono.py and ChronoServer.py can
+## run on ONNX Runtime with --bert-onnx.  The graph only outputs the last four hidden states, plus the attentions if
+## --includeAttention is given.  After exporting, the ONNX outputs are checked against the torch model.
+##
+## Example Usage:  python ChronoBertExport.py -b ./bert_model -o ./bert_model.onnx --includeAttention
+
+import argparse
+import sys
+
+from chronoML import backends
+from Chrono.ChronoBert import bert_encoder
+
+
+## Sentences used to check the exported graph against the torch model.
+CHECK_SENTENCES = ["He was admitted on 03/04/2018 for 3 days.",
+                   "The patient returned 2 weeks later with a history of chest pain over the last 10 years."]
+
+
+if __name__ == "__main__":
+
+    ## Parse input arguments
+    parser = argparse.ArgumentParser(description='Export the ChronoBERT feature extractor to ONNX.')
+    parser.add_argument('-b', metavar='BERTmodel', type=str, help='The path of the pre-built BERT model to export.', required=True)
+    parser.add_argument('-o', metavar='onnxFile', type=str, help='The path to write the ONNX graph to.', required=True)
+    parser.add_argument('--includeAttention', action="store_true", help='Also export the attentions, which are needed to run Chrono with --includeAttention.', default=False)
+    parser.add_argument('--opset', type=int, help='The ONNX opset version to export with. Default is 14.', required=False, default=14)
+    parser.add_argument('--tolerance', type=float, help='The largest difference allowed between the torch and ONNX outputs. Default is 1e-4.', required=False, default=1e-4)
+    args = parser.parse_args()
+
+    bert_model = backends.loadBertModel(args.b)
+    bert_tokenizer = backends.loadBertTokenizer(args.b)
+
+    bert_encoder.exportOnnx(bert_model, args.o, include_attention=args.includeAttention, opset_version=args.opset)
+    print("Exported " + args.b + " to " + args.o)
+
+    ## Check the graph with both padded and unpadded batches.
+    onnx_encoder = bert_encoder.OnnxBertEncoder(args.o)
+    torch_encoder = bert_encoder.BertEncoder(bert_model)
+    max_diff = 0
+    for padding in ("max_length", "longest"):
+        encoded = bert_tokenizer(CHECK_SENTENCES, padding=padding, max_length=256, truncation=True, return_tensors="pt")
+        max_diff = max(max_diff, bert_encoder.maxEncoderDifference(torch_encoder, onnx_encoder, encoded["input_ids"],
+                                                                   encoded["attention_mask"], args.includeAttention))
+
+    print("Largest difference from the torch model: " + str(max_diff))
+    if max_diff > args.tolerance:
+        print("ERROR: the ONNX outputs differ from the torch model by more than " + str(args.tolerance))
+        sys.exit(1)
@@ -0,0 +1,69 @@
+# Copyright (c) 2022
+# Amy L. Olex, Virginia Commonwealth University
+# alolex at vcu.edu
+#
+# Luke Maffey, Virginia Commonwealth University
+# maffeyl at vcu.edu
+#
+# Nicholas Morton,  Virginia Commonwealth University
+# nmorton at vcu.edu
+#
+# Bridget T. McInnes, Virginia Commonwealth University
+# btmcinnes at vcu.edu
+#
+# This file is part of Chrono
+#
+# Chrono is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# Chrono is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chrono; if not, write to
+#
+# The Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330,
+# Boston, MA  02111-1307, USA.
+
+
+## Exports a trained ChronoBERT CNN classifier (the -B model used with --cnn) to a .npz bundle that Chrono.py and
+## ChronoServer.py run with NumPy, so TensorFlow is not loaded when parsing.  Pass the bundle to -B in place of the
+## Keras model.  After exporting, the NumPy predictions are checked against the Keras model on random phrase matrices.
+##
+## Example Usage:  python ChronoCnnExport.py -B ./bert_cnn.h5 -o ./bert_cnn.npz
+
+import argparse
+import sys
+
+import numpy as np
+
+from chronoML import backends
+from Chrono.ChronoBert import cnn_head
+
+
+if __name__ == "__main__":
+
+    ## Parse input arguments
+    parser = argparse.ArgumentParser(description='Export the ChronoBERT CNN classifier to a NumPy weight bundle.')
+    parser.add_argument('-B', metavar='BERTClassificationModel', type=str, help='The path of the trained Keras CNN classifier to export.', required=True)
+    parser.add_argument('-o', metavar='npzFile', type=str, help='The path to write the .npz weight bundle to.', required=True)
+    parser.add_argument('--samples', type=int, help='The number of random phrase matrices to check the export with. Default is 64.', required=False, default=64)
+    parser.add_argument('--tolerance', type=float, help='The largest difference allowed between the Keras and NumPy predictions. Default is 1e-5.', required=False, default=1e-5)
+    args = parser.parse_args()
+
+    keras_model = backends.loadKerasModel(args.B)
+    cnn_head.exportCnnWeights(keras_model, args.o)
+    print("Exported " + args.B + " to " + args.o)
+
+    x = np.random.RandomState(0).randn(args.samples, *keras_model.input_shape[1:]).astype(np.float32)
+    max_diff = float(np.max(np.abs(keras_model.predict(x) - cnn_head.NumpyCnn(args.o).predict(x))))
+
+    print("Largest difference from the Keras model: " + str(max_diff))
+    if max_diff > args.tolerance:
+        print("ERROR: the NumPy predictions differ from the Keras model by more than " + str(args.tolerance))
+        sys.exit(1)
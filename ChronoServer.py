@@ -0,0 +1,169 @@
+# Copyright (c) 2018 
+# Amy L. Olex, Virginia Commonwealth University
+# alolex at vcu.edu
+#
+# Luke Maffey, Virginia Commonwealth University
+# maffeyl at vcu.edu
+#
+# Nicholas Morton,  Virginia Commonwealth University 
+# nmorton at vcu.edu
+#
+# Bridget T. McInnes, Virginia Commonwealth University
+# btmcinnes at vcu.edu
+#
+# This file is part of Chrono
+#
+# Chrono is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# Chrono is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chrono; if not, write to 
+#
+# The Free Software Foundation, Inc., 
+# 59 Temple Place - Suite 330, 
+# Boston, MA  02111-1307, USA.
+
+
+## Runs Chrono as a long-running local service.  All models are loaded once at startup and kept resident,
+## then each request is parsed in memory and the results are returned as JSON.
+##
+## Example Usage:  python ChronoServer.py -m NB -M NB_model.pkl -d data.csv -b ./bert_model -B ./svm_model.pkl --port 8050
+##
+## Requests are HTTP POSTs to /parse with a JSON body of the form {"text": "...", "doctime": "2018-03-04"}.
+## The response contains the parsed "timex_phrases" and "chrono_master_list" entities.
+
+import argparse
+import json
+import os
+import socketserver
+import traceback
+import dateutil.parser
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from Chrono import pipeline
+
+
+## Handles the HTTP requests sent to the Chrono service.
+class ChronoRequestHandler(BaseHTTPRequestHandler):
+
+    ## Reports that the service is up and the models are loaded.
+    def do_GET(self):
+        if self.path == "/health":
+            health = {"status": "ok"}
+            if self.server.chrono_pipeline.token_memo is not None:
+                health["token_memo"] = self.server.chrono_pipeline.token_memo.getStats()
+            self.send_json(200, health)
+        else:
+            self.send_json(404, {"error": "Unknown path: " + self.path})
+
+    ## Parses the text and doctime in the request body.
+    def do_POST(self):
+        if self.path != "/parse":
+            self.send_json(404, {"error": "Unknown path: " + self.path})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length))
+            text = request["text"]
+            doctime = dateutil.parser.parse(request["doctime"])
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_json(400, {"error": "Requests must be JSON with 'text' and 'doctime' fields: " + str(e)})
+            return
+
+        try:
+            chrono_master_list, timex_phrases = self.server.chrono_pipeline.process(text, doctime)
+            response = {"timex_phrases": [pipeline.timexToDict(t) for t in timex_phrases],
+                        "chrono_master_list": [pipeline.chronoEntityToDict(c) for c in chrono_master_list]}
+        except Exception as e:
+            ## keep serving the other requests, but report the failure to the client and in the server log
+            traceback.print_exc()
+            self.send_json(500, {"error": "Chrono failed to parse the document: " + repr(e)})
+            return
+        self.send_json(200, response)
+
+    def send_json(self, status, content):
+        body = json.dumps(content, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    ## Unix socket clients do not have an address, so log the socket path instead.
+    def address_string(self):
+        return self.client_address[0] if self.client_address else self.server.server_address
+
+
+## Serves HTTP requests over a Unix domain socket instead of a TCP port.
+class UnixHTTPServer(socketserver.UnixStreamServer):
+
+    def __init__(self, socket_path, handler):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, handler)
+
+
+if __name__ == "__main__":
+
+    ## Parse input arguments
+    parser = argparse.ArgumentParser(description='Run Chrono as a local service that keeps all models loaded between requests.')
+    parser.add_argument('-m', metavar='MLmethod', type=str, help='The machine learning method to use. Must be one of NN (neural network), DT (decision tree), SVM (support vector machine), NB (naive bayes, default).', required=False, default='NB')
+    parser.add_argument('-d', metavar='MLTrainData', type=str, help='A string representing the file name that contains the CSV file with the training data matrix.', required=False, default=False)
+    parser.add_argument('-c', metavar='MLTrainClass', type=str, help='A string representing the file name that contains the known classes for the training data matrix.', required=False, default=False)
+    parser.add_argument('-M', metavar='MLmodel', type=str, help='The path and file name of a pre-build ML model for loading.', required=False, default=None)
+    parser.add_argument('-b', metavar='BERTmodel', type=str, help='The path and file name of a pre-built BERT model for loading. If not given, BERT is not loaded and all period and interval phrases are normalized as durations.', required=False, default=None)
+    parser.add_argument('-B', metavar='BERTClassificationModel', type=str, help='The path and file name of a pre-trained SVM or CNN classification model from ChronoBERT.', required=False, default=None)
+    parser.add_argument('--includeRelative', action="store_true", default=False)
+    parser.add_argument('--includeContext', action="store_true", default=False)
+    parser.add_argument('--includeAttention', action="store_true", default=False)
+    parser.add_argument('--cnn', action="store_true", default=False)
+    parser.add_argument('--bert-idle-timeout', metavar='seconds', type=float, help='Unload the BERT models after they have not been used for this many seconds. They are re-loaded when next needed. Default is to keep them loaded.', required=False, default=None)
+    parser.add_argument('--pos-tagging', type=str, choices=["full", "gated"], help='How tokens are part of speech tagged. "full" (default) tags the whole document. "gated" only tags the sentences that have a temporal or numeric candidate, and only when their tags are needed, which is faster for documents with little temporal content but can change which tokens are marked as numbers.', required=False, default="full")
+    parser.add_argument('--token-memo-size', metavar='N', type=int, help='Remember whether up to this many distinct tokens are numeric or temporal, across all documents parsed, so each is only tested once. Default is 100000; 0 disables the memo.', required=False, default=100000)
+    parser.add_argument('--token-memo-vocab', metavar='vocabFile', type=str, help='Warm the token memo from this vocabulary file if it exists, and save the tokens seen to it when the run finishes.', required=False, default=None)
+    parser.add_argument('--dictionary-snapshot', metavar='snapshotFile', type=str, help='Load the dictionary files from this snapshot if it is up to date with them, otherwise read the dictionary files and save a new snapshot to it.  Speeds up the start of short-lived worker processes.', required=False, default=None)
+    parser.add_argument('--bert-padding', type=str, choices=["max", "dynamic"], help='How sentences are padded for BERT. "max" (default) pads every sentence to 256 tokens, as the ChronoBERT classifiers were run. "dynamic" pads only to the longest sentence in each length-bucketed batch and masks the padding out, which is much faster for short sentences.', required=False, default="max")
+    parser.add_argument('--bert-cache-mb', metavar='MB', type=float, help='Cache the BERT outputs of up to this many megabytes of sentences in memory so repeated sentences are only encoded once. Default is 0 (no cache).', required=False, default=0)
+    parser.add_argument('--bert-cache-dir', metavar='cacheDir', type=str, help='Persist the BERT sentence cache to this directory so later runs over the same corpus skip the encoder.', required=False, default=None)
+    parser.add_argument('--bert-quantize', action="store_true", help='Dynamically quantize the linear layers of the BERT model to int8 when it is loaded. This is faster on CPUs but can change some DATE/DURATION predictions; use --bert-quantize-check to measure how many.', default=False)
+    parser.add_argument('--bert-quantize-cache', metavar='quantizedModelFile', type=str, help='Save the quantized BERT model to this file and load it from there on later runs. It is rebuilt if the BERT model changes.', required=False, default=None)
+    parser.add_argument('--bert-onnx', metavar='onnxFile', type=str, help='Run the BERT model exported to this ONNX graph by ChronoBertExport.py on ONNX Runtime instead of torch. The tokenizer is still loaded from -b.', required=False, default=None)
+    parser.add_argument('--onnx-threads', metavar='N', type=int, help='The number of threads ONNX Runtime uses within each operator. Default is 0 (let ONNX Runtime decide).', required=False, default=0)
+    parser.add_argument('--onnx-inter-threads', metavar='N', type=int, help='The number of threads ONNX Runtime uses to run independent operators in parallel. Default is 0 (let ONNX Runtime decide).', required=False, default=0)
+    parser.add_argument('--onnx-optimization', type=str, choices=["disable", "basic", "extended", "all"], help='The ONNX Runtime graph optimization level. Default is all.', required=False, default="all")
+    parser.add_argument('--host', type=str, help='The host to listen on. Default is localhost.', required=False, default="127.0.0.1")
+    parser.add_argument('--port', type=int, help='The port to listen on. Default is 8050.', required=False, default=8050)
+    parser.add_argument('--socket', type=str, help='Listen on this Unix socket path instead of a TCP port.', required=False, default=None)
+
+    args = parser.parse_args()
+    if args.bert_onnx is not None and args.bert_quantize:
+        parser.error("--bert-onnx and --bert-quantize can not be combined.")
+
+    ## Load all the models once.
+    chrono_pipeline = pipeline.ChronoPipeline.fromArgs(args)
+
+    if args.socket is not None:
+        server = UnixHTTPServer(args.socket, ChronoRequestHandler)
+        print("Chrono service listening on " + args.socket)
+    else:
+        server = HTTPServer((args.host, args.port), ChronoRequestHandler)
+        print("Chrono service listening on http://" + args.host + ":" + str(args.port))
+
+    ## Requests are handled one at a time so the models are never used concurrently.
+    server.chrono_pipeline = chrono_pipeline
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.token_memo_vocab is not None and chrono_pipeline.token_memo is not None:
+            chrono_pipeline.token_memo.saveVocabulary(args.token_memo_vocab)
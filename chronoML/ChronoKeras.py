@@ -94,3 +94,11 @@ def keras_classify(model,predict_data):
     prediction = model.predict(X,verbose=1)
     #print("The prediction is: {}".format(np.round(prediction[0])))
     return np.round(prediction[0])
+
+## Classify a batch of samples with one call to the model
+# @param model The model to be used
+# @param predict_data A list with one feature list per sample
+# @return A 0 or 1 for each sample for which class was predicted
+def keras_classify_batch(model, predict_data):
+    prediction = model.predict(np.array([list(row) for row in predict_data]), verbose=0)
+    return [np.round(p) for p in prediction]
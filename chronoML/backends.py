@@ -0,0 +1,270 @@
+# Copyright (c) 2022
+# Amy L. Olex, Virginia Commonwealth University
+# alolex at vcu.edu
+#
+# Luke Maffey, Virginia Commonwealth University
+# maffeyl at vcu.edu
+#
+# Nicholas Morton,  Virginia Commonwealth University
+# nmorton at vcu.edu
+#
+# Bridget T. McInnes, Virginia Commonwealth University
+# btmcinnes at vcu.edu
+#
+# This file is part of Chrono
+#
+# Chrono is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# Chrono is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chrono; if not, write to
+#
+# The Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330,
+# Boston, MA  02111-1307, USA.
+
+
+
+## Registry of the machine learning backends used by Chrono.  Each backend is only imported the first time it is
+## selected, so runs that do not use Keras, TensorFlow, sklearn, or BERT do not pay for importing them.
+
+import gc
+import importlib
+import inspect
+import os
+import threading
+import time
+
+## Maps each Period/Interval ML method to the module that trains and applies it.
+CLASSIFIER_BACKENDS = {"NB": "chronoML.NB_nltk_classifier",
+                       "DT": "chronoML.DecisionTree",
+                       "RF": "chronoML.RF_classifier",
+                       "SVM": "chronoML.SVM_classifier",
+                       "NN": "chronoML.ChronoKeras"}
+
+
+## Registers a new Period/Interval ML backend, or replaces an existing one.
+# @param method The name of the ML method as given to the -m option.
+# @param module_name The full name of the module implementing build_model() for the method.
+def registerBackend(method, module_name):
+    CLASSIFIER_BACKENDS[method] = module_name
+
+####
+#END_MODULE
+####
+
+
+## Imports and returns the module implementing an ML method.
+# @param method The name of the ML method. One of NN, DT, RF, SVM, or NB.
+# @return The backend module.
+def getBackend(method):
+    if method not in CLASSIFIER_BACKENDS:
+        raise ValueError("Unknown ML method " + str(method) + ". Must be one of " + ", ".join(CLASSIFIER_BACKENDS) + ".")
+    return importlib.import_module(CLASSIFIER_BACKENDS[method])
+
+####
+#END_MODULE
+####
+
+
+## Loads a saved Keras model, importing TensorFlow only when it is needed.
+# @param model_file The path of the saved Keras model.
+# @return The Keras model.
+def loadKerasModel(model_file):
+    from tensorflow.keras.models import load_model
+    return load_model(model_file)
+
+####
+#END_MODULE
+####
+
+
+## Loads the ChronoBERT CNN classifier.  A .npz bundle exported by ChronoCnnExport.py is run with NumPy so TensorFlow is
+## never imported, otherwise the saved Keras model is loaded.
+# @param model_file The path of the exported .npz bundle or the saved Keras model.
+# @return An object with the predict() method of the Keras model.
+def loadCnnModel(model_file):
+    if model_file.endswith(".npz"):
+        from Chrono.ChronoBert import cnn_head
+        return cnn_head.NumpyCnn(model_file)
+    return loadKerasModel(model_file)
+
+####
+#END_MODULE
+####
+
+
+## Loads a model saved with joblib, such as the sklearn ChronoBERT SVM.
+# @param model_file The path of the saved model.
+# @return The model.
+def loadJoblibModel(model_file):
+    from joblib import load
+    return load(model_file)
+
+####
+#END_MODULE
+####
+
+
+## Loads the BERT model, importing transformers only when BERT is used.
+# @param bert_path The path to the pre-built BERT model.
+# @param quantize Boolean indicating if the linear layers should be dynamically quantized to int8 for faster CPU
+#                 inference.
+# @param quantized_cache A file to save the quantized model to, and to load it from on later runs, or None.
+# @return The BERT model.
+def loadBertModel(bert_path, quantize=False, quantized_cache=None):
+    import torch
+
+    if quantize and quantized_cache is not None and os.path.exists(quantized_cache):
+        ## the cache holds a whole pickled module, which newer torch versions only load with weights_only=False, an
+        ## argument older versions (such as 1.10) do not have
+        load_options = {"weights_only": False} if "weights_only" in inspect.signature(torch.load).parameters else {}
+        saved = torch.load(quantized_cache, **load_options)
+        if saved.get("source") == bertModelIdentity(bert_path):
+            return saved["model"]
+
+    from transformers import BertModel
+    bert_model = BertModel.from_pretrained(bert_path, output_hidden_states=True, use_cache=True, output_attentions=True)
+    if not quantize:
+        return bert_model
+
+    bert_model = quantizeBertModel(bert_model)
+    if quantized_cache is not None:
+        tmp_file = quantized_cache + ".tmp"
+        torch.save({"source": bertModelIdentity(bert_path), "model": bert_model}, tmp_file)
+        os.replace(tmp_file, quantized_cache)
+    return bert_model
+
+####
+#END_MODULE
+####
+
+
+## Applies dynamic int8 quantization to the linear layers of a BERT model.  The weights are stored as int8 and the
+## activations are quantized on the fly, which speeds up the encoder on CPUs without changing its interface.
+# @param bert_model The fp32 BERT model.
+# @return The quantized BERT model.
+def quantizeBertModel(bert_model):
+    import torch
+    bert_model.eval()
+    ## torch.quantization moved to torch.ao.quantization, which older torch versions do not have
+    quantization = torch.ao.quantization if hasattr(torch, "ao") and hasattr(torch.ao, "quantization") else torch.quantization
+    return quantization.quantize_dynamic(bert_model, {torch.nn.Linear}, dtype=torch.qint8)
+
+####
+#END_MODULE
+####
+
+
+## Identifies the files of a pre-built BERT model so a saved quantized copy is not reused after the model changes.
+# @param bert_path The path to the pre-built BERT model.
+# @return A list of [file name, size, modification time] entries.
+def bertModelIdentity(bert_path):
+    bert_path = os.path.abspath(bert_path)
+    if not os.path.isdir(bert_path):
+        return [bert_path]
+    identity = [bert_path]
+    for name in sorted(os.listdir(bert_path)):
+        stat = os.stat(os.path.join(bert_path, name))
+        identity.append([name, stat.st_size, stat.st_mtime])
+    return identity
+
+####
+#END_MODULE
+####
+
+
+## Loads the BERT tokenizer, importing transformers only when BERT is used.  The fast tokenizer is used so the word
+## piece offsets are available when aligning the BERT tokens to the whitespace tokens.
+# @param bert_path The path to the pre-built BERT model.
+# @return The BERT tokenizer.
+def loadBertTokenizer(bert_path):
+    from transformers import BertTokenizerFast
+    return BertTokenizerFast.from_pretrained(bert_path)
+
+####
+#END_MODULE
+####
+
+
+## A handle to a model that is only loaded the first time it is used.  Attribute access and calls are passed through
+## to the loaded model, so the handle can be used anywhere the model itself is expected.  The handle's own methods
+## have names that do not clash with the methods of the models it wraps.  If an idle timeout is given
+## the model is released after it has not been used for that many seconds, and re-loaded on the next use.
+# @param loader A function with no arguments that loads and returns the model.
+# @param idle_timeout The number of idle seconds after which the model is unloaded, or None to keep it loaded.
+class LazyModel:
+
+    ## The constructor
+    def __init__(self, loader, idle_timeout=None):
+        self._loader = loader
+        self._idle_timeout = idle_timeout
+        self._model = None
+        self._last_used = 0
+        self._timer = None
+        self._lock = threading.Lock()
+
+    ## Gets the model, loading it if needed.
+    # @return The loaded model.
+    def getModel(self):
+        with self._lock:
+            if self._model is None:
+                self._model = self._loader()
+                if self._idle_timeout:
+                    self._startTimer(self._idle_timeout)
+            self._last_used = time.monotonic()
+            return self._model
+
+    ## Checks if the model is currently loaded.
+    def isLoaded(self):
+        return self._model is not None
+
+    ## Releases the model.  It will be re-loaded the next time it is used.
+    def unloadModel(self):
+        with self._lock:
+            self._release()
+
+    def _release(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._model is not None:
+            self._model = None
+            gc.collect()
+
+    def _startTimer(self, delay):
+        self._timer = threading.Timer(delay, self._checkIdle)
+        self._timer.daemon = True
+        self._timer.start()
+
+    ## Called by the idle timer.  Unloads the model if it has not been used since the timer was started, otherwise
+    ## waits for the rest of the idle timeout.
+    def _checkIdle(self):
+        with self._lock:
+            if self._model is None:
+                return
+            idle = time.monotonic() - self._last_used
+            if idle >= self._idle_timeout:
+                self._release()
+            else:
+                self._startTimer(self._idle_timeout - idle)
+
+    def __getattr__(self, name):
+        ## private attributes are never forwarded so a partially constructed handle does not recurse
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.getModel(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self.getModel()(*args, **kwargs)
+
+####
+#END_MODULE
+####
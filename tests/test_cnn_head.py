@@ -0,0 +1,125 @@
+# Copyright (c) 2022
+# Amy L. Olex, Virginia Commonwealth University
+# alolex at vcu.edu
+#
+# Luke Maffey, Virginia Commonwealth University
+# maffeyl at vcu.edu
+#
+# Nicholas Morton,  Virginia Commonwealth University
+# nmorton at vcu.edu
+#
+# Bridget T. McInnes, Virginia Commonwealth University
+# btmcinnes at vcu.edu
+#
+# This file is part of Chrono
+#
+# Chrono is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# Chrono is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chrono; if not, write to
+#
+# The Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330,
+# Boston, MA  02111-1307, USA.
+
+
+
+
+## Tests that NumpyCnn gives the same predictions as the ChronoBERT CNN it was exported from.
+
+import importlib.util
+import json
+import os
+import tempfile
+import unittest
+import numpy as np
+from Chrono.ChronoBert import cnn_head
+
+## The shape of the phrase matrices the test CNN classifies, as (rows, features).
+INPUT_DIM = (9, 16)
+
+
+## Writes a .npz bundle in the exportCnnWeights() format for the layer stack of bert_utils.create_cnn_model(), with
+## random weights.
+# @param npz_path The path to write the bundle to.
+# @return A dictionary from each layer index to its (kernel, bias) arrays.
+def writeRandomCnn(npz_path):
+    layers = [{"type": "Conv1D", "strides": 1, "activation": "relu"},
+              {"type": "MaxPooling1D", "pool_size": 2, "strides": 2},
+              {"type": "Conv1D", "strides": 1, "activation": "relu"},
+              {"type": "Dropout"},
+              {"type": "Flatten"},
+              {"type": "Dense", "activation": "relu"},
+              {"type": "Dense", "activation": "sigmoid"}]
+    random = np.random.RandomState(0)
+    weights = {0: (random.randn(3, INPUT_DIM[1], 8), random.randn(8)),
+               2: (random.randn(2, 8, 8), random.randn(8)),
+               5: (random.randn(2 * 8, 10), random.randn(10)),
+               6: (random.randn(10, 1), random.randn(1))}
+    weights = {i: (kernel.astype(np.float32) * 0.3, bias.astype(np.float32) * 0.1) for i, (kernel, bias) in weights.items()}
+    arrays = {}
+    for i, (kernel, bias) in weights.items():
+        arrays["kernel_" + str(i)] = kernel
+        arrays["bias_" + str(i)] = bias
+    np.savez(npz_path, layers=np.array(json.dumps(layers)), **arrays)
+    return weights
+
+####
+#END_MODULE
+####
+
+
+class TestNumpyCnn(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.npz_path = os.path.join(self.tmpdir.name, "cnn.npz")
+        self.x = np.random.RandomState(1).randn(32, *INPUT_DIM).astype(np.float32)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    @unittest.skipIf(importlib.util.find_spec("tensorflow") is None, "TensorFlow is not installed")
+    def test_matches_keras(self):
+        from Chrono.ChronoBert import bert_utils
+        keras_model = bert_utils.create_cnn_model(8, 3, 2, 2, 2, 0.5, INPUT_DIM)
+        cnn_head.exportCnnWeights(keras_model, self.npz_path)
+        numpy_cnn = cnn_head.NumpyCnn(self.npz_path)
+        np.testing.assert_allclose(numpy_cnn.predict(self.x), keras_model.predict(self.x), atol=1e-5)
+        self.assertEqual(numpy_cnn.predict(self.x).shape, (len(self.x), 1))
+
+    @unittest.skipIf(importlib.util.find_spec("torch") is None, "PyTorch is not installed")
+    def test_matches_torch(self):
+        import torch
+        weights = writeRandomCnn(self.npz_path)
+
+        ## the same forward pass in torch, which is channels first and stores its kernels transposed
+        def conv(x, i):
+            kernel, bias = weights[i]
+            return torch.relu(torch.nn.functional.conv1d(x, torch.from_numpy(kernel).permute(2, 1, 0), torch.from_numpy(bias)))
+
+        def dense(x, i):
+            kernel, bias = weights[i]
+            return torch.nn.functional.linear(x, torch.from_numpy(kernel).t(), torch.from_numpy(bias))
+
+        with torch.no_grad():
+            x = torch.from_numpy(self.x).transpose(1, 2)
+            x = conv(torch.nn.functional.max_pool1d(conv(x, 0), 2, 2), 2)
+            x = x.transpose(1, 2).reshape(len(x), -1)
+            expected = torch.sigmoid(dense(torch.relu(dense(x, 5)), 6)).numpy()
+
+        predicted = cnn_head.NumpyCnn(self.npz_path).predict(self.x)
+        self.assertEqual(predicted.shape, (len(self.x), 1))
+        np.testing.assert_allclose(predicted, expected, atol=1e-5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+# Copyright (c) 2022
+# Amy L. Olex, Virginia Commonwealth University
+# alolex at vcu.edu
+#
+# Luke Maffey, Virginia Commonwealth University
+# maffeyl at vcu.edu
+#
+# Nicholas Morton,  Virginia Commonwealth University
+# nmorton at vcu.edu
+#
+# Bridget T. McInnes, Virginia Commonwealth University
+# btmcinnes at vcu.edu
+#
+# This file is part of Chrono
+#
+# Chrono is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# Chrono is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chrono; if not, write to
+#
+# The Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330,
+# Boston, MA  02111-1307, USA.
+
+
+
+
+## Tests for loading the dictionary files from, and invalidating, a registry snapshot.
+
+import os
+import pickle
+import tempfile
+import unittest
+from Chrono import dictionary_registry
+
+
+class TestDictionaryRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dictdir = os.path.join(self.tmpdir.name, "dictionary")
+        os.mkdir(self.dictdir)
+        self.writeDictionary("Frequency", ["daily", "b.i.d", "every other"])
+        self.writeDictionary("LinkTerms", ["from", "until"])
+        self.snapshot = os.path.join(self.tmpdir.name, "dictionary.snap")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def writeDictionary(self, name, lines):
+        with open(os.path.join(self.dictdir, name + ".txt"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def test_snapshot_round_trip(self):
+        registry = dictionary_registry.DictionaryRegistry.fromFiles(self.dictdir)
+        registry.saveSnapshot(self.snapshot)
+        loaded = dictionary_registry.DictionaryRegistry.fromSnapshot(self.snapshot, self.dictdir)
+        self.assertIsNotNone(loaded)
+        self.assertEqual(loaded.getList("Frequency"), ("daily", "b.i.d", "every other"))
+        self.assertEqual(loaded.getSet("LinkTerms"), frozenset(["from", "until"]))
+        self.assertEqual(loaded.getWords("Frequency"), frozenset(["daily", "b.i.d", "every", "other"]))
+        ## periods are matched literally
+        self.assertIsNone(loaded.getAlternation("Frequency").search("bxixd"))
+        self.assertEqual(loaded.getAlternation("Frequency").search("take b.i.d").group(1), "b.i.d")
+
+    def test_snapshot_invalidated_by_changes(self):
+        dictionary_registry.DictionaryRegistry.fromFiles(self.dictdir).saveSnapshot(self.snapshot)
+
+        ## a changed file
+        self.writeDictionary("LinkTerms", ["from", "until", "through"])
+        self.assertIsNone(dictionary_registry.DictionaryRegistry.fromSnapshot(self.snapshot, self.dictdir))
+        dictionary_registry.DictionaryRegistry.fromFiles(self.dictdir).saveSnapshot(self.snapshot)
+        self.assertIsNotNone(dictionary_registry.DictionaryRegistry.fromSnapshot(self.snapshot, self.dictdir))
+
+        ## a touched file of the same size
+        stat = os.stat(os.path.join(self.dictdir, "Frequency.txt"))
+        os.utime(os.path.join(self.dictdir, "Frequency.txt"), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000))
+        self.assertIsNone(dictionary_registry.DictionaryRegistry.fromSnapshot(self.snapshot, self.dictdir))
+        dictionary_registry.DictionaryRegistry.fromFiles(self.dictdir).saveSnapshot(self.snapshot)
+
+        ## a new file
+        self.writeDictionary("Season", ["summer"])
+        self.assertIsNone(dictionary_registry.DictionaryRegistry.fromSnapshot(self.snapshot, self.dictdir))
+
+    def test_bad_snapshots_ignored(self):
+        self.assertIsNone(dictionary_registry.DictionaryRegistry.fromSnapshot(self.snapshot, self.dictdir))
+        with open(self.snapshot, "wb") as f:
+            f.write(b"not a snapshot")
+        self.assertIsNone(dictionary_registry.DictionaryRegistry.fromSnapshot(self.snapshot, self.dictdir))
+
+        dictionary_registry.DictionaryRegistry.fromFiles(self.dictdir).saveSnapshot(self.snapshot)
+        with open(self.snapshot, "rb") as f:
+            snapshot = pickle.load(f)
+        snapshot["version"] = dictionary_registry.SNAPSHOT_VERSION + 1
+        with open(self.snapshot, "wb") as f:
+            pickle.dump(snapshot, f)
+        self.assertIsNone(dictionary_registry.DictionaryRegistry.fromSnapshot(self.snapshot, self.dictdir))
+
+    def test_get_registry_rebuilds_stale_snapshot(self):
+        ## a snapshot of other dictionary files is out of date for the real ones
+        dictionary_registry.DictionaryRegistry.fromFiles(self.dictdir).saveSnapshot(self.snapshot)
+        shared = dictionary_registry._registry
+        dictionary_registry._registry = None
+        try:
+            registry = dictionary_registry.getRegistry(self.snapshot)
+            self.assertIn("AbrClinical", registry.lines)
+            self.assertIsNotNone(dictionary_registry.DictionaryRegistry.fromSnapshot(self.snapshot))
+        finally:
+            dictionary_registry._registry = shared
+
+
+if __name__ == "__main__":
+    unittest.main()
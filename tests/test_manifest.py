@@ -0,0 +1,105 @@
+# Copyright (c) 2022
+# Amy L. Olex, Virginia Commonwealth University
+# alolex at vcu.edu
+#
+# Luke Maffey, Virginia Commonwealth University
+# maffeyl at vcu.edu
+#
+# Nicholas Morton,  Virginia Commonwealth University
+# nmorton at vcu.edu
+#
+# Bridget T. McInnes, Virginia Commonwealth University
+# btmcinnes at vcu.edu
+#
+# This file is part of Chrono
+#
+# Chrono is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# Chrono is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chrono; if not, write to
+#
+# The Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330,
+# Boston, MA  02111-1307, USA.
+
+
+
+
+## Tests for the completion manifest used to restart interrupted batch runs.
+
+import json
+import os
+import tempfile
+import unittest
+from Chrono import manifest
+
+
+class TestCompletionManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "run.manifest.jsonl")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_skips_completed_documents(self):
+        completion = manifest.CompletionManifest(self.path, "model-a")
+        completion.markComplete("doc1", "out/doc1", "hash1")
+        completion.close()
+
+        completion = manifest.CompletionManifest(self.path, "model-a")
+        self.assertTrue(completion.isComplete("doc1", "hash1"))
+        self.assertFalse(completion.isComplete("doc1", "hash2"))
+        self.assertFalse(completion.isComplete("doc2", "hash1"))
+        completion.close()
+
+        ## a run with different models parses everything again
+        completion = manifest.CompletionManifest(self.path, "model-b")
+        self.assertFalse(completion.isComplete("doc1", "hash1"))
+        completion.close()
+
+    def test_recovers_from_partial_line(self):
+        completion = manifest.CompletionManifest(self.path, "model-a")
+        completion.markComplete("doc1", "out/doc1", "hash1")
+        completion.close()
+        ## the previous run was killed while writing the record for doc2
+        with open(self.path, "a") as f:
+            f.write('{"infile": "doc2", "outfile": "out/doc2", "inp')
+
+        completion = manifest.CompletionManifest(self.path, "model-a")
+        self.assertTrue(completion.isComplete("doc1", "hash1"))
+        self.assertFalse(completion.isComplete("doc2", "hash2"))
+        completion.markComplete("doc2", "out/doc2", "hash2")
+        completion.close()
+
+        ## the new record starts on its own line, so it is read back after the partial one
+        with open(self.path, "r") as f:
+            lines = f.read().split("\n")
+        self.assertEqual(json.loads(lines[2])["infile"], "doc2")
+        completion = manifest.CompletionManifest(self.path, "model-a")
+        self.assertTrue(completion.isComplete("doc1", "hash1"))
+        self.assertTrue(completion.isComplete("doc2", "hash2"))
+        completion.close()
+
+    def test_hash_changes_with_input(self):
+        doc = os.path.join(self.tmpdir.name, "doc1")
+        dct = os.path.join(self.tmpdir.name, "doc1.dct")
+        with open(doc, "w") as f:
+            f.write("Seen on 03/04/2018.")
+        input_hash = manifest.hashFiles([doc, dct])
+        with open(dct, "w") as f:
+            f.write("2018-03-04\n")
+        self.assertNotEqual(manifest.hashFiles([doc, dct]), input_hash)
+
+
+if __name__ == "__main__":
+    unittest.main()
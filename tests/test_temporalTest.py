@@ -0,0 +1,123 @@
+# Copyright (c) 2022
+# Amy L. Olex, Virginia Commonwealth University
+# alolex at vcu.edu
+#
+# Luke Maffey, Virginia Commonwealth University
+# maffeyl at vcu.edu
+#
+# Nicholas Morton,  Virginia Commonwealth University
+# nmorton at vcu.edu
+#
+# Bridget T. McInnes, Virginia Commonwealth University
+# btmcinnes at vcu.edu
+#
+# This file is part of Chrono
+#
+# Chrono is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# Chrono is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chrono; if not, write to
+#
+# The Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330,
+# Boston, MA  02111-1307, USA.
+
+
+
+
+## Checks that the lexicon tests in temporalTest, which scan each token once with an Aho-Corasick automaton, give the
+## same answers as the original list scans kept in reference_temporalTest.
+
+import contextlib
+import io
+import unittest
+from Chrono import dictionary_registry
+from Chrono import temporalTest as tt
+from tests import reference_temporalTest as reference
+
+## The has*() tests that were re-written on top of testLexicon(), in the order utils.temporalTest() applies them.
+LEXICON_TESTS = ["hasTextMonth", "hasDayOfWeek", "hasPeriodInterval", "hasAMPM", "hasPartOfWeek", "hasSeasonOfYear",
+                 "hasPartOfDay", "hasTimeZone", "hasTempText", "hasModifierText", "hasClinAbr"]
+
+## Tokens that are easy to get wrong: empty and blank strings, punctuation only, mixed case, and lexicon words found
+## inside longer words or next to punctuation and digits.
+EDGE_CASES = ["", " ", "  ", ".", ",", "...", "!?", "-", "/", "#", "'s", "a", "A",
+              "AM.", "a.m.", "A.M", "p.m..", "3pm", "11:30AM", "(am)", "pmt", "Amazing",
+              "MaRcH", "mAY", "Mayor", "Sunday's", "Decemberist", "mid-July", "Jan.3", "jan,", "Sept.,", "augment",
+              "monthly", "weeknight", "Weekend!", "summertime", "Springfield", "nightly", "eve.", "evening,",
+              "EST5EDT", "(UTC)", "gmt", "ESTimate", "utc+1", "thistle", "Now", "POSTOP", "post-op.", "pre-op",
+              "fiscal-year", "<5", "or so", "orso", "bid", "B.I.D.", "q.d.", "qhs", "POD#3", "POD 12", "POD", "pod3",
+              "12/03/2018", "2018", "0800", "in 3 days", "last week", "the next month ago"]
+
+
+## Gets every token the tests are checked against: each lexicon word, its case and punctuation variants, the word
+## inside longer words and phrases, and the edge cases above.
+# @return A sorted list of tokens.
+def lexiconTokens():
+    words = set(EDGE_CASES)
+    for lexicon, form, rule in tt.lexicons.values():
+        if isinstance(lexicon, str):
+            lexicon = dictionary_registry.getRegistry().getList(lexicon)
+        for word in lexicon:
+            for variant in (word, word.lower(), word.upper(), word.title(), word.swapcase()):
+                words.update([variant, variant + ".", variant + ",", "(" + variant + ")", variant + "s",
+                              "x" + variant, variant + "ly", "3" + variant, variant + "-" + variant,
+                              "in " + variant, variant + " ago", "the " + variant + " before"])
+    return sorted(words)
+
+####
+#END_MODULE
+####
+
+
+class TestLexiconTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tokens = lexiconTokens()
+
+    def assertMatchesReference(self, name, new_test, old_test):
+        mismatches = []
+        ## the reference hasClinAbr() prints every POD it finds
+        with contextlib.redirect_stdout(io.StringIO()):
+            for tok in self.tokens:
+                if new_test(tok) != old_test(tok):
+                    mismatches.append(tok)
+        self.assertEqual(mismatches, [], name + " differs from the reference for these tokens")
+
+    def test_has_functions_match_reference(self):
+        for name in LEXICON_TESTS:
+            with self.subTest(name):
+                self.assertMatchesReference(name, getattr(tt, name), getattr(reference, name))
+
+    def test_temporal_lexicon_matches_reference(self):
+        for include_relative in (True, False):
+            names = [name for name in LEXICON_TESTS if include_relative or name != "hasTempText"]
+            old_test = lambda tok: any(getattr(reference, name)(tok) for name in names)
+            new_test = lambda tok: tt.hasTemporalLexicon(tok, include_relative)
+            with self.subTest(include_relative=include_relative):
+                self.assertMatchesReference("hasTemporalLexicon", new_test, old_test)
+
+    def test_scans_are_shared(self):
+        ## the tests give the same answers when the forms are scanned once for all of them
+        for tok in ["Monday", "3 weeks ago", "a.m.", "EST", "", "BID"]:
+            scans = tt.scanForms(tok)
+            for category in tt.lexicons:
+                self.assertEqual(tt.testLexicon(category, tok, scans), tt.testLexicon(category, tok), (category, tok))
+
+    def test_digit_tests_unchanged(self):
+        for tok in ["0800", "2359", "2400", "1260", "19980304", "980304", "03041998", "12345", "2018", ""]:
+            self.assertEqual(tt.has24HourTime(tok), reference.has24HourTime(tok), tok)
+            self.assertEqual(tt.hasDateOrTime(tok), reference.hasDateOrTime(tok), tok)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+# Copyright (c) 2022
+# Amy L. Olex, Virginia Commonwealth University
+# alolex at vcu.edu
+#
+# Luke Maffey, Virginia Commonwealth University
+# maffeyl at vcu.edu
+#
+# Nicholas Morton,  Virginia Commonwealth University
+# nmorton at vcu.edu
+#
+# Bridget T. McInnes, Virginia Commonwealth University
+# btmcinnes at vcu.edu
+#
+# This file is part of Chrono
+#
+# Chrono is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# Chrono is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chrono; if not, write to
+#
+# The Free Software Foundation, Inc.,
+# 59 Temple Place - Suite 330,
+# Boston, MA  02111-1307, USA.
+
+
+
+
+## Tests for merging the token memo updates of worker processes into one vocabulary.
+
+import os
+import tempfile
+import unittest
+from Chrono import token_memo
+
+
+class TestTokenMemoMerger(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.vocab_path = os.path.join(self.tmpdir.name, "vocab.txt")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_merges_worker_updates(self):
+        workers = [token_memo.TokenMemo(), token_memo.TokenMemo()]
+        for memo in workers:
+            memo.reportUpdates()
+        for tok in ["He", "was", "seen", "3", "days", "ago", "He"]:
+            workers[0].classify(tok, "CD" if tok.isdigit() else "NN", False)
+        for tok in ["Seen", "on", "Monday", "on"]:
+            workers[1].classify(tok, "NN", False)
+
+        merger = token_memo.TokenMemoMerger()
+        for memo in workers:
+            merger.merge(memo.takeUpdate())
+        stats = merger.getStats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 9))
+        self.assertEqual(list(merger.tokens), ["He", "was", "seen", "3", "days", "ago", "Seen", "on", "Monday"])
+
+        ## an update only holds what changed since the last one
+        workers[0].classify("ago", "RB", False)
+        workers[0].classify("later", "RB", False)
+        self.assertEqual(workers[0].takeUpdate(), {"tokens": ["later"], "hits": 1, "misses": 1})
+
+    def test_keeps_most_recent_tokens(self):
+        token_memo.writeVocabulary(self.vocab_path, ["old1", "old2", "kept"])
+        merger = token_memo.TokenMemoMerger(max_entries=4, vocab_path=self.vocab_path)
+        merger.merge({"tokens": ["new1", "kept", "new2"], "hits": 0, "misses": 3})
+        self.assertEqual(merger.saveVocabulary(self.vocab_path), 4)
+        self.assertEqual(list(token_memo.readVocabulary(self.vocab_path)), ["old2", "new1", "kept", "new2"])
+
+    def test_saved_vocabulary_warms_memo(self):
+        merger = token_memo.TokenMemoMerger(vocab_path=self.vocab_path)
+        merger.merge({"tokens": ["Monday", "3", "patient"], "hits": 0, "misses": 3})
+        merger.saveVocabulary(self.vocab_path)
+
+        memo = token_memo.TokenMemo()
+        self.assertEqual(memo.warm(self.vocab_path, False), 3)
+        self.assertEqual(memo.classify("Monday", "NNP", False), (False, True))
+        self.assertEqual(memo.classify("3", "CD", False)[0], True)
+        self.assertEqual(memo.getStats()["misses"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()